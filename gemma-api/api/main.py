@@ -1,29 +1,104 @@
+import json
 import os
 import time
 
 import ollama
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
 from loguru import logger
 
-from .models import ChatCompletionRequest, ChatCompletionResponse, Choice, Message
+from .models import (
+    ChatCompletionChunk,
+    ChatCompletionRequest,
+    ChatCompletionResponse,
+    Choice,
+    ChunkChoice,
+    Delta,
+    Message,
+    Usage,
+)
 
 app = FastAPI(title="Gemma 3 4B API (Ollama Python)")
 
 MODEL_NAME = os.getenv("MODEL_NAME", "gemma3:4b")
 OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://host.docker.internal:11434")
+# コンテキスト長（トークン数）。0 なら Ollama の既定
+OLLAMA_NUM_CTX = int(os.getenv("OLLAMA_NUM_CTX", "0"))
 
 client = ollama.AsyncClient(host=OLLAMA_HOST)
 
+def _options(request: ChatCompletionRequest) -> dict:
+    options = {"temperature": request.temperature}
+    if request.max_tokens:
+        options["num_predict"] = request.max_tokens
+    if OLLAMA_NUM_CTX:
+        options["num_ctx"] = OLLAMA_NUM_CTX
+    return options
+
+def _usage(response) -> Usage:
+    # Ollama は最後の応答にプロンプトと生成のトークン数を返す
+    prompt_tokens = response.get("prompt_eval_count") or 0
+    completion_tokens = response.get("eval_count") or 0
+    return Usage(
+        prompt_tokens=prompt_tokens,
+        completion_tokens=completion_tokens,
+        total_tokens=prompt_tokens + completion_tokens,
+    )
+
+def _sse(data: str) -> str:
+    return f"data: {data}\n\n"
+
+async def _stream_chunks(stream):
+    """
+    Ollama のストリームを OpenAI 互換の chat.completion.chunk として SSE で返す
+    """
+    created = int(time.time())
+
+    def chunk(
+        delta: Delta, finish_reason: str | None = None, usage: Usage | None = None
+    ) -> str:
+        return _sse(
+            ChatCompletionChunk(
+                model=MODEL_NAME,
+                created=created,
+                choices=[ChunkChoice(delta=delta, finish_reason=finish_reason)],
+                usage=usage,
+            ).model_dump_json(exclude_none=True)
+        )
+
+    yield chunk(Delta(role="assistant"))
+    try:
+        usage = None
+        async for part in stream:
+            content = part["message"]["content"]
+            if content:
+                yield chunk(Delta(content=content))
+            if part.get("done"):
+                usage = _usage(part)
+                break
+        yield chunk(Delta(), finish_reason="stop", usage=usage)
+    except Exception as e:
+        # ヘッダー送信後はステータスコードを変えられないので、エラーをイベントで伝える
+        logger.error(f"Ollama stream error: {e}")
+        yield _sse(json.dumps({"error": {"message": str(e)}}, ensure_ascii=False))
+    yield _sse("[DONE]")
+
 @app.post("/v1/chat/completions", response_model=ChatCompletionResponse)
 async def chat_completions(request: ChatCompletionRequest):
     try:
         response = await client.chat(
             model=MODEL_NAME,
             messages=[{"role": m.role, "content": m.content} for m in request.messages],
-            options={
-                "temperature": request.temperature,
-            }
+            options=_options(request),
+            stream=request.stream,
         )
+
+        if request.stream:
+            return StreamingResponse(
+                _stream_chunks(response),
+                media_type="text/event-stream",
+                headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+            )
         
         return ChatCompletionResponse(
             model=MODEL_NAME,
@@ -35,7 +110,8 @@ async def chat_completions(request: ChatCompletionRequest):
                         content=response['message']['content']
                     )
                 )
-            ]
+            ],
+            usage=_usage(response),
         )
     except Exception as e:
         logger.error(f"Ollama error: {e}")
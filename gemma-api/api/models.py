@@ -8,16 +8,42 @@ class ChatCompletionRequest(BaseModel):
     model: str = "gemma3-4b"
     messages: list[Message]
     temperature: float = Field(default=0.1, ge=0.0, le=2.0)
-    max_tokens: int = Field(default=1024, ge=1)
+    # 回答の最大トークン数（Ollama の num_predict。省略時はモデルの既定）
+    max_tokens: int | None = Field(default=None, ge=1)
+    stream: bool = False
 
 class Choice(BaseModel):
     message: Message
     finish_reason: str = "stop"
     index: int = 0
 
+class Usage(BaseModel):
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    total_tokens: int = 0
+
 class ChatCompletionResponse(BaseModel):
     id: str = "chatcmpl-default"
     object: str = "chat.completion"
     created: int = 0
     model: str
     choices: list[Choice]
+    usage: Usage | None = None
+
+class Delta(BaseModel):
+    role: str | None = None
+    content: str | None = None
+
+class ChunkChoice(BaseModel):
+    delta: Delta
+    finish_reason: str | None = None
+    index: int = 0
+
+class ChatCompletionChunk(BaseModel):
+    id: str = "chatcmpl-default"
+    object: str = "chat.completion.chunk"
+    created: int = 0
+    model: str
+    choices: list[ChunkChoice]
+    # 最後のチャンクにだけ付ける
+    usage: Usage | None = None
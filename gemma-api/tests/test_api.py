@@ -1,4 +1,5 @@
 import pytest
+import json
 import httpx
 from httpx import AsyncClient, ASGITransport
 from unittest.mock import AsyncMock, patch
@@ -31,7 +32,9 @@ async def test_chat_completions_success(client):
         "message": {
             "role": "assistant",
             "content": "Hello! I am Gemma."
-        }
+        },
+        "prompt_eval_count": 12,
+        "eval_count": 5,
     }
     with patch("api.main.client.chat", new_callable=AsyncMock) as mock_chat:
         mock_chat.return_value = mock_response
@@ -48,6 +51,13 @@ async def test_chat_completions_success(client):
         data = response.json()
         assert data["choices"][0]["message"]["content"] == "Hello! I am Gemma."
         assert data["choices"][0]["message"]["role"] == "assistant"
+        assert data["usage"] == {
+            "prompt_tokens": 12,
+            "completion_tokens": 5,
+            "total_tokens": 17,
+        }
+        # max_tokens を指定しなければ Ollama の既定のまま
+        assert "num_predict" not in mock_chat.call_args.kwargs["options"]
 
 @pytest.mark.asyncio
 async def test_chat_completions_error(client):
@@ -63,3 +73,58 @@ async def test_chat_completions_error(client):
         
         assert response.status_code == 500
         assert "Internal Ollama Error" in response.json()["detail"]
+
+@pytest.mark.asyncio
+async def test_chat_completions_stream(client):
+    async def parts():
+        yield {"message": {"role": "assistant", "content": "Hello"}, "done": False}
+        yield {"message": {"role": "assistant", "content": " Gemma"}, "done": False}
+        yield {
+            "message": {"role": "assistant", "content": ""},
+            "done": True,
+            "prompt_eval_count": 7,
+            "eval_count": 2,
+        }
+
+    with patch("api.main.client.chat", new_callable=AsyncMock) as mock_chat:
+        mock_chat.return_value = parts()
+
+        request_data = {
+            "messages": [{"role": "user", "content": "Hi"}],
+            "stream": True,
+            "max_tokens": 256,
+        }
+        response = await client.post("/v1/chat/completions", json=request_data)
+
+        assert response.status_code == 200
+        assert mock_chat.call_args.kwargs["options"]["num_predict"] == 256
+        assert response.headers["content-type"].startswith("text/event-stream")
+        assert mock_chat.call_args.kwargs["stream"] is True
+        events = [
+            line.removeprefix("data: ")
+            for line in response.text.split("\n\n")
+            if line.startswith("data: ")
+        ]
+        assert events[-1] == "[DONE]"
+        chunks = [json.loads(e) for e in events[:-1]]
+        assert chunks[0]["object"] == "chat.completion.chunk"
+        assert chunks[0]["choices"][0]["delta"] == {"role": "assistant"}
+        content = "".join(c["choices"][0]["delta"].get("content", "") for c in chunks)
+        assert content == "Hello Gemma"
+        assert chunks[-1]["choices"][0]["finish_reason"] == "stop"
+        assert chunks[-1]["usage"]["prompt_tokens"] == 7
+
+@pytest.mark.asyncio
+async def test_chat_completions_stream_error(client):
+    async def parts():
+        yield {"message": {"role": "assistant", "content": "Hel"}, "done": False}
+        raise Exception("Ollama went away")
+
+    with patch("api.main.client.chat", new_callable=AsyncMock) as mock_chat:
+        mock_chat.return_value = parts()
+
+        request_data = {"messages": [{"role": "user", "content": "Hi"}], "stream": True}
+        response = await client.post("/v1/chat/completions", json=request_data)
+
+        assert "Ollama went away" in response.text
+        assert response.text.endswith("data: [DONE]\n\n")
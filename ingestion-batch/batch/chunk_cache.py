@@ -0,0 +1,106 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from loguru import logger
+
+
+class ChunkCache:
+    """
+    チャンク本文 → スパースベクトルの永続キャッシュ（SQLite）
+
+    キーはチャンク本文とエンコーダーの設定（モデル・プルーニング等）を合わせたハッシュなので、
+    設定が変われば自然にすべてミスになる。件数が max_entries を超えたら最終利用が古い順に消す。
+    パイプラインの複数スレッドから使うので、1つの接続をロックで守る。
+    """
+
+    # 変更をまとめてコミットする件数
+    COMMIT_INTERVAL = 100
+
+    def __init__(self, path: str, max_entries: int, namespace: str):
+        self.path = path
+        self.max_entries = max_entries
+        self.namespace = namespace
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._pending = 0
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunks "
+            "(key TEXT PRIMARY KEY, vector TEXT NOT NULL, last_used REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS chunks_last_used ON chunks (last_used)")
+        self.size = self.conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def _key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.namespace}\0{text}".encode()).hexdigest()
+
+    def get(self, text: str) -> dict[str, float] | None:
+        key = self._key(text)
+        with self._lock:
+            row = self.conn.execute("SELECT vector FROM chunks WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self.conn.execute("UPDATE chunks SET last_used = ? WHERE key = ?", (time.time(), key))
+            self._changed()
+        return json.loads(row[0])
+
+    def set(self, text: str, vector: dict[str, float]):
+        payload = json.dumps(vector, ensure_ascii=False)
+        with self._lock:
+            cursor = self.conn.execute(
+                "INSERT OR REPLACE INTO chunks (key, vector, last_used) VALUES (?, ?, ?)",
+                (self._key(text), payload, time.time()),
+            )
+            self.size += cursor.rowcount
+            if self.size > self.max_entries:
+                self._evict()
+            self._changed()
+
+    def _evict(self):
+        """
+        最終利用が古いものから消して max_entries 件に収める
+        """
+        excess = self.size - self.max_entries
+        if excess <= 0:
+            return
+        self.conn.execute(
+            "DELETE FROM chunks WHERE key IN (SELECT key FROM chunks ORDER BY last_used LIMIT ?)",
+            (excess,),
+        )
+        self.evictions += excess
+        self.size = self.conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def _changed(self):
+        self._pending += 1
+        if self._pending >= self.COMMIT_INTERVAL:
+            self.conn.commit()
+            self._pending = 0
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": self.size,
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def close(self):
+        with self._lock:
+            self.conn.commit()
+            self.conn.close()
+        logger.info(f"Chunk cache: {self.stats()}")
@@ -0,0 +1,113 @@
+import math
+import re
+from collections.abc import Callable
+from typing import Any
+
+# Scrapbox の見出し記法（[* 小見出し] / [** 中見出し] ...）
+_HEADING = re.compile(r"\[\*+\s")
+_INDENT = " \t　"
+
+
+def indent_of(text: str) -> int:
+    return len(text) - len(text.lstrip(_INDENT))
+
+
+def page_lines(page: dict[str, Any]) -> list[str]:
+    """
+    ページ本文の行（Scrapbox API の1行目はタイトルなので除く）
+    """
+    lines = [line.get("text", "") for line in page.get("lines", [])]
+    if lines and lines[0] == page.get("title"):
+        lines = lines[1:]
+    return lines
+
+
+def split_blocks(lines: list[str]) -> list[tuple[int, int, bool]]:
+    """
+    行をブロック (開始行, 終了行, 見出しか) に分ける。
+
+    ブロックは1行と、それより深くインデントされた後続の行のまとまり。
+    箇条書きの子要素や code: / table: の中身は、親の行と同じブロックになる。
+    """
+    blocks = []
+    i, n = 0, len(lines)
+    while i < n:
+        if not lines[i].strip():
+            i += 1
+            continue
+        start = i
+        indent = indent_of(lines[i])
+        i += 1
+        while i < n and indent_of(lines[i]) > indent:
+            i += 1
+        blocks.append((start, i, bool(_HEADING.match(lines[start][indent:]))))
+    return blocks
+
+
+class StructuredChunker:
+    """
+    Scrapbox の行構造（インデント・コードブロック・見出し）を保ったままチャンクに分ける。
+
+    ブロックを壊さないようにトークン数の上限まで詰め、見出しでは新しいチャンクを始める。
+    上限を超えるブロックだけは行単位で分け、それでも超える行は文字数で分ける。
+    各チャンクの先頭にはページタイトルを付ける。行ごとのトークン数を1回で数え、
+    あとは各行を定数回見るだけなので、ページの長さに対して線形時間で動く。
+    """
+
+    def __init__(self, count_tokens: Callable[[list[str]], list[int]], max_tokens: int):
+        self.count_tokens = count_tokens
+        self.max_tokens = max_tokens
+
+    def chunk_page(self, page: dict[str, Any]) -> list[str]:
+        title = page.get("title", "")
+        lines = page_lines(page)
+        if not any(line.strip() for line in lines):
+            return [title] if title else []
+
+        title_tokens, *line_tokens = self.count_tokens([title, *lines])
+        # タイトルはどのチャンクにも付けるので、その分を除いた残りに本文を詰める
+        budget = max(self.max_tokens - title_tokens, 1)
+
+        chunks = []
+        current: list[str] = []
+        current_tokens = 0
+        only_headings = True
+
+        def flush():
+            nonlocal current, current_tokens, only_headings
+            if current:
+                chunks.append("\n".join([title, *current] if title else current))
+            current, current_tokens, only_headings = [], 0, True
+
+        for start, end, heading in split_blocks(lines):
+            block_tokens = sum(line_tokens[start:end])
+            # 見出しは直前が見出しだけでなければ新しいチャンクの先頭にする
+            if (heading and not only_headings) or current_tokens + block_tokens > budget:
+                flush()
+            only_headings = only_headings and heading
+
+            if block_tokens <= budget:
+                current.extend(lines[start:end])
+                current_tokens += block_tokens
+                continue
+
+            # 上限を超えるブロックは行単位で詰める
+            for line, tokens in self._split_block(lines[start:end], line_tokens[start:end], budget):
+                if current_tokens + tokens > budget:
+                    flush()
+                current.append(line)
+                current_tokens += tokens
+                only_headings = False
+        flush()
+        return chunks
+
+    def _split_block(self, lines: list[str], tokens: list[int], budget: int):
+        for line, line_tokens in zip(lines, tokens, strict=True):
+            if line_tokens <= budget:
+                yield line, line_tokens
+                continue
+            # 1行で上限を超える場合は、トークン数に比例した文字数で分ける
+            parts = math.ceil(line_tokens / budget)
+            size = math.ceil(len(line) / parts)
+            for i in range(0, len(line), size):
+                yield line[i : i + size], math.ceil(line_tokens / parts)
@@ -0,0 +1,75 @@
+"""Decoder for the compact sparse vector formats of splade-encoder-api.
+
+See splade-encoder-api/api/codec.py for the wire layout. search-api and
+ingestion-batch ship identical copies of this module; their test_codec
+pins both to the encoder's ``pack`` output.
+"""
+
+import struct
+
+try:
+    import msgpack
+except ImportError:  # optional dependency
+    msgpack = None
+
+RAW = "application/x-splade-sparse"
+MSGPACK = "application/x-msgpack"
+
+_WEIGHT_FORMATS = {"float16": ("e", 2), "float32": ("f", 4)}
+
+
+def accept_header(dtype: str = "float16") -> str:
+    return f"{RAW}; dtype={dtype}, application/json;q=0.5"
+
+
+def _dtype(content_type: str) -> str:
+    for param in content_type.split(";")[1:]:
+        name, _, value = param.partition("=")
+        if name.strip() == "dtype":
+            return value.strip()
+    return "float32"
+
+
+def _positive(ids, weights) -> tuple[list[int], list[float]]:
+    # Small weights can underflow to 0 in float16; rank_features only takes
+    # positive values, so those terms are dropped
+    kept = [(i, w) for i, w in zip(ids, weights, strict=True) if w > 0]
+    return [i for i, _ in kept], [w for _, w in kept]
+
+
+def decode(content: bytes, content_type: str) -> list[tuple[list[int], list[float]]]:
+    """Decode a binary response into ``(token_ids, weights)`` per vector.
+
+    Terms whose weight is not positive are dropped.
+    """
+    media_type = content_type.split(";")[0].strip()
+    weight_format, weight_size = _WEIGHT_FORMATS[_dtype(content_type)]
+
+    if media_type == RAW:
+        (count,) = struct.unpack_from("<I", content, 0)
+        offset = 4
+        vectors = []
+        for _ in range(count):
+            (nnz,) = struct.unpack_from("<I", content, offset)
+            offset += 4
+            ids = struct.unpack_from(f"<{nnz}i", content, offset)
+            offset += 4 * nnz
+            weights = struct.unpack_from(f"<{nnz}{weight_format}", content, offset)
+            offset += weight_size * nnz
+            vectors.append(_positive(ids, weights))
+        return vectors
+
+    if media_type == MSGPACK and msgpack is not None:
+        payload = msgpack.unpackb(content)
+        vectors = []
+        for vector in payload["vectors"]:
+            nnz = len(vector["ids"]) // 4
+            vectors.append(
+                _positive(
+                    struct.unpack(f"<{nnz}i", vector["ids"]),
+                    struct.unpack(f"<{nnz}{weight_format}", vector["weights"]),
+                )
+            )
+        return vectors
+
+    raise ValueError(f"Unsupported content type: {content_type}")
@@ -7,13 +7,75 @@ class Settings(BaseSettings):
 
     SCRAPBOX_PROJECT: str = Field(default="dummy-project")
     SCRAPBOX_SID: str | None = Field(default=None)
+    # ページ一覧の1リクエストあたりの件数（Scrapbox API の上限は 1000）
+    SCRAPBOX_PAGE_LIMIT: int = Field(default=1000)
+    # ページ詳細を並列に取得する数
+    SCRAPBOX_CONCURRENCY: int = Field(default=4)
+    # 1秒あたりの最大リクエスト数（0 で無制限）
+    SCRAPBOX_RATE_LIMIT: float = Field(default=5.0)
+    SCRAPBOX_MAX_RETRIES: int = Field(default=5)
+    SCRAPBOX_RETRY_BACKOFF: float = Field(default=1.0)
+    SCRAPBOX_TIMEOUT: float = Field(default=30.0)
     
     ELASTICSEARCH_URL: str = Field(default="http://localhost:9200")
+    # 検索側が読むエイリアス名（実体は "<名前>-<タイムスタンプ>" のインデックス）
     ELASTICSEARCH_INDEX: str = Field(default="scrapbox-pages")
+    # 投入後（公開時）に設定するレプリカ数とリフレッシュ間隔
+    ELASTICSEARCH_REPLICAS: int = Field(default=1)
+    ELASTICSEARCH_REFRESH_INTERVAL: str = Field(default="1s")
+    # ロールバック用に残す古いインデックスの数
+    ELASTICSEARCH_KEEP_VERSIONS: int = Field(default=2)
+    ELASTICSEARCH_FORCE_MERGE_TIMEOUT: float = Field(default=600.0)
+    # スパースベクトルのフィールドの型。"rank_features"（rank_feature クエリで検索）か
+    # "sparse_vector"（sparse_vector クエリで内積を計算する。Elasticsearch 8.15 以降）
+    ELASTICSEARCH_SPARSE_FIELD_TYPE: str = Field(default="rank_features")
+    # 1回のバルクリクエストの上限（スパースベクトルが大きいのでバイト数でも区切る）
+    BULK_MAX_DOCS: int = Field(default=500)
+    BULK_MAX_BYTES: int = Field(default=10 * 1024 * 1024)
+    # 429（キューあふれ）のリトライ回数と指数バックオフの初期値・上限（秒）
+    BULK_MAX_RETRIES: int = Field(default=5)
+    BULK_INITIAL_BACKOFF: float = Field(default=2.0)
+    BULK_MAX_BACKOFF: float = Field(default=60.0)
+    # 登録に失敗したアイテムの書き出し先（JSON Lines）
+    BULK_FAILURE_PATH: str = Field(default="bulk_failures.jsonl")
     
     SPLADE_API_URL: str = Field(default="http://localhost:8000/encode")
+    # "binary" はトークンIDと重みの配列で受け取る（"json" は従来の辞書形式）
+    SPLADE_RESPONSE_FORMAT: str = Field(default="binary")
+    SPLADE_MAX_RETRIES: int = Field(default=3)
+    SPLADE_RETRY_BACKOFF: float = Field(default=0.5)
+    SPLADE_TIMEOUT: float = Field(default=60.0)
+    # リトライしても失敗したチャンクの書き出し先（JSON Lines）
+    DEAD_LETTER_PATH: str = Field(default="dead_letters.jsonl")
     
+    # "structured" は行・ブロック単位でトークン数を上限に詰める（"fixed" は一定の文字数で分割する）
+    CHUNKER: str = Field(default="structured")
+    # structured: 1チャンクの最大トークン数（タイトルを含む）
+    CHUNK_MAX_TOKENS: int = Field(default=256)
+    # fixed: 1チャンクの最大文字数と重複文字数
     CHUNK_SIZE: int = Field(default=500)
     CHUNK_OVERLAP: int = Field(default=50)
 
+    # パイプラインの各ステージの並列数（エンコードは同時に投げるバッチリクエスト数）
+    CHUNKER_WORKERS: int = Field(default=1)
+    ENCODER_WORKERS: int = Field(default=4)
+    # バルク登録を並列に送るスレッド数
+    INDEXER_WORKERS: int = Field(default=2)
+    # 1回のエンコードリクエストにまとめるチャンク数（ページをまたいでまとめる）
+    ENCODE_BATCH_SIZE: int = Field(default=16)
+    # ステージ間のキューの長さ（一杯になると上流が待つ）
+    PIPELINE_QUEUE_SIZE: int = Field(default=64)
+    # 進捗ログの間隔（秒）
+    PIPELINE_REPORT_INTERVAL: float = Field(default=10.0)
+
+    # "incremental" は前回実行以降に更新されたページだけを処理する（"full" は毎回作り直す）
+    INGESTION_MODE: str = Field(default="incremental")
+    # 前回までの同期状態を保存するファイル
+    SYNC_STATE_PATH: str = Field(default="sync_state.json")
+
+    # エンコード済みチャンクのキャッシュ（SQLite）
+    CHUNK_CACHE_PATH: str = Field(default="chunk_cache.sqlite3")
+    # キャッシュに残すチャンク数の上限（0 でキャッシュしない）
+    CHUNK_CACHE_MAX_ENTRIES: int = Field(default=200000)
+
 settings = Settings()
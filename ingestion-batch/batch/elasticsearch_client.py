@@ -1,3 +1,6 @@
+import re
+import threading
+from datetime import UTC, datetime
 from typing import Any
 
 from elasticsearch import Elasticsearch, helpers
@@ -13,11 +16,26 @@ class ESClient:
             verify_certs=False,
             request_timeout=30,
         )
-        self.index_name = settings.ELASTICSEARCH_INDEX
+        # 検索側が読むエイリアス。実体はタイムスタンプ付きのインデックスで、入れ替えて公開する
+        self.alias = settings.ELASTICSEARCH_INDEX
+        # 書き込み先のインデックス
+        self.index_name = self.alias
+        # バルク登録で失敗したアイテム（バッチの最後にファイルへ書き出す）
+        self.failures: list[dict[str, Any]] = []
+        self._failures_lock = threading.Lock()
 
-    def create_index(self):
+    def current_index(self) -> str | None:
         """
-        インデックスを作成し、マッピングを設定する
+        エイリアスが指している（公開中の）インデックス名
+        """
+        if not self.es.indices.exists_alias(name=self.alias):
+            return None
+        return next(iter(self.es.indices.get_alias(name=self.alias)))
+
+    def create_index(self) -> str:
+        """
+        新しいバージョンのインデックスを作成し、マッピングを設定する。
+        公開中のインデックスには触れないので、構築中も検索は止まらない
         """
         mappings = {
             "properties": {
@@ -29,34 +47,146 @@ class ESClient:
                 },
                 "url": {"type": "keyword"},
                 "updated": {"type": "date"},
-                "sparse_vector": {"type": "rank_features"},
+                "sparse_vector": {"type": settings.ELASTICSEARCH_SPARSE_FIELD_TYPE},
             }
         }
 
+        self.index_name = f"{self.alias}-{datetime.now(UTC):%Y%m%d%H%M%S}"
         try:
-            # すでに存在する場合は削除して作り直す（バッチの性質上、今回はシンプルに再作成）
-            if self.es.indices.exists(index=self.index_name):
-                logger.info(f"Deleting existing index: {self.index_name}")
-                self.es.indices.delete(index=self.index_name)
-
             logger.info(f"Creating index: {self.index_name}")
-            self.es.indices.create(index=self.index_name, mappings=mappings)
+            # 投入中はリフレッシュとレプリカを止めて書き込みを速くする（publish で戻す）
+            self.es.indices.create(
+                index=self.index_name,
+                mappings=mappings,
+                settings={"number_of_replicas": 0, "refresh_interval": "-1"},
+            )
         except Exception as e:
             logger.error(f"Failed to create index: {e}")
             if hasattr(e, 'body'):
                 logger.error(f"Error body: {e.body}")
             raise e
+        return self.index_name
 
-    def bulk_index(self, documents: list[dict[str, Any]]):
+    def publish(self):
         """
-        ドキュメントを一括登録する
+        投入用の設定を戻して force merge し、エイリアスを新しいインデックスに付け替える
         """
-        actions = [
-            {
-                "_index": self.index_name,
-                "_source": doc
-            }
-            for doc in documents
-        ]
-        helpers.bulk(self.es, actions)
-        logger.info(f"Indexed {len(documents)} documents to {self.index_name}")
+        self.es.indices.put_settings(
+            index=self.index_name,
+            settings={
+                "number_of_replicas": settings.ELASTICSEARCH_REPLICAS,
+                "refresh_interval": settings.ELASTICSEARCH_REFRESH_INTERVAL,
+            },
+        )
+        self.es.indices.refresh(index=self.index_name)
+        logger.info(f"Force merging {self.index_name}")
+        # force merge は時間がかかるので、この呼び出しだけタイムアウトを延ばす
+        merge_client = self.es.options(request_timeout=settings.ELASTICSEARCH_FORCE_MERGE_TIMEOUT)
+        merge_client.indices.forcemerge(index=self.index_name, max_num_segments=1)
+
+        actions = []
+        if self.es.indices.exists_alias(name=self.alias):
+            for index in self.es.indices.get_alias(name=self.alias):
+                actions.append({"remove": {"index": index, "alias": self.alias}})
+        elif self.es.indices.exists(index=self.alias):
+            # エイリアス導入前に作った同名のインデックスは、付け替えと同時に削除する
+            actions.append({"remove_index": {"index": self.alias}})
+        actions.append({"add": {"index": self.index_name, "alias": self.alias}})
+        # 1回の API 呼び出しで行うので、検索側からはアトミックに切り替わる
+        self.es.indices.update_aliases(actions=actions)
+        logger.info(f"Alias {self.alias} now points to {self.index_name}")
+
+        self.prune_versions(settings.ELASTICSEARCH_KEEP_VERSIONS)
+
+    def versions(self) -> list[str]:
+        """
+        このエイリアス用に作ったインデックス名（新しい順）
+        """
+        pattern = re.compile(rf"{re.escape(self.alias)}-\d{{14}}")
+        indices = self.es.indices.get(index=f"{self.alias}-*")
+        return sorted((name for name in indices if pattern.fullmatch(name)), reverse=True)
+
+    def prune_versions(self, keep: int):
+        """
+        ロールバック用に公開中以外の新しい keep 個を残し、それより古いインデックスを削除する
+        """
+        current = self.current_index()
+        old_versions = [name for name in self.versions() if name != current]
+        for name in old_versions[keep:]:
+            logger.info(f"Deleting old index: {name}")
+            self.es.indices.delete(index=name)
+
+    def discard(self):
+        """
+        公開前に失敗した構築中のインデックスを削除する
+        """
+        if self.index_name == self.alias:
+            return
+        try:
+            if self.index_name != self.current_index():
+                logger.info(f"Deleting unpublished index: {self.index_name}")
+                self.es.indices.delete(index=self.index_name, ignore_unavailable=True)
+        except Exception as e:
+            logger.warning(f"Failed to delete unpublished index {self.index_name}: {e}")
+
+    def bulk(self, actions: list[dict[str, Any]]) -> list[dict[str, Any]]:
+        """
+        アクションを件数・バイト数の上限ごとに分けて送り、失敗したアイテムを返す。
+        混雑による 429 はバックオフしながらリトライする
+        """
+        failures = []
+        for _, item in helpers.streaming_bulk(
+            self.es,
+            actions,
+            index=self.index_name,
+            chunk_size=settings.BULK_MAX_DOCS,
+            max_chunk_bytes=settings.BULK_MAX_BYTES,
+            max_retries=settings.BULK_MAX_RETRIES,
+            initial_backoff=settings.BULK_INITIAL_BACKOFF,
+            max_backoff=settings.BULK_MAX_BACKOFF,
+            raise_on_error=False,
+            yield_ok=False,
+        ):
+            op_type, result = next(iter(item.items()))
+            # すでに存在しないドキュメントの削除は失敗ではない
+            if op_type == "delete" and result.get("status") == 404:
+                continue
+            failures.append(
+                {
+                    "op": op_type,
+                    "_id": result.get("_id"),
+                    "status": result.get("status"),
+                    "error": result.get("error"),
+                }
+            )
+
+        if failures:
+            logger.error(f"{len(failures)} of {len(actions)} bulk actions failed")
+            with self._failures_lock:
+                self.failures.extend(failures)
+        return failures
+
+    def delete_documents(self, ids: list[str]) -> list[str]:
+        """
+        指定した ID のドキュメントを一括削除し、削除に失敗した ID を返す（存在しない ID は無視）
+        """
+        if not ids:
+            return []
+        failures = self.bulk([delete_action(doc_id) for doc_id in ids])
+        logger.info(f"Deleted {len(ids) - len(failures)} documents from {self.index_name}")
+        return [failure["_id"] for failure in failures]
+
+
+def index_action(doc: dict[str, Any]) -> dict[str, Any]:
+    """
+    `_id` が同じドキュメントを置き換える（upsert）登録アクション
+    """
+    return {
+        "_op_type": "index",
+        "_id": doc["_id"],
+        "_source": {k: v for k, v in doc.items() if k != "_id"},
+    }
+
+
+def delete_action(doc_id: str) -> dict[str, Any]:
+    return {"_op_type": "delete", "_id": doc_id}
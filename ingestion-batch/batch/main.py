@@ -1,46 +1,113 @@
 import sys
+import time
 
 from loguru import logger
 
+from .chunk_cache import ChunkCache
+from .config import settings
 from .elasticsearch_client import ESClient
+from .pipeline import Pipeline
 from .processor import Processor
+from .report import write_jsonl
 from .scrapbox import ScrapboxClient
+from .sync_state import SyncState, page_key
+
+
+def open_chunk_cache(processor: Processor) -> ChunkCache | None:
+    if settings.CHUNK_CACHE_MAX_ENTRIES <= 0:
+        return None
+    try:
+        namespace = processor.get_cache_namespace()
+    except Exception as e:
+        # エンコーダーの設定がわからないと古いベクトルを返しかねないので、キャッシュを使わない
+        logger.warning(f"Chunk cache disabled, failed to get encoder settings: {e}")
+        return None
+    return ChunkCache(settings.CHUNK_CACHE_PATH, settings.CHUNK_CACHE_MAX_ENTRIES, namespace)
 
 
 def main():
     logger.info("Starting ingestion batch...")
-    
+
     scrapbox = ScrapboxClient()
     es = ESClient()
     processor = Processor()
-    
+    processor.cache = open_chunk_cache(processor)
+    state = SyncState.load(settings.SYNC_STATE_PATH)
+    started_at = time.time()
+
     try:
-        # ES インデックスの初期化
-        es.create_index()
-        
-        # Scrapbox から全ページ取得
-        pages = scrapbox.get_all_pages()
-        logger.info(f"Retrieved {len(pages)} pages from Scrapbox")
-        
-        all_processed_docs = []
-        for page in pages:
-            docs = processor.process_page(page)
-            all_processed_docs.extend(docs)
-            
-            # メモリ節約のために一定数溜まったらバルクインサートする
-            if len(all_processed_docs) >= 50:
-                es.bulk_index(all_processed_docs)
-                all_processed_docs = []
-        
-        # 残りをインサート
-        if all_processed_docs:
-            es.bulk_index(all_processed_docs)
-            
+        # 前回の状態が公開中のインデックスのものなら差分だけを反映する
+        # （ロールバックでエイリアスが別のインデックスに戻った場合は作り直す）
+        current_index = es.current_index()
+        incremental = (
+            settings.INGESTION_MODE == "incremental"
+            and current_index is not None
+            and state.index == current_index
+            and state.last_run is not None
+        )
+
+        if incremental:
+            logger.info(f"Incremental sync of {current_index} since last run at {state.last_run}")
+            es.index_name = current_index
+            # 一覧（メタデータ）だけで差分を判定し、変更されたページだけ詳細を取得する
+            page_metas = list(scrapbox.iter_page_metas())
+            changed = [meta for meta in page_metas if not state.is_unchanged(meta)]
+            logger.info(f"{len(changed)} of {len(page_metas)} pages changed")
+
+            vanished_ids = state.remove_missing({page_key(meta) for meta in page_metas})
+            if vanished_ids:
+                logger.info(f"Deleting {len(vanished_ids)} chunks of removed pages")
+            # 削除に失敗した ID は状態に残し、次回もう一度削除する
+            state.defer_deletes(es.delete_documents(vanished_ids))
+
+            pages = scrapbox.iter_pages(changed)
+        else:
+            # 新しいバージョンのインデックスに構築し、完了後にエイリアスを付け替える
+            es.create_index()
+            state.reset(es.index_name)
+            # Scrapbox から全ページを取得しながらパイプラインで処理する
+            pages = scrapbox.iter_pages()
+
+        pipeline = Pipeline(
+            processor,
+            es,
+            state,
+            chunker_workers=settings.CHUNKER_WORKERS,
+            encoder_workers=settings.ENCODER_WORKERS,
+            indexer_workers=settings.INDEXER_WORKERS,
+            bulk_max_docs=settings.BULK_MAX_DOCS,
+            bulk_max_bytes=settings.BULK_MAX_BYTES,
+            encode_batch_size=settings.ENCODE_BATCH_SIZE,
+            queue_size=settings.PIPELINE_QUEUE_SIZE,
+            report_interval=settings.PIPELINE_REPORT_INTERVAL,
+        )
+        report = pipeline.run(pages)
+        if not incremental:
+            es.publish()
+
+        state.mark_run(started_at)
+        state.save()
+        logger.info(
+            f"Processed {report['pages']} pages ({report['unchanged']} unchanged, "
+            f"{report['documents']} documents, {report['failed_chunks']} failed chunks, "
+            f"{report['index_failures']} failed bulk actions) "
+            f"in {report['elapsed_seconds']:.1f}s"
+        )
         logger.info("Ingestion batch completed successfully.")
-        
+
     except Exception as e:
         logger.error(f"Batch failed: {e}")
+        # 構築途中のインデックスは公開せずに捨てる（検索は元のインデックスのまま）
+        es.discard()
         sys.exit(1)
 
+    finally:
+        # 途中で失敗しても、それまでにエンコードしたチャンクは次回に使えるように残す
+        if processor.cache is not None:
+            processor.cache.close()
+        # 失敗したときこそ必要なので、途中で失敗しても記録した失敗は書き出す
+        write_jsonl(settings.DEAD_LETTER_PATH, processor.dead_letters, "failed chunks")
+        write_jsonl(settings.BULK_FAILURE_PATH, es.failures, "failed bulk actions")
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,454 @@
+import json
+import queue
+import threading
+import time
+from collections.abc import Callable, Iterable
+from typing import Any
+
+from loguru import logger
+
+from .elasticsearch_client import ESClient, delete_action, index_action
+from .processor import Processor
+from .sync_state import SyncState, content_hash, page_key
+
+# ステージの終了を下流に伝える番兵
+_DONE = object()
+
+
+class _Aborted(Exception):
+    """
+    他のステージが失敗したので処理を打ち切る
+    """
+
+
+class Indexer:
+    """
+    upsert と削除のアクションを溜めておき、件数かバイト数が上限に達したらまとめて送る
+    """
+
+    def __init__(
+        self,
+        es: ESClient,
+        max_docs: int = 500,
+        max_bytes: int = 10 * 1024 * 1024,
+        on_failure: Callable[[str, str], None] | None = None,
+    ):
+        self.es = es
+        self.max_docs = max_docs
+        self.max_bytes = max_bytes
+        # 登録・削除に失敗したドキュメントの (ページキー, ID) を受け取るコールバック
+        self.on_failure = on_failure
+        self.actions = []
+        self.size = 0
+        self.owners: dict[str, str] = {}
+
+    def add(self, documents: list[dict], deletions: list[str] = (), owner: str | None = None):
+        for doc in documents:
+            action = index_action(doc)
+            self.actions.append(action)
+            # スパースベクトルの大きさはチャンクごとに違うので、件数ではなくバイト数で見積もる
+            self.size += len(json.dumps(action, ensure_ascii=False).encode())
+            if owner is not None:
+                self.owners[doc["_id"]] = owner
+        for doc_id in deletions:
+            self.actions.append(delete_action(doc_id))
+            self.size += len(doc_id) + 64
+            if owner is not None:
+                self.owners[doc_id] = owner
+        if len(self.actions) >= self.max_docs or self.size >= self.max_bytes:
+            self.flush()
+
+    def flush(self):
+        if not self.actions:
+            return
+        failures = self.es.bulk(self.actions)
+        if self.on_failure is not None:
+            for failure in failures:
+                owner = self.owners.get(failure["_id"])
+                if owner is not None:
+                    self.on_failure(owner, failure["_id"])
+        self.actions = []
+        self.size = 0
+        self.owners = {}
+
+
+class PageJob:
+    """
+    パイプラインを流れる1ページ分の作業（チャンクごとのベクトルが揃ったら登録できる）
+    """
+
+    def __init__(
+        self,
+        page: dict[str, Any],
+        page_hash: str | None,
+        chunks: list[str] | None = None,
+        unchanged: bool = False,
+    ):
+        self.page = page
+        self.page_hash = page_hash
+        self.chunks = chunks or []
+        self.vectors: list[dict[str, float] | None] = [None] * len(self.chunks)
+        self.unchanged = unchanged
+        self._remaining = len(self.chunks)
+        self._lock = threading.Lock()
+
+    def set_vector(self, index: int, vector: dict[str, float]) -> bool:
+        """
+        ベクトルを格納し、これでページのチャンクがすべて揃ったら True を返す
+        """
+        self.vectors[index] = vector
+        with self._lock:
+            self._remaining -= 1
+            return self._remaining == 0
+
+
+class StageStats:
+    def __init__(self, workers: int):
+        self.workers = workers
+        self.items = 0
+        self.busy_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, items: int, started: float):
+        with self._lock:
+            self.items += items
+            self.busy_seconds += time.monotonic() - started
+
+    def summary(self, elapsed: float) -> dict[str, float]:
+        return {
+            "workers": self.workers,
+            "items": self.items,
+            "per_second": self.items / elapsed if elapsed else 0.0,
+            # 1 に近いステージほどボトルネック
+            "utilization": self.busy_seconds / (elapsed * self.workers) if elapsed else 0.0,
+        }
+
+
+class QueueStats:
+    def __init__(self, q: queue.Queue):
+        self.queue = q
+        self.samples = 0
+        self.total = 0
+        self.max = 0
+
+    def sample(self):
+        size = self.queue.qsize()
+        self.samples += 1
+        self.total += size
+        self.max = max(self.max, size)
+
+    def summary(self) -> dict[str, float]:
+        return {
+            "capacity": self.queue.maxsize,
+            "mean": self.total / self.samples if self.samples else 0.0,
+            "max": self.max,
+        }
+
+
+class Pipeline:
+    """
+    取得 → チャンク分割 → エンコード → 登録 を上限付きキューでつないで並行に動かす
+
+    キューが一杯になると上流が待たされるので、プロジェクトの大きさによらずメモリ使用量は一定。
+    取得の並列数は ScrapboxClient 側（SCRAPBOX_CONCURRENCY）で決まる。
+    """
+
+    def __init__(
+        self,
+        processor: Processor,
+        es: ESClient,
+        state: SyncState,
+        chunker_workers: int = 1,
+        encoder_workers: int = 4,
+        indexer_workers: int = 1,
+        encode_batch_size: int = 16,
+        queue_size: int = 64,
+        bulk_max_docs: int = 500,
+        bulk_max_bytes: int = 10 * 1024 * 1024,
+        batch_wait: float = 0.05,
+        report_interval: float = 10.0,
+        sample_interval: float = 0.5,
+    ):
+        self.processor = processor
+        self.es = es
+        self.state = state
+        self.encode_batch_size = encode_batch_size
+        self.bulk_max_docs = bulk_max_docs
+        self.bulk_max_bytes = bulk_max_bytes
+        self.batch_wait = batch_wait
+        self.report_interval = report_interval
+        self.sample_interval = sample_interval
+
+        self.queues = {
+            "pages": queue.Queue(maxsize=queue_size),
+            "chunks": queue.Queue(maxsize=queue_size * encode_batch_size),
+            "encoded": queue.Queue(maxsize=queue_size),
+        }
+        self.queue_stats = {name: QueueStats(q) for name, q in self.queues.items()}
+        self.stages = {
+            "fetch": StageStats(1),
+            "chunk": StageStats(chunker_workers),
+            "encode": StageStats(encoder_workers),
+            "index": StageStats(indexer_workers),
+        }
+
+        self.pages = 0
+        self.unchanged = 0
+        self.documents = 0
+        self.failed_chunks = 0
+        self.index_failures = 0
+        self.error: Exception | None = None
+        self._state_lock = threading.Lock()
+        self._abort = threading.Event()
+        self._finished = threading.Event()
+        self._started = 0.0
+
+    def run(self, pages: Iterable[dict[str, Any]]) -> dict[str, Any]:
+        self._started = time.monotonic()
+        reporter = threading.Thread(target=self._report_loop, name="pipeline-report", daemon=True)
+        reporter.start()
+
+        targets = {
+            "fetch": (self._fetch, pages),
+            "chunk": (self._chunk,),
+            "encode": (self._encode,),
+            "index": (self._index,),
+        }
+        # 各ステージの出力先（全ワーカーが終わったら番兵を流す）
+        outputs = {"fetch": "pages", "chunk": "chunks", "encode": "encoded", "index": None}
+        threads = {name: self._start(name, *target) for name, target in targets.items()}
+        for name, workers in threads.items():
+            for thread in workers:
+                thread.join()
+            if outputs[name] is not None:
+                try:
+                    self._put(outputs[name], _DONE)
+                except _Aborted:
+                    pass
+
+        self._finished.set()
+        reporter.join()
+        if self.error is not None:
+            raise self.error
+
+        report = self.report()
+        self._log_report(report)
+        return report
+
+    def _start(self, name: str, target, *args) -> list[threading.Thread]:
+        threads = []
+        for i in range(self.stages[name].workers):
+            thread = threading.Thread(
+                target=self._worker, args=(name, target, *args), name=f"pipeline-{name}-{i}"
+            )
+            thread.start()
+            threads.append(thread)
+        return threads
+
+    def _worker(self, name: str, target, *args):
+        try:
+            target(self.stages[name], *args)
+        except _Aborted:
+            pass
+        except Exception as e:
+            logger.error(f"Pipeline stage {name} failed: {e}")
+            with self._state_lock:
+                if self.error is None:
+                    self.error = e
+            self._abort.set()
+
+    def _put(self, name: str, item: Any):
+        while True:
+            if self._abort.is_set():
+                raise _Aborted
+            try:
+                self.queues[name].put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def _get(self, name: str, timeout: float | None = None) -> Any:
+        """
+        キューから取り出す（timeout を過ぎたら None）
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            if self._abort.is_set():
+                raise _Aborted
+            wait = 0.1 if deadline is None else min(0.1, deadline - time.monotonic())
+            if wait <= 0:
+                return None
+            try:
+                return self.queues[name].get(timeout=wait)
+            except queue.Empty:
+                continue
+
+    def _fetch(self, stage: StageStats, pages: Iterable[dict[str, Any]]):
+        iterator = iter(pages)
+        try:
+            while True:
+                started = time.monotonic()
+                page = next(iterator, None)
+                if page is None:
+                    break
+                stage.record(1, started)
+                self._put("pages", page)
+        finally:
+            # 打ち切られた場合も取得中のスレッドを片付ける
+            if hasattr(iterator, "close"):
+                iterator.close()
+
+    def _chunk(self, stage: StageStats):
+        while (page := self._get("pages")) is not _DONE:
+            started = time.monotonic()
+            job = self._make_job(page)
+            stage.record(1, started)
+
+            if job.unchanged or not job.chunks:
+                self._put("encoded", job)
+                continue
+            for i in range(len(job.chunks)):
+                self._put("chunks", (job, i))
+        # 同じステージの他のワーカーにも終了を伝える
+        self._put("pages", _DONE)
+
+    def _make_job(self, page: dict[str, Any]) -> PageJob:
+        processor = self.processor
+        page_hash = content_hash(page, *processor.chunk_params)
+        with self._state_lock:
+            entry = self.state.pages.get(page_key(page))
+        if entry and entry["content_hash"] == page_hash:
+            # updated だけが変わったページは再エンコードしない
+            return PageJob(page, page_hash, unchanged=True)
+        chunks, exact = processor.chunk_page_with_fallback(page)
+        # 文字数で代用して分割したページはハッシュを残さず、次回トークン数で分割し直す
+        return PageJob(page, page_hash if exact else None, chunks)
+
+    def _encode(self, stage: StageStats):
+        done = False
+        while not done:
+            item = self._get("chunks")
+            if item is _DONE:
+                break
+
+            # 複数ページにまたがってチャンクを集め、まとめてエンコードする
+            batch = [item]
+            deadline = time.monotonic() + self.batch_wait
+            while len(batch) < self.encode_batch_size:
+                item = self._get("chunks", timeout=max(0.0, deadline - time.monotonic()))
+                if item is None:
+                    break
+                if item is _DONE:
+                    done = True
+                    break
+                batch.append(item)
+
+            started = time.monotonic()
+            try:
+                vectors = self.processor.encode_chunks([job.chunks[i] for job, i in batch])
+            except Exception as e:
+                # リトライしても失敗したチャンクはデッドレターに回し、ページは次回再処理する
+                logger.error(f"Failed to encode {len(batch)} chunks: {e}")
+                for job, i in batch:
+                    self.processor.record_failure(job.page, i, job.chunks[i], e)
+                vectors = [{} for _ in batch]
+            stage.record(len(batch), started)
+
+            for (job, i), vector in zip(batch, vectors, strict=True):
+                if job.set_vector(i, vector):
+                    self._put("encoded", job)
+        self._put("chunks", _DONE)
+
+    def _index(self, stage: StageStats):
+        # ワーカーごとにバッファを持ち、バルクリクエストを並列に送る
+        indexer = Indexer(
+            self.es, self.bulk_max_docs, self.bulk_max_bytes, on_failure=self._invalidate_page
+        )
+        while (job := self._get("encoded")) is not _DONE:
+            started = time.monotonic()
+            documents, stale_ids = self._finish_page(job)
+            indexer.add(documents, stale_ids, owner=page_key(job.page))
+            stage.record(1, started)
+        indexer.flush()
+        self._put("encoded", _DONE)
+
+    def _finish_page(self, job: PageJob) -> tuple[list[dict[str, Any]], list[str]]:
+        """
+        ページのドキュメントを組み立てて状態を更新し、(登録するドキュメント, 削除する ID) を返す
+        """
+        if job.unchanged:
+            with self._state_lock:
+                entry = self.state.pages[page_key(job.page)]
+                self.state.set_page(job.page, job.page_hash, entry["chunk_ids"])
+                self.unchanged += 1
+            return [], []
+
+        documents = []
+        failed = 0
+        for i, (chunk, vector) in enumerate(zip(job.chunks, job.vectors, strict=True)):
+            if not vector:
+                failed += 1
+                continue
+            documents.append(self.processor.build_document(job.page, i, chunk, vector))
+
+        # 失敗したチャンクがあるページは次回もう一度処理する
+        page_hash = job.page_hash if not failed else None
+        with self._state_lock:
+            stale_ids = self.state.set_page(
+                job.page, page_hash, [document["_id"] for document in documents]
+            )
+            self.pages += 1
+            self.documents += len(documents)
+            self.failed_chunks += failed
+        return documents, stale_ids
+
+    def _invalidate_page(self, key: str, doc_id: str):
+        """
+        登録・削除に失敗したドキュメントがあるページは、次回もう一度処理する
+
+        削除に失敗した古いチャンクの ID は状態に戻し、次回の set_page で改めて削除させる
+        """
+        with self._state_lock:
+            self.index_failures += 1
+            entry = self.state.pages.get(key)
+            if entry is not None:
+                entry["content_hash"] = None
+                if doc_id not in entry["chunk_ids"]:
+                    entry["chunk_ids"].append(doc_id)
+
+    def _report_loop(self):
+        last_report = time.monotonic()
+        while not self._finished.wait(self.sample_interval):
+            for stats in self.queue_stats.values():
+                stats.sample()
+            if time.monotonic() - last_report >= self.report_interval:
+                last_report = time.monotonic()
+                queues = ", ".join(
+                    f"{name}={q.qsize()}/{q.maxsize}" for name, q in self.queues.items()
+                )
+                stages = ", ".join(f"{name}={s.items}" for name, s in self.stages.items())
+                logger.info(f"Pipeline progress: {stages} (queues: {queues})")
+
+    def report(self) -> dict[str, Any]:
+        elapsed = time.monotonic() - self._started
+        return {
+            "elapsed_seconds": elapsed,
+            "pages": self.pages,
+            "unchanged": self.unchanged,
+            "documents": self.documents,
+            "failed_chunks": self.failed_chunks,
+            "index_failures": self.index_failures,
+            "stages": {name: s.summary(elapsed) for name, s in self.stages.items()},
+            "queues": {name: s.summary() for name, s in self.queue_stats.items()},
+        }
+
+    def _log_report(self, report: dict[str, Any]):
+        for name, stage in report["stages"].items():
+            logger.info(
+                f"Stage {name}: {stage['items']} items, {stage['per_second']:.1f}/s, "
+                f"utilization {stage['utilization']:.0%} ({stage['workers']} workers)"
+            )
+        for name, q in report["queues"].items():
+            logger.info(f"Queue {name}: mean {q['mean']:.1f}, max {q['max']} / {q['capacity']}")
+        bottleneck = max(report["stages"], key=lambda name: report["stages"][name]["utilization"])
+        logger.info(f"Busiest stage: {bottleneck}")
@@ -1,16 +1,63 @@
+import json
+import threading
 from typing import Any
 
 import requests
 from loguru import logger
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
+from . import codec
+from .chunk_cache import ChunkCache
+from .chunker import StructuredChunker
 from .config import settings
+from .sync_state import chunk_id, page_key
+
+
+class TokenCountError(Exception):
+    """
+    エンコーダーの /tokenize でトークン数を数えられなかった
+    """
+
+
+def count_characters(texts: list[str]) -> list[int]:
+    return [len(text) for text in texts]
 
 
 class Processor:
-    def __init__(self):
+    def __init__(self, cache: ChunkCache | None = None):
         self.splade_url = settings.SPLADE_API_URL
+        api_base = self.splade_url.rsplit("/", 1)[0]
+        self.splade_batch_url = f"{api_base}/encode_batch"
+        self.vocab_url = f"{api_base}/vocab"
+        self.tokenize_url = f"{api_base}/tokenize"
+        self.health_url = f"{api_base}/health"
+        self.binary = settings.SPLADE_RESPONSE_FORMAT == "binary"
+        # エンコード済みチャンクのキャッシュ（None なら毎回エンコードする）
+        self.cache = cache
+        self._vocab: list[str] | None = None
+        self.chunker = settings.CHUNKER
+        self.chunk_max_tokens = settings.CHUNK_MAX_TOKENS
         self.chunk_size = settings.CHUNK_SIZE
         self.chunk_overlap = settings.CHUNK_OVERLAP
+        # リトライしても失敗したチャンク（バッチの最後にファイルへ書き出す）
+        self.dead_letters: list[dict[str, Any]] = []
+        self._dead_letters_lock = threading.Lock()
+
+        self.timeout = settings.SPLADE_TIMEOUT
+        # エンコードは冪等なので POST もリトライする（503 の Retry-After に従う）
+        retry = Retry(
+            total=settings.SPLADE_MAX_RETRIES,
+            backoff_factor=settings.SPLADE_RETRY_BACKOFF,
+            status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods=None,
+            respect_retry_after_header=True,
+        )
+        # 同時に投げるバッチリクエストの数だけコネクションを使い回す
+        adapter = HTTPAdapter(pool_maxsize=settings.ENCODER_WORKERS, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
 
     def split_text(self, text: str) -> list[str]:
         """
@@ -30,48 +77,136 @@ class Processor:
             start += (self.chunk_size - self.chunk_overlap)
         return chunks
 
-    def get_sparse_vector(self, text: str) -> dict[str, float]:
+    def get_sparse_vectors(self, texts: list[str]) -> list[dict[str, float]]:
         """
-        SPLADE API を叩いてスパースベクトルを取得する
+        SPLADE API の /encode_batch を叩いて、複数テキストのスパースベクトルをまとめて取得する
+        （一時的なエラーはリトライし、それでも失敗したら例外を投げる）
         """
-        try:
-            response = requests.post(self.splade_url, json={"text": text})
+        headers = {"Accept": codec.accept_header()} if self.binary else {}
+        response = self.session.post(
+            self.splade_batch_url, json={"texts": texts}, headers=headers, timeout=self.timeout
+        )
+        response.raise_for_status()
+
+        content_type = response.headers.get("content-type", "")
+        if content_type.startswith("application/json"):
+            return response.json()["sparse_vectors"]
+
+        # rank_features のフィールド名にするため、ここで初めてトークン文字列に変換する
+        vocab = self.get_vocab()
+        return [
+            {vocab[i]: weight for i, weight in zip(ids, weights, strict=True)}
+            for ids, weights in codec.decode(response.content, content_type)
+        ]
+
+    def get_vocab(self) -> list[str]:
+        """
+        バイナリ形式のトークンIDを文字列に戻すための語彙を取得する（初回のみ）
+        """
+        if self._vocab is None:
+            response = self.session.get(self.vocab_url, timeout=self.timeout)
             response.raise_for_status()
-            return response.json()["sparse_vector"]
-        except Exception as e:
-            logger.error(f"Failed to get sparse vector: {e}")
-            return {}
+            self._vocab = response.json()["tokens"]
+        return self._vocab
+
+    def get_cache_namespace(self) -> str:
+        """
+        キャッシュキーに含めるエンコーダーの設定（モデル・バックエンド・プルーニング等）
+        """
+        response = self.session.get(self.health_url, timeout=self.timeout)
+        response.raise_for_status()
+        health = response.json()
+        encoder = {key: health.get(key) for key in ("model", "backend", "encoding")}
+        # バイナリ形式は重みを float16 で受け取るため、形式もキーに含める
+        encoder["format"] = "binary" if self.binary else "json"
+        return json.dumps(encoder, sort_keys=True)
+
+    def encode_chunks(self, chunks: list[str]) -> list[dict[str, float]]:
+        """
+        キャッシュにあるチャンクはそれを使い、残りだけを SPLADE API でまとめてエンコードする
+        （失敗したら例外を投げるので、呼び出し側で record_failure する）
+        """
+        vectors = [self.cache.get(chunk) if self.cache else None for chunk in chunks]
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if not missing:
+            return vectors
+
+        encoded = self.get_sparse_vectors([chunks[i] for i in missing])
+        for i, sparse_vector in zip(missing, encoded, strict=True):
+            vectors[i] = sparse_vector
+            if sparse_vector and self.cache is not None:
+                self.cache.set(chunks[i], sparse_vector)
+        return vectors
 
-    def process_page(self, page: dict[str, Any]) -> list[dict[str, Any]]:
+    def record_failure(self, page: dict[str, Any], index: int, chunk: str, error: Exception):
+        with self._dead_letters_lock:
+            self.dead_letters.append(
+                {
+                    "page": page_key(page),
+                    "title": page.get("title", ""),
+                    "chunk_index": index,
+                    "text": chunk,
+                    "error": str(error),
+                }
+            )
+
+    @property
+    def chunk_params(self) -> tuple:
+        """
+        チャンク分割の結果を左右する設定（変われば全ページを再処理する）
+        """
+        if self.chunker == "structured":
+            return ("structured", self.chunk_max_tokens)
+        return ("fixed", self.chunk_size, self.chunk_overlap)
+
+    def chunk_page(self, page: dict[str, Any], exact: bool = True) -> list[str]:
+        """
+        ページをチャンクに分割する（exact が False ならトークン数の代わりに文字数で数える）
         """
-        Scrapboxの1ページを複数のチャンク・ドキュメントに変換する
+        if self.chunker == "structured":
+            count = self.count_tokens if exact else count_characters
+            return StructuredChunker(count, self.chunk_max_tokens).chunk_page(page)
+        # 行を結合した全文を一定の文字数で分割する
+        lines = [line.get("text", "") for line in page.get("lines", [])]
+        return self.split_text("\n".join(lines))
+
+    def chunk_page_with_fallback(self, page: dict[str, Any]) -> tuple[list[str], bool]:
+        """
+        ページをチャンクに分割し、(チャンク, トークン数で分割できたか) を返す。
+        トークン数を数えられなければ文字数で分割する（呼び出し側は次回分割し直すこと）
         """
+        try:
+            return self.chunk_page(page), True
+        except TokenCountError as e:
+            logger.warning(
+                f"Failed to count tokens of page {page.get('title', '')}, "
+                f"chunking by characters until the next run: {e}"
+            )
+            return self.chunk_page(page, exact=False), False
+
+    def count_tokens(self, texts: list[str]) -> list[int]:
+        """
+        エンコーダーと同じトークナイザーでトークン数を数える
+        """
+        try:
+            response = self.session.post(
+                self.tokenize_url, json={"texts": texts}, timeout=self.timeout
+            )
+            response.raise_for_status()
+            return response.json()["counts"]
+        except Exception as e:
+            raise TokenCountError(str(e)) from e
+
+    def build_document(
+        self, page: dict[str, Any], index: int, chunk: str, sparse_vector: dict[str, float]
+    ) -> dict[str, Any]:
         title = page.get("title", "")
-        updated = page.get("updated", 0) * 1000  # ms に変換
         project_name = settings.SCRAPBOX_PROJECT
-        page_url = f"https://scrapbox.io/{project_name}/{requests.utils.quote(title)}"
-        
-        # 行を結合して全文を作成
-        lines = [line.get("text", "") for line in page.get("lines", [])]
-        full_text = "\n".join(lines)
-        
-        chunks = self.split_text(full_text)
-        
-        processed_docs = []
-        for i, chunk in enumerate(chunks):
-            logger.info(f"Encoding chunk {i+1}/{len(chunks)} of page: {title}")
-            sparse_vector = self.get_sparse_vector(chunk)
-            
-            if not sparse_vector:
-                continue
-                
-            doc = {
-                "title": title,
-                "text": chunk,
-                "url": page_url,
-                "updated": updated,
-                "sparse_vector": sparse_vector
-            }
-            processed_docs.append(doc)
-            
-        return processed_docs
+        return {
+            "_id": chunk_id(page_key(page), index),
+            "title": title,
+            "text": chunk,
+            "url": f"https://scrapbox.io/{project_name}/{requests.utils.quote(title)}",
+            "updated": page.get("updated", 0) * 1000,  # ms に変換
+            "sparse_vector": sparse_vector,
+        }
@@ -0,0 +1,21 @@
+import json
+import os
+from typing import Any
+
+from loguru import logger
+
+
+def write_jsonl(path: str, entries: list[dict[str, Any]], label: str):
+    """
+    失敗したアイテムを JSON Lines で書き出す（なければ前回のファイルを消す）
+    """
+    if not entries:
+        if os.path.exists(path):
+            os.remove(path)
+        return
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        for entry in entries:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+    logger.warning(f"Wrote {len(entries)} {label} to {path}")
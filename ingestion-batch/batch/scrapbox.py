@@ -1,46 +1,147 @@
+import threading
+import time
+from collections.abc import Iterable, Iterator
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from typing import Any
 
 import requests
 from loguru import logger
+from requests.adapters import HTTPAdapter
 
 from .config import settings
 
+# 混雑・一時的な障害としてリトライするステータス
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class RateLimiter:
+    """
+    スレッドセーフな最小間隔リミッター（1秒あたり rate 回まで）
+    """
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
 
 class ScrapboxClient:
-    def __init__(self):
+    def __init__(self, api_base: str = "https://scrapbox.io/api"):
         self.project = settings.SCRAPBOX_PROJECT
         self.sid = settings.SCRAPBOX_SID
-        self.base_url = f"https://scrapbox.io/api/pages/{self.project}"
+        self.base_url = f"{api_base}/pages/{self.project}"
         self.headers = {}
         if self.sid:
             self.headers["Cookie"] = f"connect.sid={self.sid}"
 
-    def get_all_pages(self) -> list[dict[str, Any]]:
+        self.page_limit = settings.SCRAPBOX_PAGE_LIMIT
+        self.concurrency = settings.SCRAPBOX_CONCURRENCY
+        self.timeout = settings.SCRAPBOX_TIMEOUT
+        # Scrapbox のみにアクセスするので、クライアント単位のリミッターがホスト単位になる
+        self.rate_limiter = RateLimiter(settings.SCRAPBOX_RATE_LIMIT)
+
+        self.max_retries = settings.SCRAPBOX_MAX_RETRIES
+        self.retry_backoff = settings.SCRAPBOX_RETRY_BACKOFF
+        # リトライはリミッターを通すために _get で行う（urllib3 の Retry は使わない）
+        adapter = HTTPAdapter(pool_maxsize=self.concurrency)
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def _get(self, url: str, **kwargs) -> dict[str, Any]:
         """
-        全ページのメタデータを取得し、詳細を取得する
+        GET して JSON を返す。429 / 5xx と接続エラーは、リトライのたびにリミッターを通して
+        バックオフ（Retry-After があればそれに従う）しながらリトライする
         """
-        logger.info(f"Fetching all pages from Scrapbox project: {self.project}")
-        
-        # まずは一覧を取得 (limit=1000としたが、大規模な場合はページネーションが必要)
-        response = requests.get(f"{self.base_url}?limit=1000", headers=self.headers)
-        response.raise_for_status()
-        data = response.json()
-        
-        pages = []
-        for page_meta in data.get("pages", []):
+        for attempt in range(self.max_retries + 1):
+            self.rate_limiter.wait()
+            last = attempt == self.max_retries
             try:
-                page_detail = self.get_page(page_meta["title"])
-                pages.append(page_detail)
-            except Exception as e:
-                logger.error(f"Failed to fetch page {page_meta['title']}: {e}")
-                
-        return pages
+                response = self.session.get(url, timeout=self.timeout, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if last:
+                    raise
+                logger.warning(f"Request to {url} failed, retrying: {e}")
+                time.sleep(self._backoff(attempt))
+                continue
+            if response.status_code in RETRY_STATUSES and not last:
+                logger.warning(f"Request to {url} returned {response.status_code}, retrying")
+                time.sleep(self._backoff(attempt, response.headers.get("Retry-After")))
+                continue
+            response.raise_for_status()
+            return response.json()
+
+    def _backoff(self, attempt: int, retry_after: str | None = None) -> float:
+        if retry_after is not None:
+            try:
+                return max(float(retry_after), 0.0)
+            except ValueError:
+                pass
+        return self.retry_backoff * (2**attempt)
+
+    def iter_page_metas(self) -> Iterator[dict[str, Any]]:
+        """
+        ページ一覧を skip/limit でページネーションしながら取得する
+        """
+        logger.info(f"Listing pages of Scrapbox project: {self.project}")
+        skip = 0
+        while True:
+            data = self._get(self.base_url, params={"skip": skip, "limit": self.page_limit})
+            metas = data.get("pages", [])
+            yield from metas
+
+            skip += len(metas)
+            if not metas or skip >= data.get("count", 0):
+                break
+
+    def iter_pages(
+        self, page_metas: Iterable[dict[str, Any]] | None = None
+    ) -> Iterator[dict[str, Any]]:
+        """
+        ページの詳細を並列（最大 concurrency 件）に取得し、取得できた順に返す
+        """
+        if page_metas is None:
+            page_metas = self.iter_page_metas()
+
+        with ThreadPoolExecutor(
+            max_workers=self.concurrency, thread_name_prefix="scrapbox"
+        ) as executor:
+            pending = set()
+            for page_meta in page_metas:
+                pending.add(executor.submit(self._get_page_or_none, page_meta["title"]))
+                # 先読みしすぎないように、一定数たまったら完了を待つ
+                if len(pending) >= self.concurrency * 2:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    yield from self._completed(done)
+
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                yield from self._completed(done)
+
+    def _completed(self, futures) -> Iterator[dict[str, Any]]:
+        for future in futures:
+            page = future.result()
+            if page is not None:
+                yield page
+
+    def _get_page_or_none(self, title: str) -> dict[str, Any] | None:
+        try:
+            return self.get_page(title)
+        except Exception as e:
+            logger.error(f"Failed to fetch page {title}: {e}")
+            return None
 
     def get_page(self, title: str) -> dict[str, Any]:
         """
         特定のページの詳細を取得する
         """
-        url = f"{self.base_url}/{requests.utils.quote(title)}"
-        response = requests.get(url, headers=self.headers)
-        response.raise_for_status()
-        return response.json()
+        return self._get(f"{self.base_url}/{requests.utils.quote(title, safe='')}")
@@ -0,0 +1,123 @@
+import hashlib
+import json
+import os
+import time
+from typing import Any
+
+from loguru import logger
+
+
+def page_key(page: dict[str, Any]) -> str:
+    """
+    ページを識別するキー（リネームに強い Scrapbox のページ ID を優先する）
+    """
+    return page.get("id") or page["title"]
+
+
+def chunk_id(key: str, index: int) -> str:
+    """
+    チャンクの決定的な Elasticsearch `_id`（同じページ・位置なら常に同じ値）
+    """
+    digest = hashlib.sha1(key.encode("utf-8")).hexdigest()[:20]
+    return f"{digest}-{index}"
+
+
+def content_hash(page: dict[str, Any], *params: Any) -> str:
+    """
+    ページ本文と分割パラメータのハッシュ（どちらかが変われば再処理が必要）
+    """
+    lines = [line.get("text", "") for line in page.get("lines", [])]
+    payload = json.dumps([page.get("title", ""), lines, params], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class SyncState:
+    """
+    前回までの同期状態（最終実行時刻とページごとの updated / ハッシュ / チャンク ID）を
+    ローカルの JSON ファイルに保存する
+    """
+
+    def __init__(self, path: str, data: dict[str, Any] | None = None):
+        self.path = path
+        data = data or {}
+        self.index: str | None = data.get("index")
+        self.last_run: float | None = data.get("last_run")
+        self.pages: dict[str, dict[str, Any]] = data.get("pages", {})
+        # 削除に失敗した、消えたページのチャンク ID（次回の remove_missing で再び返す）
+        self.pending_deletes: list[str] = data.get("pending_deletes", [])
+
+    @classmethod
+    def load(cls, path: str) -> "SyncState":
+        if not os.path.exists(path):
+            return cls(path)
+        try:
+            with open(path, encoding="utf-8") as f:
+                return cls(path, json.load(f))
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable sync state {path}: {e}")
+            return cls(path)
+
+    def save(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        data = {
+            "index": self.index,
+            "last_run": self.last_run,
+            "pages": self.pages,
+            "pending_deletes": self.pending_deletes,
+        }
+        # 途中で落ちても壊れたファイルが残らないように置き換えで書き込む
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def reset(self, index: str):
+        self.index = index
+        self.pages = {}
+        self.pending_deletes = []
+
+    def is_unchanged(self, page_meta: dict[str, Any]) -> bool:
+        entry = self.pages.get(page_key(page_meta))
+        # ハッシュがないページは前回エンコードに失敗したチャンクがあるので再処理する
+        return (
+            entry is not None
+            and entry["content_hash"] is not None
+            and entry["updated"] == page_meta.get("updated")
+        )
+
+    def set_page(
+        self, page: dict[str, Any], page_hash: str | None, chunk_ids: list[str]
+    ) -> list[str]:
+        """
+        ページの状態を更新し、不要になった（前回より多かった）チャンク ID を返す
+        """
+        key = page_key(page)
+        previous = self.pages.get(key, {}).get("chunk_ids", [])
+        self.pages[key] = {
+            "title": page.get("title", ""),
+            "updated": page.get("updated"),
+            "content_hash": page_hash,
+            "chunk_ids": chunk_ids,
+        }
+        current = set(chunk_ids)
+        return [cid for cid in previous if cid not in current]
+
+    def remove_missing(self, present_keys: set[str]) -> list[str]:
+        """
+        Scrapbox から消えたページを状態から除き、削除すべきチャンク ID を返す
+        （前回削除に失敗した ID も含む）
+        """
+        stale_ids, self.pending_deletes = self.pending_deletes, []
+        for key in list(self.pages):
+            if key not in present_keys:
+                stale_ids.extend(self.pages.pop(key)["chunk_ids"])
+        return stale_ids
+
+    def defer_deletes(self, ids: list[str]):
+        """
+        削除に失敗したチャンク ID を、次回の remove_missing で再び削除させる
+        """
+        self.pending_deletes.extend(ids)
+
+    def mark_run(self, started_at: float | None = None):
+        self.last_run = started_at if started_at is not None else time.time()
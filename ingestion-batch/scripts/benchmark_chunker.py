@@ -0,0 +1,93 @@
+"""Compare the fixed-size splitter with the structure-aware chunker.
+
+Reports chunks per page and encoder tokens per page (title and overlap
+included, counted with the encoder's tokenizer via /tokenize), the share of
+chunks longer than one encoder window, and chunking time.
+
+    uv run python -m scripts.benchmark_chunker --export project.json
+    uv run python -m scripts.benchmark_chunker --limit 200
+"""
+
+import argparse
+import itertools
+import json
+import statistics
+import time
+
+from batch.processor import Processor
+from batch.scrapbox import ScrapboxClient
+
+
+def load_pages(args) -> list[dict]:
+    if args.export:
+        with open(args.export, encoding="utf-8") as f:
+            pages = json.load(f)["pages"]
+        pages = pages[: args.limit] if args.limit else pages
+        # エクスポートの lines は文字列の配列なので、API のレスポンスと同じ形にそろえる
+        return [{**page, "lines": [{"text": line} for line in page["lines"]]} for page in pages]
+
+    scrapbox = ScrapboxClient()
+    metas = itertools.islice(scrapbox.iter_page_metas(), args.limit or None)
+    return list(scrapbox.iter_pages(list(metas)))
+
+
+def benchmark(processor: Processor, pages: list[dict], max_length: int) -> dict:
+    chunk_counts = []
+    tokens_per_page = []
+    chunk_tokens = []
+    elapsed = 0.0
+    for page in pages:
+        start = time.perf_counter()
+        chunks = processor.chunk_page(page)
+        elapsed += time.perf_counter() - start
+
+        counts = processor.count_tokens(chunks) if chunks else []
+        chunk_counts.append(len(chunks))
+        tokens_per_page.append(sum(counts))
+        chunk_tokens.extend(counts)
+
+    return {
+        "chunks_per_page": statistics.mean(chunk_counts),
+        "tokens_per_page": statistics.mean(tokens_per_page),
+        "tokens_per_chunk": statistics.mean(chunk_tokens) if chunk_tokens else 0.0,
+        "max_chunk_tokens": max(chunk_tokens, default=0),
+        # 特殊トークン 2 つを含めて1ウィンドウに収まらないチャンクの割合
+        "over_window": sum(t + 2 > max_length for t in chunk_tokens) / max(len(chunk_tokens), 1),
+        # structured は行ごとのトークン数を数える API 呼び出しを含む
+        "ms_per_page": elapsed * 1000 / max(len(pages), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--export", help="Scrapbox export JSON (default: fetch the project)")
+    parser.add_argument("--limit", type=int, default=0, help="Number of pages (0 = all)")
+    args = parser.parse_args()
+
+    processor = Processor()
+    response = processor.session.post(processor.tokenize_url, json={"texts": []})
+    response.raise_for_status()
+    max_length = response.json()["max_length"]
+
+    pages = load_pages(args)
+    print(f"{len(pages)} pages, encoder window {max_length} tokens")
+    print(
+        f"{'chunker':<28} {'chunks/page':>11} {'tokens/page':>11} {'tokens/chunk':>12} "
+        f"{'max':>6} {'>window':>8} {'ms/page':>8}"
+    )
+    configs = {
+        f"fixed ({processor.chunk_size}/{processor.chunk_overlap} chars)": "fixed",
+        f"structured ({processor.chunk_max_tokens} tokens)": "structured",
+    }
+    for label, chunker in configs.items():
+        processor.chunker = chunker
+        result = benchmark(processor, pages, max_length)
+        print(
+            f"{label:<28} {result['chunks_per_page']:>11.2f} {result['tokens_per_page']:>11.1f} "
+            f"{result['tokens_per_chunk']:>12.1f} {result['max_chunk_tokens']:>6} "
+            f"{result['over_window']:>8.1%} {result['ms_per_page']:>8.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
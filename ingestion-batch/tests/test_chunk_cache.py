@@ -0,0 +1,63 @@
+from unittest.mock import MagicMock
+
+from batch.chunk_cache import ChunkCache
+from batch.processor import Processor
+
+
+def test_get_and_set_persist_across_instances(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    cache = ChunkCache(path, max_entries=10, namespace="model-a")
+    assert cache.get("チャンク") is None
+    cache.set("チャンク", {"知識": 1.5})
+    cache.close()
+
+    cache = ChunkCache(path, max_entries=10, namespace="model-a")
+    assert cache.get("チャンク") == {"知識": 1.5}
+    assert cache.stats()["hit_rate"] == 1.0
+    cache.close()
+
+
+def test_namespace_separates_entries(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    cache = ChunkCache(path, max_entries=10, namespace="model-a")
+    cache.set("text", {"a": 1.0})
+    cache.close()
+
+    # エンコーダーの設定が変わると前のベクトルは使われない
+    cache = ChunkCache(path, max_entries=10, namespace="model-b")
+    assert cache.get("text") is None
+    cache.close()
+
+
+def test_evicts_least_recently_used(tmp_path, monkeypatch):
+    clock = iter(range(100))
+    monkeypatch.setattr("batch.chunk_cache.time.time", lambda: next(clock))
+    cache = ChunkCache(str(tmp_path / "cache.sqlite3"), max_entries=2, namespace="m")
+
+    cache.set("a", {"a": 1.0})
+    cache.set("b", {"b": 1.0})
+    assert cache.get("a") is not None
+    cache.set("c", {"c": 1.0})
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.get("c") is not None
+    assert cache.stats()["size"] == 2
+    assert cache.stats()["evictions"] == 1
+    cache.close()
+
+
+def test_processor_consults_cache_before_encoding(tmp_path):
+    cache = ChunkCache(str(tmp_path / "cache.sqlite3"), max_entries=10, namespace="m")
+    processor = Processor(cache=cache)
+    processor.get_sparse_vectors = MagicMock(side_effect=lambda texts: [{t: 1.0} for t in texts])
+
+    assert processor.encode_chunks(["a", "b"]) == [{"a": 1.0}, {"b": 1.0}]
+    # キャッシュにないチャンクだけを API に送る
+    assert processor.encode_chunks(["b", "c"]) == [{"b": 1.0}, {"c": 1.0}]
+    processor.get_sparse_vectors.assert_called_with(["c"])
+
+    processor.get_sparse_vectors.reset_mock()
+    assert processor.encode_chunks(["a", "c"]) == [{"a": 1.0}, {"c": 1.0}]
+    processor.get_sparse_vectors.assert_not_called()
+    cache.close()
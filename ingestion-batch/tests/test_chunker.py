@@ -0,0 +1,79 @@
+from batch.chunker import StructuredChunker, split_blocks
+
+
+def count_chars(texts):
+    return [len(text) for text in texts]
+
+
+def make_page(*lines, title="タイトル"):
+    return {"title": title, "lines": [{"text": title}, *({"text": line} for line in lines)]}
+
+
+def test_split_blocks_groups_indented_children_and_code():
+    lines = [
+        "段落",
+        " 子要素",
+        "  孫要素",
+        "",
+        "code:example.py",
+        " def f():",
+        "  return 1",
+        "[* 見出し]",
+        "本文",
+    ]
+
+    assert split_blocks(lines) == [(0, 3, False), (4, 7, False), (7, 8, True), (8, 9, False)]
+
+
+def test_chunks_prepend_title_and_respect_budget():
+    chunker = StructuredChunker(count_chars, max_tokens=14)
+    page = make_page("a" * 5, "b" * 5, "c" * 5)
+
+    # タイトル (4) を除いた 10 に本文を詰める
+    assert chunker.chunk_page(page) == [
+        "タイトル\n" + "a" * 5 + "\n" + "b" * 5,
+        "タイトル\n" + "c" * 5,
+    ]
+
+
+def test_blocks_are_not_split_and_headings_start_new_chunks():
+    chunker = StructuredChunker(count_chars, max_tokens=100)
+    page = make_page(
+        "intro", "[* 見出し1]", "[** 見出し2]", "code:a.py", " x = 1", "[* 次]", "本文"
+    )
+
+    assert chunker.chunk_page(page) == [
+        "タイトル\nintro",
+        "タイトル\n[* 見出し1]\n[** 見出し2]\ncode:a.py\n x = 1",
+        "タイトル\n[* 次]\n本文",
+    ]
+
+
+def test_oversized_blocks_and_lines_are_split():
+    chunker = StructuredChunker(count_chars, max_tokens=14)
+    page = make_page("code:a.py", " " + "x" * 8, " " + "y" * 8, "z" * 25)
+
+    chunks = chunker.chunk_page(page)
+
+    assert chunks[:3] == ["タイトル\ncode:a.py", "タイトル\n " + "x" * 8, "タイトル\n " + "y" * 8]
+    assert "".join(chunk.removeprefix("タイトル\n") for chunk in chunks[3:]) == "z" * 25
+    assert all(len(chunk) - len("タイトル\n") <= 10 for chunk in chunks)
+
+
+def test_counts_tokens_once_per_page():
+    calls = []
+
+    def count_tokens(texts):
+        calls.append(texts)
+        return count_chars(texts)
+
+    chunker = StructuredChunker(count_tokens, max_tokens=50)
+    chunker.chunk_page(make_page(*[f"line {i}" for i in range(100)]))
+
+    assert len(calls) == 1
+
+
+def test_title_only_page():
+    chunker = StructuredChunker(count_chars, max_tokens=50)
+    assert chunker.chunk_page(make_page()) == ["タイトル"]
+    assert chunker.chunk_page({"title": "", "lines": []}) == []
@@ -0,0 +1,99 @@
+from unittest.mock import MagicMock
+
+import pytest
+
+from batch.elasticsearch_client import ESClient, delete_action, index_action
+
+OLD_VERSIONS = [
+    "scrapbox-pages-20260101000000",
+    "scrapbox-pages-20260102000000",
+    "scrapbox-pages-20260103000000",
+]
+
+
+@pytest.fixture
+def client():
+    es = ESClient()
+    es.es = MagicMock()
+    return es
+
+
+def test_create_index_builds_a_new_version_without_touching_live_index(client):
+    name = client.create_index()
+
+    assert name.startswith("scrapbox-pages-")
+    assert client.index_name == name
+    client.es.indices.delete.assert_not_called()
+    kwargs = client.es.indices.create.call_args.kwargs
+    assert kwargs["index"] == name
+    assert kwargs["settings"] == {"number_of_replicas": 0, "refresh_interval": "-1"}
+    assert kwargs["mappings"]["properties"]["sparse_vector"] == {"type": "rank_features"}
+
+
+def test_publish_swaps_alias_atomically_and_prunes_old_versions(client):
+    live = OLD_VERSIONS[-1]
+    client.index_name = "scrapbox-pages-20260104000000"
+    client.es.indices.exists_alias.return_value = True
+    client.es.indices.get_alias.side_effect = [{live: {}}, {client.index_name: {}}]
+    client.es.indices.get.return_value = dict.fromkeys(
+        [*OLD_VERSIONS, client.index_name, "scrapbox-pages-backup"]
+    )
+
+    client.publish()
+
+    settings = client.es.indices.put_settings.call_args.kwargs["settings"]
+    assert settings["refresh_interval"] != "-1"
+    client.es.options.return_value.indices.forcemerge.assert_called_once()
+    client.es.indices.update_aliases.assert_called_once_with(
+        actions=[
+            {"remove": {"index": live, "alias": "scrapbox-pages"}},
+            {"add": {"index": client.index_name, "alias": "scrapbox-pages"}},
+        ]
+    )
+    # 公開中以外の新しい 2 つを残す（命名規則に合わないインデックスは消さない）
+    client.es.indices.delete.assert_called_once_with(index=OLD_VERSIONS[0])
+
+
+def test_publish_replaces_legacy_concrete_index(client):
+    client.index_name = "scrapbox-pages-20260104000000"
+    client.es.indices.exists_alias.side_effect = [False, True]
+    client.es.indices.exists.return_value = True
+    client.es.indices.get_alias.return_value = {client.index_name: {}}
+    client.es.indices.get.return_value = {client.index_name: {}}
+
+    client.publish()
+
+    actions = client.es.indices.update_aliases.call_args.kwargs["actions"]
+    assert actions[0] == {"remove_index": {"index": "scrapbox-pages"}}
+
+
+def test_discard_keeps_published_index(client):
+    client.discard()
+    client.es.indices.delete.assert_not_called()
+
+    client.index_name = "scrapbox-pages-20260104000000"
+    client.es.indices.exists_alias.return_value = True
+    client.es.indices.get_alias.return_value = {OLD_VERSIONS[-1]: {}}
+    client.discard()
+    client.es.indices.delete.assert_called_once_with(
+        index=client.index_name, ignore_unavailable=True
+    )
+
+
+def test_bulk_collects_item_failures_but_ignores_missing_deletes(client, monkeypatch):
+    streaming_bulk = MagicMock(
+        return_value=[
+            (False, {"index": {"_id": "a-0", "status": 400, "error": {"type": "mapper"}}}),
+            (False, {"delete": {"_id": "b-0", "status": 404, "result": "not_found"}}),
+        ]
+    )
+    monkeypatch.setattr("batch.elasticsearch_client.helpers.streaming_bulk", streaming_bulk)
+
+    failures = client.bulk([index_action({"_id": "a-0", "text": "t"}), delete_action("b-0")])
+
+    assert failures == [{"op": "index", "_id": "a-0", "status": 400, "error": {"type": "mapper"}}]
+    assert client.failures == failures
+    kwargs = streaming_bulk.call_args.kwargs
+    assert kwargs["index"] == client.index_name
+    assert kwargs["max_retries"] > 0
+    assert kwargs["raise_on_error"] is False
@@ -0,0 +1,148 @@
+from unittest.mock import MagicMock
+
+import pytest
+
+from batch.pipeline import Indexer, Pipeline
+from batch.processor import Processor
+from batch.sync_state import SyncState, chunk_id
+
+
+def make_page(page_id, updated, text):
+    return {"id": page_id, "title": page_id, "updated": updated, "lines": [{"text": text}]}
+
+
+def make_pipeline(state, **kwargs):
+    processor = Processor()
+    processor.chunker = "fixed"
+    processor.chunk_size = 4
+    processor.chunk_overlap = 0
+    processor.get_sparse_vectors = MagicMock(side_effect=lambda texts: [{t: 1.0} for t in texts])
+    es = MagicMock()
+    es.bulk.return_value = []
+    options = {"encoder_workers": 2, "encode_batch_size": 3, "queue_size": 2, "bulk_max_docs": 4}
+    return Pipeline(processor, es, state, **{**options, **kwargs}), processor, es
+
+
+def bulk_ids(es, op_type="index"):
+    actions = [action for call in es.bulk.call_args_list for action in call.args[0]]
+    return sorted(action["_id"] for action in actions if action["_op_type"] == op_type)
+
+
+def test_pipeline_indexes_all_chunks_across_batches():
+    state = SyncState("unused.json")
+    pipeline, processor, es = make_pipeline(state)
+    pages = [make_page(f"p{i}", 1, "abcdefghij") for i in range(10)]
+
+    report = pipeline.run(iter(pages))
+
+    assert report["pages"] == 10
+    assert report["documents"] == 30
+    assert bulk_ids(es) == sorted(chunk_id(f"p{i}", j) for i in range(10) for j in range(3))
+    # チャンクはページをまたいでバッチにまとめられる
+    assert max(len(call.args[0]) for call in processor.get_sparse_vectors.call_args_list) == 3
+    assert report["stages"]["encode"]["items"] == 30
+    assert report["queues"]["pages"]["capacity"] == 2
+    assert state.pages["p0"]["chunk_ids"] == [chunk_id("p0", j) for j in range(3)]
+
+
+def test_pipeline_skips_unchanged_content_and_retries_failures():
+    state = SyncState("unused.json")
+    pipeline, processor, es = make_pipeline(state)
+    pipeline.run([make_page("p1", 1, "abcd"), make_page("p2", 1, "efgh")])
+
+    # updated だけが変わったページは再エンコードせず、失敗したページはハッシュを残さない
+    pipeline, processor, es = make_pipeline(state)
+    processor.get_sparse_vectors = MagicMock(side_effect=lambda texts: [{} for _ in texts])
+    report = pipeline.run([make_page("p1", 2, "abcd"), make_page("p2", 2, "ijkl")])
+
+    assert report["unchanged"] == 1
+    assert report["failed_chunks"] == 1
+    processor.get_sparse_vectors.assert_called_once_with(["ijkl"])
+    assert state.pages["p1"]["updated"] == 2
+    assert state.pages["p2"]["content_hash"] is None
+    # 古いチャンクは削除される
+    assert bulk_ids(es, "delete") == [chunk_id("p2", 0)]
+
+
+def test_pipeline_stops_when_a_stage_fails():
+    state = SyncState("unused.json")
+    pipeline, processor, es = make_pipeline(state)
+    es.bulk.side_effect = RuntimeError("es down")
+    pages = [make_page(f"p{i}", 1, "abcdefghij") for i in range(50)]
+
+    with pytest.raises(RuntimeError, match="es down"):
+        pipeline.run(iter(pages))
+
+
+def test_indexer_flushes_by_bytes_and_reports_failed_pages():
+    es = MagicMock()
+    es.bulk.return_value = [{"op": "index", "_id": "a-0", "status": 400, "error": "bad"}]
+    failed_pages = []
+    indexer = Indexer(
+        es, max_docs=100, max_bytes=1000, on_failure=lambda key, _: failed_pages.append(key)
+    )
+
+    indexer.add([{"_id": "a-0", "text": "x" * 100}], owner="a")
+    es.bulk.assert_not_called()
+    # 件数は少なくても、バイト数が上限を超えたら送る
+    indexer.add([{"_id": "b-0", "text": "x" * 1000}], ["c-0"], owner="b")
+    (actions,) = es.bulk.call_args.args
+    assert [action["_op_type"] for action in actions] == ["index", "index", "delete"]
+    assert failed_pages == ["a"]
+
+
+def test_pipeline_retries_pages_whose_documents_failed_to_index():
+    state = SyncState("unused.json")
+    pipeline, processor, es = make_pipeline(state)
+    es.bulk.side_effect = lambda actions: [
+        {"op": "index", "_id": action["_id"], "status": 400, "error": "mapper_parsing_exception"}
+        for action in actions
+        if action["_id"] == chunk_id("p1", 0)
+    ]
+
+    report = pipeline.run([make_page("p1", 1, "abcd"), make_page("p2", 1, "efgh")])
+
+    assert report["index_failures"] == 1
+    assert state.pages["p1"]["content_hash"] is None
+    assert state.pages["p2"]["content_hash"] is not None
+
+
+def test_pipeline_retries_failed_stale_chunk_deletes():
+    state = SyncState("unused.json")
+    pipeline, processor, es = make_pipeline(state)
+    pipeline.run([make_page("p1", 1, "abcdefgh")])
+
+    # チャンクが減ったときの古いチャンクの削除に失敗した
+    pipeline, processor, es = make_pipeline(state)
+    es.bulk.side_effect = lambda actions: [
+        {"op": "delete", "_id": action["_id"], "status": 500, "error": "timeout"}
+        for action in actions
+        if action["_op_type"] == "delete"
+    ]
+    pipeline.run([make_page("p1", 2, "abcd")])
+
+    assert state.pages["p1"]["content_hash"] is None
+    assert chunk_id("p1", 1) in state.pages["p1"]["chunk_ids"]
+
+    # 次回は再処理され、古いチャンクを改めて削除する
+    pipeline, processor, es = make_pipeline(state)
+    pipeline.run([make_page("p1", 2, "abcd")])
+
+    assert bulk_ids(es, "delete") == [chunk_id("p1", 1)]
+    assert state.pages["p1"]["chunk_ids"] == [chunk_id("p1", 0)]
+
+
+def test_pipeline_rechunks_pages_chunked_without_token_counts():
+    state = SyncState("unused.json")
+    pipeline, processor, es = make_pipeline(state)
+    processor.chunker = "structured"
+    processor.chunk_max_tokens = 100
+    processor.session = MagicMock()
+    processor.session.post.side_effect = ConnectionError("tokenize down")
+
+    report = pipeline.run([make_page("p1", 1, "abcd")])
+
+    # 文字数で分割して登録するが、次回もう一度処理する
+    assert report["documents"] == 1
+    assert state.pages["p1"]["content_hash"] is None
+    assert not state.is_unchanged({"id": "p1", "updated": 1})
@@ -1,4 +1,13 @@
+import json
+import struct
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import MagicMock
+
+from batch.pipeline import Pipeline
 from batch.processor import Processor
+from batch.report import write_jsonl
+from batch.sync_state import SyncState
 
 
 def test_split_text():
@@ -19,3 +28,100 @@ def test_split_text_empty():
     processor = Processor()
     chunks = processor.split_text("")
     assert chunks == []
+
+def test_get_sparse_vectors_binary():
+    processor = Processor()
+    processor.binary = True
+    processor._vocab = ["[PAD]", "スク", "##ラップ", "知識"]
+
+    content = struct.pack("<I", 2) + struct.pack("<I", 2)
+    content += struct.pack("<2i", 3, 1) + struct.pack("<2e", 1.5, 0.5)
+    content += struct.pack("<I", 1) + struct.pack("<i", 2) + struct.pack("<e", 0.25)
+    response = MagicMock()
+    response.headers = {"content-type": "application/x-splade-sparse; dtype=float16"}
+    response.content = content
+    mock_post = MagicMock(return_value=response)
+    processor.session.post = mock_post
+
+    assert processor.get_sparse_vectors(["text", "more"]) == [
+        {"知識": 1.5, "スク": 0.5},
+        {"##ラップ": 0.25},
+    ]
+    assert mock_post.call_args.args[0].endswith("/encode_batch")
+    assert mock_post.call_args.kwargs["json"] == {"texts": ["text", "more"]}
+    assert "application/x-splade-sparse" in mock_post.call_args.kwargs["headers"]["Accept"]
+
+def test_get_sparse_vectors_json_fallback():
+    processor = Processor()
+    response = MagicMock()
+    response.headers = {"content-type": "application/json"}
+    response.json.return_value = {"sparse_vectors": [{"知識": 1.0}]}
+    processor.session.post = MagicMock(return_value=response)
+
+    assert processor.get_sparse_vectors(["text"]) == [{"知識": 1.0}]
+
+
+class StubEncoder(BaseHTTPRequestHandler):
+    """/encode_batch のスタブ（最初の1回だけ Retry-After 付きの 503 を返す）"""
+
+    calls = 0
+
+    def do_POST(self):
+        StubEncoder.calls += 1
+        texts = json.loads(self.rfile.read(int(self.headers["Content-Length"])))["texts"]
+        if StubEncoder.calls == 1:
+            return self._json({"detail": "overloaded"}, status=503, retry_after="0")
+        return self._json({"sparse_vectors": [{text: 1.0} for text in texts]})
+
+    def _json(self, body, status=200, retry_after=None):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        if retry_after is not None:
+            self.send_header("Retry-After", retry_after)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+def test_get_sparse_vectors_retries_transient_errors():
+    StubEncoder.calls = 0
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubEncoder)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        processor = Processor()
+        processor.binary = False
+        processor.splade_batch_url = f"http://127.0.0.1:{server.server_port}/encode_batch"
+
+        assert processor.get_sparse_vectors(["a", "b"]) == [{"a": 1.0}, {"b": 1.0}]
+        assert StubEncoder.calls == 2
+    finally:
+        server.shutdown()
+
+
+def test_failed_chunks_are_written_as_dead_letters(tmp_path):
+    processor = Processor()
+    processor.chunker = "fixed"
+    processor.get_sparse_vectors = MagicMock(side_effect=RuntimeError("encoder down"))
+    es = MagicMock()
+    es.bulk.return_value = []
+    pipeline = Pipeline(processor, es, SyncState("unused.json"), encoder_workers=1)
+    page = {"id": "p1", "title": "A", "lines": [{"text": "hello"}]}
+
+    report = pipeline.run([page])
+    assert report["failed_chunks"] == 1
+    assert report["documents"] == 0
+
+    path = tmp_path / "dead_letters.jsonl"
+    write_jsonl(str(path), processor.dead_letters, "failed chunks")
+    (entry,) = [json.loads(line) for line in path.read_text().splitlines()]
+    assert entry == {
+        "page": "p1",
+        "title": "A",
+        "chunk_index": 0,
+        "text": "hello",
+        "error": "encoder down",
+    }
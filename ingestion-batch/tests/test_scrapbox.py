@@ -0,0 +1,110 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+import pytest
+
+from batch.scrapbox import RateLimiter, ScrapboxClient
+
+TITLES = [f"page/{i}" for i in range(7)]
+
+
+class StubScrapbox(BaseHTTPRequestHandler):
+    """Scrapbox API のスタブ（一覧はページネーション、詳細は初回だけ 503 を返すページあり）"""
+
+    requests_seen = []
+    failed_once = set()
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        self.requests_seen.append(self.path)
+        prefix = "/api/pages/test-project"
+        if url.path == prefix:
+            query = parse_qs(url.query)
+            skip, limit = int(query["skip"][0]), int(query["limit"][0])
+            pages = [{"title": t} for t in TITLES[skip : skip + limit]]
+            return self._json({"skip": skip, "count": len(TITLES), "pages": pages})
+
+        title = unquote(url.path[len(prefix) + 1 :])
+        if title == "page/3" and title not in self.failed_once:
+            self.failed_once.add(title)
+            return self._json({"message": "busy"}, status=503)
+        if title not in TITLES:
+            return self._json({"message": "not found"}, status=404)
+        return self._json({"title": title, "lines": [{"text": title}]})
+
+    def _json(self, body, status=200):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def scrapbox_server():
+    StubScrapbox.requests_seen = []
+    StubScrapbox.failed_once = set()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubScrapbox)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}/api"
+    server.shutdown()
+
+
+@pytest.fixture
+def client(scrapbox_server, monkeypatch):
+    monkeypatch.setattr("batch.scrapbox.settings.SCRAPBOX_PROJECT", "test-project")
+    monkeypatch.setattr("batch.scrapbox.settings.SCRAPBOX_PAGE_LIMIT", 3)
+    monkeypatch.setattr("batch.scrapbox.settings.SCRAPBOX_CONCURRENCY", 3)
+    monkeypatch.setattr("batch.scrapbox.settings.SCRAPBOX_RATE_LIMIT", 0)
+    monkeypatch.setattr("batch.scrapbox.settings.SCRAPBOX_RETRY_BACKOFF", 0)
+    return ScrapboxClient(api_base=scrapbox_server)
+
+
+def test_iter_page_metas_paginates(client):
+    titles = [meta["title"] for meta in client.iter_page_metas()]
+
+    assert titles == TITLES
+    listing = [p for p in StubScrapbox.requests_seen if "?" in p]
+    assert len(listing) == 3
+
+
+def test_iter_pages_fetches_all_details_with_retry(client):
+    pages = list(client.iter_pages())
+
+    # 順不同で全ページ取得でき、503 になったページもリトライで取得できる
+    assert sorted(page["title"] for page in pages) == TITLES
+    assert StubScrapbox.failed_once == {"page/3"}
+
+
+def test_iter_pages_skips_failed_pages(client):
+    pages = list(client.iter_pages([{"title": "page/0"}, {"title": "missing"}]))
+
+    assert [page["title"] for page in pages] == ["page/0"]
+
+
+def test_retries_go_through_rate_limiter(client):
+    calls = []
+    client.rate_limiter.wait = lambda: calls.append(time.monotonic())
+
+    pages = list(client.iter_pages([{"title": "page/3"}]))
+
+    # 503 のあとのリトライもリミッターを通る
+    assert [page["title"] for page in pages] == ["page/3"]
+    assert len(calls) == 2
+
+
+def test_rate_limiter_spaces_requests():
+    limiter = RateLimiter(rate=50)
+    start = time.monotonic()
+    for _ in range(5):
+        limiter.wait()
+    # 5 回目は最初から 4 間隔（80ms）後
+    assert time.monotonic() - start >= 0.075
@@ -0,0 +1,67 @@
+from batch.sync_state import SyncState, chunk_id, content_hash
+
+
+def make_page(page_id, title, updated, text):
+    return {"id": page_id, "title": title, "updated": updated, "lines": [{"text": text}]}
+
+
+def test_chunk_id_is_deterministic():
+    assert chunk_id("page-1", 0) == chunk_id("page-1", 0)
+    assert chunk_id("page-1", 0) != chunk_id("page-1", 1)
+    assert chunk_id("page-1", 0) != chunk_id("page-2", 0)
+
+
+def test_content_hash_depends_on_text_and_params():
+    page = make_page("p1", "A", 1, "hello")
+    assert content_hash(page, 500, 50) == content_hash(dict(page, updated=2), 500, 50)
+    assert content_hash(page, 500, 50) != content_hash(page, 400, 50)
+    assert content_hash(page, 500, 50) != content_hash(make_page("p1", "A", 1, "bye"), 500, 50)
+
+
+def test_is_unchanged_and_set_page(tmp_path):
+    state = SyncState(str(tmp_path / "state.json"))
+    page = make_page("p1", "A", 10, "hello")
+    assert not state.is_unchanged(page)
+
+    assert state.set_page(page, "h", ["p1-0", "p1-1", "p1-2"]) == []
+    assert state.is_unchanged({"id": "p1", "title": "A", "updated": 10})
+    assert not state.is_unchanged({"id": "p1", "title": "A", "updated": 11})
+
+    # チャンク数が減った分は削除対象になる
+    assert state.set_page(page, None, ["p1-0"]) == ["p1-1", "p1-2"]
+    # ハッシュがない（失敗したチャンクがある）ページは再処理する
+    assert not state.is_unchanged(page)
+
+
+def test_remove_missing():
+    state = SyncState("unused.json")
+    state.set_page(make_page("p1", "A", 1, "a"), "h1", ["a-0"])
+    state.set_page(make_page("p2", "B", 1, "b"), "h2", ["b-0", "b-1"])
+
+    assert state.remove_missing({"p1"}) == ["b-0", "b-1"]
+    assert list(state.pages) == ["p1"]
+
+    # 削除に失敗した ID は次回もう一度返す
+    state.defer_deletes(["b-1"])
+    assert state.remove_missing({"p1"}) == ["b-1"]
+    assert state.remove_missing({"p1"}) == []
+
+
+def test_save_and_load_roundtrip(tmp_path):
+    path = str(tmp_path / "nested" / "state.json")
+    state = SyncState(path)
+    state.reset("scrapbox-pages")
+    state.set_page(make_page("p1", "ページ", 1, "a"), "h1", ["a-0"])
+    state.mark_run(123.0)
+    state.save()
+
+    loaded = SyncState.load(path)
+    assert loaded.index == "scrapbox-pages"
+    assert loaded.last_run == 123.0
+    assert loaded.pages == state.pages
+
+
+def test_load_ignores_broken_file(tmp_path):
+    path = tmp_path / "state.json"
+    path.write_text("{broken")
+    assert SyncState.load(str(path)).pages == {}
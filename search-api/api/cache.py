@@ -0,0 +1,168 @@
+import asyncio
+import hashlib
+import re
+import time
+import unicodedata
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+from loguru import logger
+
+from .config import settings
+from .models import SearchResult
+
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    件数の上限と有効期限つきの LRU キャッシュ。
+
+    get_or_compute は同じキーの計算が実行中ならその結果を待ち、
+    同時に届いた同じリクエストで計算を1回にまとめる。
+    """
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: OrderedDict[Any, tuple[float, Any]] = OrderedDict()
+        self._inflight: dict[Any, asyncio.Future] = {}
+        # clear() の前に始まった計算の結果は保存しない
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def get(self, key, default=None):
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            self.misses += 1
+            return default
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key, value):
+        if self.max_entries <= 0 or self.ttl <= 0:
+            return
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def get_or_compute(
+        self,
+        key,
+        compute: Callable[[], Awaitable[Any]],
+        cache_if: Callable[[Any], bool] | None = None,
+    ):
+        """
+        cache_if が False を返した結果は、待っているリクエストには返すが保存しない
+        """
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+
+        future = self._inflight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(compute())
+            self._inflight[key] = future
+            generation = self._generation
+            future.add_done_callback(
+                lambda done: self._finish(key, done, generation, cache_if)
+            )
+        else:
+            self.coalesced += 1
+        # 待っている1つのリクエストが切断されても、共有している計算は止めない
+        return await asyncio.shield(future)
+
+    def _finish(self, key, future: asyncio.Future, generation: int, cache_if):
+        if self._inflight.get(key) is future:
+            del self._inflight[key]
+        if future.cancelled() or future.exception() is not None:
+            return
+        if generation != self._generation:
+            return
+        if cache_if is None or cache_if(future.result()):
+            self.set(key, future.result())
+
+    def clear(self):
+        self._entries.clear()
+        self._inflight.clear()
+        self._generation += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+def normalize_query(query: str) -> str:
+    # 全角・半角、大文字・小文字、空白の違いは同じクエリとみなす
+    query = unicodedata.normalize("NFKC", query).casefold()
+    return re.sub(r"\s+", " ", query).strip()
+
+
+def context_key(contexts: list[SearchResult]) -> tuple[str, ...]:
+    return tuple(
+        c.id or hashlib.sha1(c.text.encode("utf-8")).hexdigest() for c in contexts
+    )
+
+
+class ChatCache:
+    """
+    /chat の2段のキャッシュ。
+
+    - retrieval: 正規化したクエリ -> (スパースベクトル, 検索結果)
+    - answers: (クエリ, コンテキストの ID, モデル, プロンプトのバージョン, 戦略) -> 回答
+
+    検索対象のインデックス（エイリアスの向き先）か、その内容が変わったら両方を捨てる。
+    """
+
+    def __init__(self):
+        self.retrieval = TTLCache(
+            settings.RETRIEVAL_CACHE_MAX_ENTRIES, settings.RETRIEVAL_CACHE_TTL
+        )
+        self.answers = TTLCache(
+            settings.ANSWER_CACHE_MAX_ENTRIES, settings.ANSWER_CACHE_TTL
+        )
+        self.index_version: str | None = None
+        self._checked_at = float("-inf")
+
+    async def check_index_version(self, get_version: Callable[[], Awaitable[str]]):
+        now = time.monotonic()
+        if now - self._checked_at < settings.CACHE_VERSION_CHECK_INTERVAL:
+            return
+        self._checked_at = now
+        try:
+            version = await get_version()
+        except Exception as e:
+            logger.warning(f"Failed to resolve index version: {e}")
+            return
+        if version != self.index_version:
+            if self.index_version is not None:
+                logger.info(
+                    f"Index changed ({self.index_version} -> {version}), "
+                    "clearing caches"
+                )
+            self.retrieval.clear()
+            self.answers.clear()
+            self.index_version = version
+
+    def stats(self) -> dict:
+        return {
+            "index_version": self.index_version,
+            "retrieval": self.retrieval.stats(),
+            "answers": self.answers.stats(),
+        }
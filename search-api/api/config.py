@@ -1,21 +1,97 @@
 from pydantic import Field
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
+from .models import AnswerStrategy, Fusion, Scoring, SearchMode
+
 
 class Settings(BaseSettings):
     model_config = SettingsConfigDict(env_file=".env", extra="ignore")
 
     ELASTICSEARCH_URL: str = Field(default="http://localhost:9200")
     ELASTICSEARCH_INDEX: str = Field(default="scrapbox-pages")
+    ELASTICSEARCH_MAX_CONNECTIONS: int = Field(default=10)
+    # LLM に渡す検索結果の数
+    SEARCH_TOP_K: int = Field(default=5)
+    # 同じページのチャンクをまとめたり多様性を考慮したりするために、
+    # SEARCH_TOP_K の何倍を取得するか（1 で多めに取らない）
+    SEARCH_OVERFETCH: int = Field(default=4)
+    # 同じページ（url）で隣り合うチャンクを、重なりを除いて1つにまとめる
+    SEARCH_COLLAPSE_BY_PAGE: bool = Field(default=True)
+    # まとめる連続チャンクの数の上限（スコアの高いチャンクを中心に残す、0 で無制限）
+    SEARCH_MERGE_MAX_CHUNKS: int = Field(default=3)
+    # MMR の関連度の重み（1.0 で MMR を使わずスコア順）
+    SEARCH_MMR_LAMBDA: float = Field(default=0.7)
+    # クエリに使う語の数の上限（重みの大きい順、0 で無制限）と重みの下限
+    SEARCH_MAX_QUERY_TERMS: int = Field(default=64)
+    SEARCH_MIN_TERM_WEIGHT: float = Field(default=0.0)
+    # スコアの計算方法（"saturation" / "linear" / "sparse_vector"）
+    SEARCH_SCORING: Scoring = Field(default="saturation")
+    # ヒット件数を数えない（上位 k 件だけなら不要で、早く打ち切れる）
+    SEARCH_TRACK_TOTAL_HITS: bool = Field(default=False)
+    # 検索方法（"sparse" / "hybrid" / "bm25"）
+    SEARCH_MODE: SearchMode = Field(default="sparse")
+    # hybrid での融合方法（"rrf" / "weighted"）
+    SEARCH_FUSION: Fusion = Field(default="rrf")
+    SEARCH_RRF_K: int = Field(default=60)
+    # weighted での BM25 の重み（SPLADE は 1 - この値）
+    SEARCH_BM25_WEIGHT: float = Field(default=0.3)
+    # hybrid でそれぞれの検索から取る候補数
+    SEARCH_CANDIDATES: int = Field(default=20)
     
     SPLADE_API_URL: str = Field(default="http://localhost:8000/encode")
+    # "binary" はトークンIDと重みの配列で受け取る（"json" は従来の辞書形式）
+    SPLADE_RESPONSE_FORMAT: str = Field(default="binary")
+    SPLADE_TIMEOUT: float = Field(default=30.0)
+    # SPLADE が遅い・落ちているときは BM25 だけで検索する
+    SPLADE_FALLBACK_TO_BM25: bool = Field(default=True)
+    # これより時間がかかったら SPLADE を待たずに BM25 で検索する（秒）
+    SPLADE_FAST_PATH_TIMEOUT: float = Field(default=2.0)
+    # 連続してこの回数失敗したら、SPLADE_COOLDOWN 秒の間は SPLADE を呼ばない
+    SPLADE_FAILURE_THRESHOLD: int = Field(default=3)
+    SPLADE_COOLDOWN: float = Field(default=30.0)
     
     # LLM設定
     LLM_API_BASE: str = Field(default="http://localhost:11434/v1")
     LLM_API_KEY: str = Field(default="ollama")
     LLM_MODEL_NAME: str = Field(default="gemma3:4b")
+    LLM_TIMEOUT: float = Field(default=60.0)
+
+    # SPLADE / LLM への HTTP コネクションプールの設定（起動時に作り、終了時に閉じる）
+    HTTP_MAX_CONNECTIONS: int = Field(default=100)
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = Field(default=20)
+    HTTP_KEEPALIVE_EXPIRY: float = Field(default=30.0)
+    HTTP_CONNECT_TIMEOUT: float = Field(default=5.0)
+    # HTTP/2 を使う（h2 パッケージが必要: uv sync --extra http2）
+    HTTP2_ENABLED: bool = Field(default=False)
     
     # チャンク処理の設定
-    LLM_CONTEXT_CHUNK_SIZE: int = Field(default=3)
+    # LLM のコンテキスト長。ここから回答用のトークン数を除いた分までプロンプトに詰める
+    LLM_CONTEXT_WINDOW: int = Field(default=8192)
+    # 回答の最大トークン数（max_tokens として LLM にも渡す）
+    LLM_MAX_ANSWER_TOKENS: int = Field(default=1024)
+    # 1つのコンテキストのトークン数の上限（超える分は切り詰める、0 で予算まで）
+    LLM_MAX_CONTEXT_TOKENS: int = Field(default=2048)
+    # トークン数を数えるトークナイザー（tokenizer.json のパスか HF のモデル名）
+    # 未設定や tokenizers がない場合は文字数から概算する（uv sync --extra tokenizer）
+    LLM_TOKENIZER: str | None = Field(default=None)
+    # 1回の呼び出しに渡すコンテキストの数の上限（0 でトークン数だけで決める）
+    LLM_CONTEXT_CHUNK_SIZE: int = Field(default=0)
+    # 回答の生成方法
+    # "refine": チャンクごとに順に回答を更新する
+    # "map_reduce": チャンクごとの部分回答を並行して作り、最後に統合する
+    # "stuff": 1回の呼び出しに入る分だけをプロンプトに詰めて1回で回答する
+    LLM_ANSWER_STRATEGY: AnswerStrategy = Field(default="refine")
+    # map_reduce で同時に LLM を呼び出す数
+    LLM_MAX_CONCURRENCY: int = Field(default=4)
+
+    # キャッシュの設定（件数か TTL を 0 にすると保存しない）
+    # クエリ -> スパースベクトルと検索結果
+    RETRIEVAL_CACHE_MAX_ENTRIES: int = Field(default=1024)
+    RETRIEVAL_CACHE_TTL: float = Field(default=300.0)
+    # (クエリ, コンテキスト, モデル, プロンプト) -> 回答
+    ANSWER_CACHE_MAX_ENTRIES: int = Field(default=256)
+    ANSWER_CACHE_TTL: float = Field(default=600.0)
+    # インデックスのエイリアスの向き先を確認する間隔（秒）。変わったらキャッシュを捨てる
+    CACHE_VERSION_CHECK_INTERVAL: float = Field(default=10.0)
 
 settings = Settings()
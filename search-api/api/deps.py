@@ -1,11 +1,30 @@
+from .cache import ChatCache
 from .encoder import SpladeClient
 from .llm import LLMClient
 from .search import SearchClient
 
-# Singleton-like instances
-_search_client = SearchClient()
-_splade_client = SpladeClient()
-_llm_client = LLMClient()
+# Singleton-like instances, created on startup and closed on shutdown
+# so that connection pools are reused across requests
+_search_client: SearchClient | None = None
+_splade_client: SpladeClient | None = None
+_llm_client: LLMClient | None = None
+_chat_cache: ChatCache | None = None
+
+
+def startup():
+    global _search_client, _splade_client, _llm_client, _chat_cache
+    _search_client = SearchClient()
+    _splade_client = SpladeClient()
+    _llm_client = LLMClient()
+    _chat_cache = ChatCache()
+
+
+async def shutdown():
+    global _search_client, _splade_client, _llm_client
+    for client in (_search_client, _splade_client, _llm_client):
+        if client is not None:
+            await client.close()
+    _search_client = _splade_client = _llm_client = None
 
 
 def get_search_client():
@@ -18,3 +37,7 @@ def get_splade_client():
 
 def get_llm_client():
     return _llm_client
+
+
+def get_chat_cache():
+    return _chat_cache
@@ -0,0 +1,153 @@
+import math
+from collections import Counter
+
+from .config import settings
+from .models import SearchResult
+
+# 隣り合うチャンクの重なりとみなす最小の文字数（偶然の一致を避ける）
+MIN_OVERLAP = 8
+MAX_OVERLAP = 1000
+
+
+def _chunk_position(result: SearchResult) -> tuple[str, int] | None:
+    # ingestion-batch のドキュメント ID は "<ページのハッシュ>-<チャンク番号>"
+    if not result.id or "-" not in result.id:
+        return None
+    page, index = result.id.rsplit("-", 1)
+    return (page, int(index)) if index.isdigit() else None
+
+
+def _merge_text(first: str, second: str, title: str) -> str:
+    # structured チャンカーは各チャンクの先頭にタイトルを付けるので、2つ目からは除く
+    if title and second.startswith(title + "\n"):
+        second = second[len(title) + 1 :]
+    for size in range(min(len(first), len(second), MAX_OVERLAP), MIN_OVERLAP - 1, -1):
+        if first.endswith(second[:size]):
+            return first + second[size:]
+    return first + "\n" + second
+
+
+def _trim_run(run: list[SearchResult], max_chunks: int) -> list[list[SearchResult]]:
+    """
+    長い連続を、最もスコアの高いチャンクを中心に max_chunks 個までに分ける。
+    残りのチャンクはそれぞれ別の連続として返す
+    """
+    if max_chunks <= 0 or len(run) <= max_chunks:
+        return [run]
+    best = max(range(len(run)), key=lambda i: run[i].score)
+    start = end = best
+    # スコアの高い隣を優先して広げる
+    while end - start + 1 < max_chunks:
+        left = run[start - 1].score if start > 0 else None
+        right = run[end + 1].score if end + 1 < len(run) else None
+        if right is None or (left is not None and left >= right):
+            start -= 1
+        else:
+            end += 1
+    rest = [run[:start], run[end + 1 :]]
+    return [run[start : end + 1]] + [
+        trimmed for part in rest if part for trimmed in _trim_run(part, max_chunks)
+    ]
+
+
+def _merge_run(run: list[SearchResult]) -> SearchResult:
+    best = max(run, key=lambda r: r.score)
+    text = run[0].text
+    for result in run[1:]:
+        text = _merge_text(text, result.text, result.title)
+    ids = [r.id for r in run if r.id]
+    return best.model_copy(update={"id": "+".join(ids) if ids else None, "text": text})
+
+
+def _collapse_page(results: list[SearchResult]) -> list[SearchResult]:
+    positioned = sorted(
+        (r for r in results if _chunk_position(r)), key=lambda r: _chunk_position(r)
+    )
+    others = [r for r in results if not _chunk_position(r)]
+
+    # チャンク番号が連続するものだけを1つの連続にまとめる
+    runs: list[list[SearchResult]] = []
+    previous = None
+    for result in positioned:
+        position = _chunk_position(result)
+        if previous and position == (previous[0], previous[1] + 1):
+            runs[-1].append(result)
+        else:
+            runs.append([result])
+        previous = position
+
+    merged = [
+        _merge_run(trimmed)
+        for run in runs
+        for trimmed in _trim_run(run, settings.SEARCH_MERGE_MAX_CHUNKS)
+    ]
+    return merged + others
+
+
+def collapse_by_page(results: list[SearchResult]) -> list[SearchResult]:
+    """
+    同じページ（url）で隣り合うチャンクを、重なりを除いて1つの結果にまとめる。
+
+    離れたチャンクはまとめず別の候補として残し、MMR に選ばせる。
+    結果は最も高いチャンクのスコアの順に並べる
+    """
+    pages: dict[str, list[SearchResult]] = {}
+    for result in results:
+        pages.setdefault(result.url, []).append(result)
+    collapsed = [merged for group in pages.values() for merged in _collapse_page(group)]
+    return sorted(collapsed, key=lambda r: r.score, reverse=True)
+
+
+def _text_vector(text: str) -> Counter:
+    # 日本語は分かち書きしなくても使えるように、文字 bigram の頻度ベクトルにする
+    return Counter(text[i : i + 2] for i in range(len(text) - 1))
+
+
+def _cosine(a: Counter, b: Counter) -> float:
+    if len(a) > len(b):
+        a, b = b, a
+    dot = sum(count * b[gram] for gram, count in a.items())
+    norm = math.sqrt(sum(c * c for c in a.values())) * math.sqrt(
+        sum(c * c for c in b.values())
+    )
+    return dot / norm if norm else 0.0
+
+
+def mmr(results: list[SearchResult], top_k: int, lambda_: float) -> list[SearchResult]:
+    """
+    Maximal Marginal Relevance: 関連度（正規化したスコア）と、選択済みの結果との
+    類似度の最大値をλで重み付けし、似た内容が並ばないように top_k 件を選ぶ
+    """
+    if len(results) <= 1:
+        return results[:top_k]
+
+    low = min(r.score for r in results)
+    high = max(r.score for r in results)
+    relevance = [(r.score - low) / (high - low) if high > low else 1.0 for r in results]
+    vectors = [_text_vector(r.text) for r in results]
+
+    # 選択済みの結果との類似度の最大値（選ぶたびに新しい1件との類似度だけを更新する）
+    redundancy = [0.0] * len(results)
+    selected: list[int] = []
+    remaining = list(range(len(results)))
+    while remaining and len(selected) < top_k:
+        best = max(
+            remaining,
+            key=lambda i: lambda_ * relevance[i] - (1 - lambda_) * redundancy[i],
+        )
+        selected.append(best)
+        remaining.remove(best)
+        for i in remaining:
+            redundancy[i] = max(redundancy[i], _cosine(vectors[i], vectors[best]))
+    return [results[i] for i in selected]
+
+
+def diversify(results: list[SearchResult], top_k: int) -> list[SearchResult]:
+    """
+    多めに取得した検索結果から、LLM に渡す top_k 件を選ぶ
+    """
+    if settings.SEARCH_COLLAPSE_BY_PAGE:
+        results = collapse_by_page(results)
+    if settings.SEARCH_MMR_LAMBDA < 1.0:
+        return mmr(results, top_k, settings.SEARCH_MMR_LAMBDA)
+    return results[:top_k]
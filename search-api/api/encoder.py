@@ -1,16 +1,81 @@
+import asyncio
+import time
+
 import httpx
+from loguru import logger
 
+from . import codec
 from .config import settings
+from .http_client import create_http_client
 
 
 class SpladeClient:
-    def __init__(self, api_url: str = settings.SPLADE_API_URL):
+    def __init__(
+        self,
+        api_url: str = settings.SPLADE_API_URL,
+        client: httpx.AsyncClient | None = None,
+    ):
         self.api_url = api_url
+        self.vocab_url = f"{api_url.rsplit('/', 1)[0]}/vocab"
+        self.binary = settings.SPLADE_RESPONSE_FORMAT == "binary"
+        self._vocab: list[str] | None = None
+        self.client = client or create_http_client(settings.SPLADE_TIMEOUT)
+        self._failures = 0
+        self._skip_until = 0.0
 
-    async def encode(self, text: str) -> dict[str, float]:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                self.api_url, json={"text": text}, timeout=30.0
+    @property
+    def available(self) -> bool:
+        return time.monotonic() >= self._skip_until
+
+    async def encode_or_none(self, text: str) -> dict[str, float] | None:
+        """
+        エンコーダーが遅い・落ちているときは例外ではなく None を返す
+        （呼び出し側は BM25 に切り替える）。連続して失敗したら、
+        しばらくは呼び出さずにすぐ None を返す
+        """
+        if not self.available:
+            return None
+        try:
+            vector = await asyncio.wait_for(
+                self.encode(text), settings.SPLADE_FAST_PATH_TIMEOUT
             )
-            response.raise_for_status()
+        except Exception as e:
+            self._failures += 1
+            logger.warning(f"SPLADE encoding failed or timed out: {e!r}")
+            if self._failures >= settings.SPLADE_FAILURE_THRESHOLD:
+                self._skip_until = time.monotonic() + settings.SPLADE_COOLDOWN
+                logger.warning(
+                    f"Skipping SPLADE for {settings.SPLADE_COOLDOWN:.0f}s "
+                    f"after {self._failures} consecutive failures"
+                )
+            return None
+        self._failures = 0
+        return vector
+
+    async def encode(self, text: str) -> dict[str, float]:
+        headers = {"Accept": codec.accept_header()} if self.binary else {}
+        response = await self.client.post(
+            self.api_url,
+            json={"text": text, "kind": "query"},
+            headers=headers,
+        )
+        response.raise_for_status()
+
+        content_type = response.headers.get("content-type", "")
+        if content_type.startswith("application/json"):
             return response.json()["sparse_vector"]
+
+        ((ids, weights),) = codec.decode(response.content, content_type)
+        # Token strings are only needed for the Elasticsearch field names
+        vocab = await self._get_vocab()
+        return {vocab[i]: weight for i, weight in zip(ids, weights, strict=True)}
+
+    async def _get_vocab(self) -> list[str]:
+        if self._vocab is None:
+            response = await self.client.get(self.vocab_url)
+            response.raise_for_status()
+            self._vocab = response.json()["tokens"]
+        return self._vocab
+
+    async def close(self):
+        await self.client.aclose()
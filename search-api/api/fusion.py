@@ -0,0 +1,47 @@
+from .models import SearchResult
+
+
+def _key(result: SearchResult):
+    return result.id or (result.url, result.text)
+
+
+def reciprocal_rank_fusion(
+    rankings: list[list[SearchResult]], k: int
+) -> list[SearchResult]:
+    """
+    各ランキングでの順位 r について 1 / (k + r) を足し合わせる。スコアの尺度に依存しない
+    """
+    scores: dict = {}
+    results: dict = {}
+    for ranking in rankings:
+        for rank, result in enumerate(ranking, start=1):
+            key = _key(result)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+            results.setdefault(key, result)
+    return _sorted(results, scores)
+
+
+def weighted_fusion(
+    rankings: list[list[SearchResult]], weights: list[float]
+) -> list[SearchResult]:
+    """
+    ランキングごとにスコアを 0〜1 に正規化し、重み付きで足し合わせる
+    """
+    scores: dict = {}
+    results: dict = {}
+    for ranking, weight in zip(rankings, weights, strict=True):
+        if not ranking:
+            continue
+        low = min(r.score for r in ranking)
+        high = max(r.score for r in ranking)
+        for result in ranking:
+            key = _key(result)
+            normalized = (result.score - low) / (high - low) if high > low else 1.0
+            scores[key] = scores.get(key, 0.0) + weight * normalized
+            results.setdefault(key, result)
+    return _sorted(results, scores)
+
+
+def _sorted(results: dict, scores: dict) -> list[SearchResult]:
+    ordered = sorted(results, key=lambda key: scores[key], reverse=True)
+    return [results[key].model_copy(update={"score": scores[key]}) for key in ordered]
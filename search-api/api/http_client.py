@@ -0,0 +1,27 @@
+import httpx
+from loguru import logger
+
+from .config import settings
+
+try:
+    import h2
+except ImportError:  # optional dependency (httpx[http2])
+    h2 = None
+
+
+def create_http_client(timeout: float) -> httpx.AsyncClient:
+    """Long-lived pooled client; connections are kept alive between requests."""
+    http2 = settings.HTTP2_ENABLED
+    if http2 and h2 is None:
+        logger.warning("HTTP2_ENABLED is set but h2 is not installed, using HTTP/1.1")
+        http2 = False
+
+    return httpx.AsyncClient(
+        http2=http2,
+        timeout=httpx.Timeout(timeout, connect=settings.HTTP_CONNECT_TIMEOUT),
+        limits=httpx.Limits(
+            max_connections=settings.HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY,
+        ),
+    )
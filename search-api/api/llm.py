@@ -1,4 +1,8 @@
 import asyncio
+import json
+import time
+from collections.abc import AsyncIterator
+
 import httpx
 from loguru import logger
 from tenacity import (
@@ -9,14 +13,25 @@ from tenacity import (
 )
 
 from .config import settings
-from .models import SearchResult
+from .http_client import create_http_client
+from .models import AnswerStrategy, SearchResult
+from .packing import TokenCounter, format_contexts, pack_contexts
+
+NO_CONTEXT_ANSWER = "関連する情報が見つかりませんでした。"
+# プロンプトを変えたら上げる（回答のキャッシュのキーに含める）
+PROMPT_VERSION = 1
 
 
 class LLMClient:
-    def __init__(self):
+    def __init__(self, client: httpx.AsyncClient | None = None):
         self.api_base = settings.LLM_API_BASE.rstrip("/")
         self.api_key = settings.LLM_API_KEY
         self.model_name = settings.LLM_MODEL_NAME
+        self.client = client or create_http_client(settings.LLM_TIMEOUT)
+        self.tokens = TokenCounter()
+
+    async def close(self):
+        await self.client.aclose()
 
     @retry(
         stop=stop_after_attempt(3),
@@ -27,39 +42,73 @@ class LLMClient:
         ),
     )
     async def _generate_with_retry(self, prompt: str) -> str:
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            response = await client.post(
-                f"{self.api_base}/chat/completions",
-                headers={"Authorization": f"Bearer {self.api_key}"},
-                json={
-                    "model": self.model_name,
-                    "messages": [{"role": "user", "content": prompt}],
-                    "temperature": 0.7,
-                },
-            )
+        response = await self.client.post(
+            f"{self.api_base}/chat/completions",
+            headers={"Authorization": f"Bearer {self.api_key}"},
+            json={
+                "model": self.model_name,
+                "messages": [{"role": "user", "content": prompt}],
+                "temperature": 0.7,
+                "max_tokens": settings.LLM_MAX_ANSWER_TOKENS,
+            },
+        )
+        response.raise_for_status()
+        data = response.json()
+        _log_usage(data)
+        return data["choices"][0]["message"]["content"]
+
+    async def _stream_completion(self, prompt: str) -> AsyncIterator[str]:
+        # 途中まで送ったトークンは取り消せないので、ストリーミングではリトライしない
+        async with self.client.stream(
+            "POST",
+            f"{self.api_base}/chat/completions",
+            headers={"Authorization": f"Bearer {self.api_key}"},
+            json={
+                "model": self.model_name,
+                "messages": [{"role": "user", "content": prompt}],
+                "temperature": 0.7,
+                "max_tokens": settings.LLM_MAX_ANSWER_TOKENS,
+                "stream": True,
+            },
+        ) as response:
             response.raise_for_status()
-            data = response.json()
-            return data["choices"][0]["message"]["content"]
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line.removeprefix("data:").strip()
+                if data == "[DONE]":
+                    break
+                chunk = json.loads(data)
+                if "error" in chunk:
+                    message = chunk["error"].get("message", "LLM stream error")
+                    raise RuntimeError(message)
+                _log_usage(chunk)
+                for choice in chunk.get("choices", []):
+                    content = choice.get("delta", {}).get("content")
+                    if content:
+                        yield content
 
-    async def generate_answer(self, query: str, contexts: list[SearchResult]) -> str:
-        if not contexts:
-            return "関連する情報が見つかりませんでした。"
-
-        # チャンクごとに分割
-        chunk_size = settings.LLM_CONTEXT_CHUNK_SIZE
-        chunks = [
-            contexts[i : i + chunk_size] for i in range(0, len(contexts), chunk_size)
-        ]
-
-        current_answer = ""
-        for i, chunk in enumerate(chunks):
-            context_text = "\n\n".join(
-                [f"--- Source: {c.title} ({c.url}) ---\n{c.text}" for c in chunk]
-            )
+    async def _timed_generate(self, step: str, prompt: str) -> str:
+        started = time.perf_counter()
+        tokens = self.tokens.count(prompt)
+        answer = await self._generate_with_retry(prompt)
+        logger.info(
+            f"LLM step {step} ({tokens} prompt tokens) "
+            f"took {time.perf_counter() - started:.2f}s"
+        )
+        return answer
+
+    def _build_prompt(
+        self,
+        query: str,
+        chunk: list[SearchResult],
+        current_answer: str | None,
+    ) -> str:
+        context_text = format_contexts(chunk)
 
-            if i == 0:
-                # 初回の回答生成
-                prompt = f"""あなたはScrapboxの知識を熟知したアシスタントです。
+        if current_answer is None:
+            # 初回の回答生成
+            return f"""あなたはScrapboxの知識を熟知したアシスタントです。
 提供されたコンテキスト情報のみを使用して、ユーザーの質問に回答してください。
 回答の最後には、参考にしたページのタイトルとURLを記載してください。
 
@@ -69,9 +118,8 @@ class LLMClient:
 # ユーザーの質問
 {query}
 """
-            else:
-                # 回答のブラッシュアップ（Refine）
-                prompt = f"""あなたはScrapboxの知識を熟知したアシスタントです。
+        # 回答のブラッシュアップ（Refine）
+        return f"""あなたはScrapboxの知識を熟知したアシスタントです。
 既存の回答を、新しく追加されたコンテキスト情報を用いて更新・改善してください。
 必要に応じて情報を追加し、矛盾がある場合は新しい情報を優先してください。
 回答の最後には、これまでに参考にしたすべてのページのタイトルとURLを記載してください。
@@ -86,7 +134,164 @@ class LLMClient:
 {context_text}
 """
 
+    def _build_map_prompt(self, query: str, chunk: list[SearchResult]) -> str:
+        return f"""あなたはScrapboxの知識を熟知したアシスタントです。
+提供されたコンテキスト情報のみを使用して、ユーザーの質問に関係する情報を簡潔にまとめてください。
+使用した情報には、参考にしたページのタイトルとURLを添えてください。
+関係する情報がない場合は「該当なし」とだけ答えてください。
+
+# コンテキスト
+{format_contexts(chunk)}
+
+# ユーザーの質問
+{query}
+"""
+
+    def _build_reduce_prompt(self, query: str, partial_answers: list[str]) -> str:
+        answers_text = "\n\n".join(
+            f"--- 部分回答 {i + 1} ---\n{answer}"
+            for i, answer in enumerate(partial_answers)
+        )
+        return f"""あなたはScrapboxの知識を熟知したアシスタントです。
+以下は、コンテキストを分割してそれぞれから作成した部分回答です。
+これらを統合して、ユーザーの質問に対する1つの回答を作成してください。
+「該当なし」の部分回答は無視し、矛盾がある場合はより具体的な情報を優先してください。
+回答の最後には、参考にしたすべてのページのタイトルとURLを記載してください。
+
+# ユーザーの質問
+{query}
+
+# 部分回答
+{answers_text}
+"""
+
+    def _pack(
+        self, contexts: list[SearchResult], empty_prompt: str, reserved: int = 0
+    ) -> list[list[SearchResult]]:
+        # コンテキスト以外のプロンプトと reserved の分を除いて、予算まで詰める
+        overhead = self.tokens.count(empty_prompt) + reserved
+        return pack_contexts(
+            contexts, self.tokens, overhead, settings.LLM_CONTEXT_CHUNK_SIZE
+        )
+
+    async def _refine_prompt(self, query: str, contexts: list[SearchResult]) -> str:
+        # チャンクごとに分割し、最後のチャンク以外で回答を順に更新する
+        # 既存の回答は最大で LLM_MAX_ANSWER_TOKENS なので、その分を空けておく
+        chunks = self._pack(
+            contexts,
+            self._build_prompt(query, [], ""),
+            reserved=settings.LLM_MAX_ANSWER_TOKENS,
+        )
+
+        current_answer = None
+        for i, chunk in enumerate(chunks[:-1]):
             logger.info(f"Processing chunk {i+1}/{len(chunks)}...")
-            current_answer = await self._generate_with_retry(prompt)
+            prompt = self._build_prompt(query, chunk, current_answer)
+            current_answer = await self._timed_generate(
+                f"refine {i + 1}/{len(chunks)}", prompt
+            )
+        return self._build_prompt(query, chunks[-1], current_answer)
+
+    async def _map_reduce_prompt(self, query: str, contexts: list[SearchResult]) -> str:
+        # チャンクごとの部分回答を並行して作り、1回の呼び出しで統合する
+        chunks = self._pack(contexts, self._build_map_prompt(query, []))
+        if len(chunks) == 1:
+            return self._build_prompt(query, chunks[0], None)
+
+        semaphore = asyncio.Semaphore(settings.LLM_MAX_CONCURRENCY)
+
+        async def map_chunk(i: int, chunk: list[SearchResult]) -> str:
+            async with semaphore:
+                prompt = self._build_map_prompt(query, chunk)
+                return await self._timed_generate(f"map {i + 1}/{len(chunks)}", prompt)
+
+        started = time.perf_counter()
+        partial_answers = await asyncio.gather(
+            *(map_chunk(i, chunk) for i, chunk in enumerate(chunks))
+        )
+        elapsed = time.perf_counter() - started
+        logger.info(f"Map phase ({len(chunks)} chunks) took {elapsed:.2f}s")
+        return self._build_reduce_prompt(
+            query, self._fit_partial_answers(query, partial_answers)
+        )
+
+    def _fit_partial_answers(self, query: str, partial_answers: list[str]) -> list[str]:
+        # 統合のプロンプトが予算を超えるときは、部分回答を同じ長さまで切り詰める
+        budget = settings.LLM_CONTEXT_WINDOW - settings.LLM_MAX_ANSWER_TOKENS
+        empty = self._build_reduce_prompt(query, [""] * len(partial_answers))
+        if self.tokens.count(empty) + sum(
+            self.tokens.count(a) for a in partial_answers
+        ) <= budget:
+            return partial_answers
+        per_answer = max((budget - self.tokens.count(empty)) // len(partial_answers), 0)
+        logger.info(f"Truncating partial answers to {per_answer} tokens each")
+        return [self.tokens.truncate(a, per_answer) for a in partial_answers]
+
+    async def _stuff_prompt(self, query: str, contexts: list[SearchResult]) -> str:
+        # 1回の呼び出しに入る分だけをスコア順に詰め、1回の呼び出しで回答する
+        chunks = self._pack(contexts, self._build_prompt(query, [], None))
+        packed = chunks[0]
+        logger.info(f"Stuffed {len(packed)}/{len(contexts)} contexts")
+        return self._build_prompt(query, packed, None)
+
+    async def _final_prompt(
+        self,
+        query: str,
+        contexts: list[SearchResult],
+        strategy: AnswerStrategy | None,
+    ) -> tuple[AnswerStrategy, str]:
+        """
+        戦略に従って途中のステップを実行し、最終回答を生成するプロンプトを返す
+        """
+        strategy = strategy or settings.LLM_ANSWER_STRATEGY
+        if strategy == "map_reduce":
+            return strategy, await self._map_reduce_prompt(query, contexts)
+        if strategy == "stuff":
+            return strategy, await self._stuff_prompt(query, contexts)
+        return strategy, await self._refine_prompt(query, contexts)
+
+    async def generate_answer(
+        self,
+        query: str,
+        contexts: list[SearchResult],
+        strategy: AnswerStrategy | None = None,
+    ) -> str:
+        if not contexts:
+            return NO_CONTEXT_ANSWER
+
+        started = time.perf_counter()
+        strategy, prompt = await self._final_prompt(query, contexts, strategy)
+        answer = await self._timed_generate(f"{strategy} final", prompt)
+        logger.info(f"Answer ({strategy}) took {time.perf_counter() - started:.2f}s")
+        return answer
+
+    async def stream_answer(
+        self,
+        query: str,
+        contexts: list[SearchResult],
+        strategy: AnswerStrategy | None = None,
+    ) -> AsyncIterator[str]:
+        """
+        generate_answer と同じ戦略で回答し、最終ステップだけをトークン単位で返す
+        """
+        if not contexts:
+            yield NO_CONTEXT_ANSWER
+            return
+
+        started = time.perf_counter()
+        strategy, prompt = await self._final_prompt(query, contexts, strategy)
+        elapsed = time.perf_counter() - started
+        logger.info(f"Streaming {strategy} final step after {elapsed:.2f}s")
+        async for token in self._stream_completion(prompt):
+            yield token
+        logger.info(f"Answer ({strategy}) took {time.perf_counter() - started:.2f}s")
+
 
-        return current_answer
+def _log_usage(data: dict):
+    # LLM が返した実際のトークン数（OpenAI 互換の usage）
+    usage = data.get("usage")
+    if usage:
+        logger.info(
+            f"LLM usage: {usage.get('prompt_tokens')} prompt + "
+            f"{usage.get('completion_tokens')} completion tokens"
+        )
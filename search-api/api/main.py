@@ -1,14 +1,92 @@
+import asyncio
+import json
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+
 from fastapi import Depends, FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
 from loguru import logger
 
-from .deps import get_llm_client, get_search_client, get_splade_client
+from . import deps
+from .cache import ChatCache, context_key, normalize_query
+from .config import settings
+from .deps import (
+    get_chat_cache,
+    get_llm_client,
+    get_search_client,
+    get_splade_client,
+)
+from .diversify import diversify
 from .encoder import SpladeClient
-from .llm import LLMClient
-from .models import ChatResponse, SearchRequest
+from .llm import PROMPT_VERSION, LLMClient
+from .models import ChatResponse, SearchRequest, SearchResult
 from .search import SearchClient
 
-logger.info("Starting RAG Search API...")
-app = FastAPI(title="RAG Search API")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    logger.info("Starting RAG Search API...")
+    deps.startup()
+    try:
+        yield
+    finally:
+        await deps.shutdown()
+
+
+app = FastAPI(title="RAG Search API", lifespan=lifespan)
+
+
+async def _retrieve(
+    query: str,
+    search_client: SearchClient,
+    splade_client: SpladeClient,
+    cache: ChatCache,
+) -> list[SearchResult]:
+    await cache.check_index_version(search_client.index_version)
+
+    async def compute():
+        # 1. クエリのベクトル化（BM25 だけで検索するときは不要）
+        sparse_vector = None
+        if settings.SEARCH_MODE != "bm25":
+            if settings.SPLADE_FALLBACK_TO_BM25:
+                sparse_vector = await splade_client.encode_or_none(query)
+            else:
+                sparse_vector = await splade_client.encode(query)
+
+        # 2. 検索（SPLADE を使えなかったときは BM25 だけで検索する）
+        fetch_k = settings.SEARCH_TOP_K * max(settings.SEARCH_OVERFETCH, 1)
+        if settings.SEARCH_MODE == "sparse" and sparse_vector is not None:
+            contexts = await search_client.search(sparse_vector, top_k=fetch_k)
+        else:
+            contexts = await search_client.search_hybrid(
+                query, sparse_vector, top_k=fetch_k
+            )
+
+        # 3. 同じページの重複をまとめ、内容の偏らない top_k 件を選ぶ
+        contexts = diversify(contexts, settings.SEARCH_TOP_K)
+        return sparse_vector, contexts
+
+    def complete(result) -> bool:
+        # SPLADE なしで検索した結果は、エンコーダーが戻ったら使わないように保存しない
+        sparse_vector, _ = result
+        return settings.SEARCH_MODE == "bm25" or sparse_vector is not None
+
+    _, contexts = await cache.retrieval.get_or_compute(
+        normalize_query(query), compute, cache_if=complete
+    )
+    return contexts
+
+
+def _answer_key(
+    request: SearchRequest, contexts: list[SearchResult], llm_client: LLMClient
+) -> tuple:
+    return (
+        normalize_query(request.query),
+        context_key(contexts),
+        llm_client.model_name,
+        PROMPT_VERSION,
+        request.strategy or settings.LLM_ANSWER_STRATEGY,
+    )
 
 
 @app.post("/chat", response_model=ChatResponse)
@@ -17,24 +95,101 @@ async def chat(
     search_client: SearchClient = Depends(get_search_client),
     splade_client: SpladeClient = Depends(get_splade_client),
     llm_client: LLMClient = Depends(get_llm_client),
+    cache: ChatCache = Depends(get_chat_cache),
 ):
     try:
         logger.info(f"Query: {request.query}")
+        contexts = await _retrieve(request.query, search_client, splade_client, cache)
+
+        # 4. 回答生成（同じクエリとコンテキストなら、実行中の生成も含めて使い回す）
+        answer = await cache.answers.get_or_compute(
+            _answer_key(request, contexts, llm_client),
+            lambda: llm_client.generate_answer(
+                request.query, contexts, request.strategy
+            ),
+        )
+
+        return ChatResponse(answer=answer, sources=contexts)
+    except Exception as e:
+        logger.error(f"Error during chat: {e}")
+        raise HTTPException(status_code=500, detail=str(e)) from e
 
-        # 1. クエリのベクトル化
-        sparse_vector = await splade_client.encode(request.query)
 
-        # 2. スパース検索
-        contexts = await search_client.search(sparse_vector)
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
 
-        # 3. 回答生成
-        answer = await llm_client.generate_answer(request.query, contexts)
 
-        return ChatResponse(answer=answer, sources=contexts)
+async def _chat_events(
+    request: SearchRequest,
+    contexts: list[SearchResult],
+    llm_client: LLMClient,
+    cache: ChatCache,
+) -> AsyncIterator[str]:
+    # 検索が終わった時点でソースを送り、回答はトークンが届くたびに送る
+    yield _sse("sources", [c.model_dump() for c in contexts])
+
+    # 生成したトークンを受け取るキュー（None で終わり）
+    queue: asyncio.Queue[str | None] = asyncio.Queue()
+    streamed = False
+
+    async def compute() -> str:
+        tokens = []
+        async for token in llm_client.stream_answer(
+            request.query, contexts, request.strategy
+        ):
+            tokens.append(token)
+            queue.put_nowait(token)
+        return "".join(tokens)
+
+    # /chat と同じく、キャッシュにあるか実行中の生成があればその回答を待つ。
+    # そうでなければ自分で生成し、最後まで生成できた回答だけが保存される
+    task = asyncio.ensure_future(
+        cache.answers.get_or_compute(
+            _answer_key(request, contexts, llm_client), compute
+        )
+    )
+    task.add_done_callback(lambda _: queue.put_nowait(None))
+    try:
+        while (token := await queue.get()) is not None:
+            streamed = True
+            yield _sse("token", {"content": token})
+        answer = task.result()
+    except Exception as e:
+        # ヘッダー送信後はステータスコードを変えられないので、エラーをイベントで伝える
+        logger.error(f"Error during chat stream: {e}")
+        yield _sse("error", {"detail": str(e)})
+        return
+    finally:
+        # 切断されても、共有している生成は get_or_compute の中で続く
+        task.cancel()
+    if not streamed:
+        # 他のリクエストの生成（またはキャッシュ）の回答はまとめて送る
+        yield _sse("token", {"content": answer})
+    yield _sse("done", {})
+
+
+@app.post("/chat/stream")
+async def chat_stream(
+    request: SearchRequest,
+    search_client: SearchClient = Depends(get_search_client),
+    splade_client: SpladeClient = Depends(get_splade_client),
+    llm_client: LLMClient = Depends(get_llm_client),
+    cache: ChatCache = Depends(get_chat_cache),
+):
+    try:
+        logger.info(f"Query (stream): {request.query}")
+        contexts = await _retrieve(request.query, search_client, splade_client, cache)
     except Exception as e:
         logger.error(f"Error during chat: {e}")
         raise HTTPException(status_code=500, detail=str(e)) from e
 
+    return StreamingResponse(
+        _chat_events(request, contexts, llm_client, cache),
+        media_type="text/event-stream",
+        # nginx などのプロキシにバッファリングさせない
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 
 @app.get("/health")
 async def health():
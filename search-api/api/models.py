@@ -1,11 +1,29 @@
+from typing import Literal
+
 from pydantic import BaseModel, Field
 
+AnswerStrategy = Literal["refine", "map_reduce", "stuff"]
+# スパース検索のスコア
+# saturation: rank_feature の既定（重みが大きい語ほど頭打ちになる）
+# linear: rank_feature の linear 関数（クエリとドキュメントの重みの内積）
+# sparse_vector: sparse_vector クエリ（sparse_vector 型のフィールドが必要）
+Scoring = Literal["saturation", "linear", "sparse_vector"]
+# sparse: SPLADE のみ / bm25: kuromoji の全文検索のみ / hybrid: 両方を融合する
+SearchMode = Literal["sparse", "hybrid", "bm25"]
+# rrf: 順位の逆数の和 / weighted: 正規化したスコアの重み付き和
+Fusion = Literal["rrf", "weighted"]
+
 
 class SearchRequest(BaseModel):
     query: str = Field(..., description="User query for search")
+    strategy: AnswerStrategy | None = Field(
+        default=None,
+        description="Answer strategy (defaults to LLM_ANSWER_STRATEGY)",
+    )
 
 
 class SearchResult(BaseModel):
+    id: str | None = None
     text: str
     title: str
     url: str
@@ -0,0 +1,155 @@
+import os
+
+from loguru import logger
+
+from .config import settings
+from .models import SearchResult
+
+try:
+    from tokenizers import Tokenizer
+except ImportError:  # optional dependency (uv sync --extra tokenizer)
+    Tokenizer = None
+
+TRUNCATED = "\n…"
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    トークン数の概算。
+    ASCII は4文字で1トークン、日本語などはおおよそ1文字1トークンとみなす
+    """
+    ascii_chars = sum(1 for c in text if c.isascii())
+    return (ascii_chars + 3) // 4 + (len(text) - ascii_chars)
+
+
+class TokenCounter:
+    """
+    LLM と同じトークナイザーでトークン数を数える。
+
+    LLM_TOKENIZER（tokenizer.json のパスか Hugging Face のモデル名）が
+    読み込めない場合は、文字数からの概算で代用する。
+    """
+
+    def __init__(self, name: str | None = None):
+        name = name if name is not None else settings.LLM_TOKENIZER
+        self.tokenizer = None
+        if not name:
+            return
+        if Tokenizer is None:
+            logger.warning("LLM_TOKENIZER is set but tokenizers is not installed")
+            return
+        try:
+            if os.path.exists(name):
+                self.tokenizer = Tokenizer.from_file(name)
+            else:
+                self.tokenizer = Tokenizer.from_pretrained(name)
+        except Exception as e:
+            logger.warning(f"Failed to load tokenizer {name}, estimating tokens: {e}")
+
+    @property
+    def exact(self) -> bool:
+        return self.tokenizer is not None
+
+    def count(self, text: str) -> int:
+        if self.tokenizer is None:
+            return estimate_tokens(text)
+        return len(self.tokenizer.encode(text, add_special_tokens=False).ids)
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """
+        max_tokens に収まるように末尾を切る。できるだけ行の区切りで切り、
+        切ったことを示す
+        """
+        if self.count(text) <= max_tokens:
+            return text
+        limit = max(max_tokens - self.count(TRUNCATED), 0)
+
+        kept, used = [], 0
+        for line in text.split("\n"):
+            tokens = self.count(line + "\n")
+            if used + tokens > limit:
+                break
+            kept.append(line)
+            used += tokens
+        # 行で切ると半分も残らない（長い行がある）場合は、行の途中で切る
+        if used >= limit // 2 and kept:
+            return "\n".join(kept) + TRUNCATED
+        return self._cut(text, limit) + TRUNCATED
+
+    def _cut(self, text: str, max_tokens: int) -> str:
+        if max_tokens <= 0:
+            return ""
+        if self.tokenizer is not None:
+            offsets = self.tokenizer.encode(text, add_special_tokens=False).offsets
+            return text[: offsets[max_tokens - 1][1]]
+        # 概算のときは、収まる最長の先頭部分を二分探索する
+        low, high = 0, len(text)
+        while low < high:
+            middle = (low + high + 1) // 2
+            if estimate_tokens(text[:middle]) <= max_tokens:
+                low = middle
+            else:
+                high = middle - 1
+        return text[:low]
+
+
+def format_context(context: SearchResult) -> str:
+    return f"--- Source: {context.title} ({context.url}) ---\n{context.text}"
+
+
+def format_contexts(contexts: list[SearchResult]) -> str:
+    return "\n\n".join(format_context(c) for c in contexts)
+
+
+def pack_contexts(
+    contexts: list[SearchResult],
+    counter: TokenCounter,
+    overhead: int,
+    max_per_call: int = 0,
+) -> list[list[SearchResult]]:
+    """
+    1回の呼び出しのプロンプトが LLM_CONTEXT_WINDOW から回答用の
+    LLM_MAX_ANSWER_TOKENS を除いた予算に収まるように、コンテキストを分ける。
+
+    overhead はコンテキスト以外（指示・質問・既存の回答）のトークン数。
+    スコア順に、入る余裕のある最初の呼び出しに詰める（First Fit）。
+    1つで LLM_MAX_CONTEXT_TOKENS か予算を超えるコンテキストは切り詰める。
+    max_per_call が正なら、1回に渡す件数もそれ以下にする。
+    """
+    budget = settings.LLM_CONTEXT_WINDOW - settings.LLM_MAX_ANSWER_TOKENS - overhead
+    if budget <= 0:
+        raise ValueError(
+            f"No room for contexts: window {settings.LLM_CONTEXT_WINDOW}, "
+            f"answer {settings.LLM_MAX_ANSWER_TOKENS}, prompt {overhead} tokens"
+        )
+    separator = counter.count("\n\n")
+    per_context = min(settings.LLM_MAX_CONTEXT_TOKENS or budget, budget) - separator
+
+    groups: list[list[SearchResult]] = []
+    used: list[int] = []
+    for context in contexts:
+        tokens = counter.count(format_context(context))
+        if tokens > per_context:
+            empty = context.model_copy(update={"text": ""})
+            header = counter.count(format_context(empty))
+            text = counter.truncate(context.text, per_context - header)
+            context = context.model_copy(update={"text": text})
+            tokens = counter.count(format_context(context))
+        tokens += separator
+
+        for i, group in enumerate(groups):
+            full = max_per_call > 0 and len(group) >= max_per_call
+            if not full and used[i] + tokens <= budget:
+                group.append(context)
+                used[i] += tokens
+                break
+        else:
+            groups.append([context])
+            used.append(tokens)
+
+    logger.info(
+        f"Packed {len(contexts)} contexts into {len(groups)} calls "
+        f"(context tokens per call: {used}, budget {budget}, "
+        f"{'exact' if counter.exact else 'estimated'})"
+    )
+    return groups
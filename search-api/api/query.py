@@ -0,0 +1,87 @@
+import heapq
+from typing import Any
+
+from .config import settings
+from .models import Scoring
+
+SPARSE_FIELD = "sparse_vector"
+SOURCE_FIELDS = ["text", "title", "url"]
+# kuromoji で解析された全文検索のフィールド（タイトルの一致を重くする）
+BM25_FIELDS = ["title^2", "text"]
+
+
+def prune_terms(
+    sparse_vector: dict[str, float], max_terms: int, min_weight: float
+) -> dict[str, float]:
+    """
+    重みが min_weight 以上の語のうち、重みの大きい max_terms 個だけを残す（0 で無制限）
+    """
+    terms = {t: w for t, w in sparse_vector.items() if w >= min_weight}
+    if 0 < max_terms < len(terms):
+        kept = set(heapq.nlargest(max_terms, terms, key=terms.__getitem__))
+        terms = {t: w for t, w in terms.items() if t in kept}
+    return terms
+
+
+def build_sparse_query(
+    sparse_vector: dict[str, float], scoring: Scoring
+) -> dict[str, Any]:
+    if scoring == "sparse_vector":
+        return {"sparse_vector": {"field": SPARSE_FIELD, "query_vector": sparse_vector}}
+
+    function = {"linear": {}} if scoring == "linear" else {}
+    should_clauses = [
+        {
+            "rank_feature": {
+                "field": f"{SPARSE_FIELD}.{token}",
+                "boost": weight,
+                **function,
+            }
+        }
+        for token, weight in sparse_vector.items()
+    ]
+    return {"bool": {"should": should_clauses}}
+
+
+def build_search_body(
+    sparse_vector: dict[str, float],
+    top_k: int,
+    *,
+    max_terms: int | None = None,
+    min_weight: float | None = None,
+    scoring: Scoring | None = None,
+    track_total_hits: bool | None = None,
+) -> dict[str, Any] | None:
+    """
+    SearchClient.search に渡す検索のパラメータ。残る語がなければ None
+    """
+    terms = prune_terms(
+        sparse_vector,
+        settings.SEARCH_MAX_QUERY_TERMS if max_terms is None else max_terms,
+        settings.SEARCH_MIN_TERM_WEIGHT if min_weight is None else min_weight,
+    )
+    if not terms:
+        return None
+
+    if track_total_hits is None:
+        track_total_hits = settings.SEARCH_TRACK_TOTAL_HITS
+    return {
+        "query": build_sparse_query(terms, scoring or settings.SEARCH_SCORING),
+        "size": top_k,
+        # ベクトル本体は大きいので、回答に使うフィールドだけを返す
+        "source": SOURCE_FIELDS,
+        "track_total_hits": track_total_hits,
+    }
+
+
+def build_bm25_body(
+    query: str, top_k: int, *, track_total_hits: bool | None = None
+) -> dict[str, Any]:
+    if track_total_hits is None:
+        track_total_hits = settings.SEARCH_TRACK_TOTAL_HITS
+    return {
+        "query": {"multi_match": {"query": query, "fields": BM25_FIELDS}},
+        "size": top_k,
+        "source": SOURCE_FIELDS,
+        "track_total_hits": track_total_hits,
+    }
@@ -1,7 +1,9 @@
 from elasticsearch import AsyncElasticsearch
 
 from .config import settings
+from .fusion import reciprocal_rank_fusion, weighted_fusion
 from .models import SearchResult
+from .query import build_bm25_body, build_search_body
 
 
 class SearchClient:
@@ -10,43 +12,104 @@ class SearchClient:
             settings.ELASTICSEARCH_URL,
             verify_certs=False,
             request_timeout=30,
+            connections_per_node=settings.ELASTICSEARCH_MAX_CONNECTIONS,
         )
         self.index_name = settings.ELASTICSEARCH_INDEX
 
     async def search(
-        self, sparse_vector: dict[str, float], top_k: int = 5
+        self, sparse_vector: dict[str, float], top_k: int = 5, **query_options
     ) -> list[SearchResult]:
-        if not sparse_vector:
+        """
+        query_options は build_search_body の max_terms / min_weight / scoring /
+        track_total_hits（省略時は設定値）
+        """
+        body = build_search_body(sparse_vector, top_k, **query_options)
+        if body is None:
             return []
 
-        # Construct rank_feature query
-        should_clauses = [
-            {"rank_feature": {"field": f"sparse_vector.{token}", "boost": weight}}
-            for token, weight in sparse_vector.items()
-        ]
-
-        query = {"bool": {"should": should_clauses}}
-
-        try:
-            response = await self.es.search(
-                index=self.index_name, query=query, size=top_k
-            )
-
-            results = []
-            for hit in response["hits"]["hits"]:
-                source = hit["_source"]
-                results.append(
-                    SearchResult(
-                        text=source["text"],
-                        title=source["title"],
-                        url=source["url"],
-                        score=hit["_score"],
-                    )
-                )
-            return results
-        except Exception as e:
-            # In a real app, handle connection errors etc.
-            raise e
+        response = await self.es.search(index=self.index_name, **body)
+        return _to_results(response)
+
+    async def search_bm25(self, query: str, top_k: int = 5) -> list[SearchResult]:
+        body = build_bm25_body(query, top_k)
+        response = await self.es.search(index=self.index_name, **body)
+        return _to_results(response)
+
+    async def search_hybrid(
+        self,
+        query: str,
+        sparse_vector: dict[str, float] | None,
+        top_k: int = 5,
+    ) -> list[SearchResult]:
+        """
+        BM25 と SPLADE の検索を1回の msearch で実行し、結果を融合する。
+        スパースベクトルがなければ（SPLADE を使えないときは）BM25 だけで検索する
+        """
+        candidates = max(settings.SEARCH_CANDIDATES, top_k)
+        sparse_body = (
+            build_search_body(sparse_vector, candidates) if sparse_vector else None
+        )
+        if sparse_body is None:
+            return await self.search_bm25(query, top_k)
+
+        bm25_body = build_bm25_body(query, candidates)
+        response = await self.es.msearch(
+            index=self.index_name,
+            searches=[{}, _msearch_body(bm25_body), {}, _msearch_body(sparse_body)],
+        )
+        rankings = []
+        for item in response["responses"]:
+            if "error" in item:
+                raise RuntimeError(f"msearch failed: {item['error']}")
+            rankings.append(_to_results(item))
+
+        if settings.SEARCH_FUSION == "weighted":
+            weight = settings.SEARCH_BM25_WEIGHT
+            fused = weighted_fusion(rankings, [weight, 1.0 - weight])
+        else:
+            fused = reciprocal_rank_fusion(rankings, settings.SEARCH_RRF_K)
+        return fused[:top_k]
+
+    async def index_version(self) -> str:
+        """
+        検索対象のエイリアスが指している実際のインデックス名と、内容の変化を表す値
+
+        差分更新はエイリアスを付け替えずに同じインデックスに書き込むので、
+        ドキュメント数と登録・削除の累計も含める
+        """
+        index = self.index_name
+        if await self.es.indices.exists_alias(name=self.index_name):
+            aliases = await self.es.indices.get_alias(name=self.index_name)
+            index = ",".join(sorted(aliases))
+        stats = await self.es.indices.stats(
+            index=self.index_name, metric="docs,indexing"
+        )
+        primaries = stats["_all"]["primaries"]
+        docs, indexing = primaries["docs"], primaries["indexing"]
+        return (
+            f"{index}@{docs['count']}/{docs['deleted']}/"
+            f"{indexing['index_total']}/{indexing['delete_total']}"
+        )
 
     async def close(self):
         await self.es.close()
+
+
+def _msearch_body(body: dict) -> dict:
+    # search() のキーワード引数 source は、リクエストボディでは _source
+    body = dict(body)
+    body["_source"] = body.pop("source")
+    return body
+
+
+def _to_results(response) -> list[SearchResult]:
+    return [
+        SearchResult(
+            id=hit.get("_id"),
+            text=hit["_source"]["text"],
+            title=hit["_source"]["title"],
+            url=hit["_source"]["url"],
+            score=hit["_score"],
+        )
+        for hit in response["hits"]["hits"]
+    ]
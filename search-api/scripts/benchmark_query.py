@@ -0,0 +1,140 @@
+"""Measure sparse query latency against recall@k for query pruning and scoring.
+
+Each query in the set is encoded once with SPLADE. The reference ranking is
+the unpruned query with --reference-scoring; every configuration is timed
+against the live index and scored by the share of reference top-k documents
+it still returns.
+
+    uv run python -m scripts.benchmark_query --queries queries.txt
+    uv run python -m scripts.benchmark_query --queries queries.txt \\
+        --max-terms 8 16 32 64 0 --scorings saturation linear --k 10
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+
+from api.encoder import SpladeClient
+from api.query import prune_terms
+from api.search import SearchClient
+
+
+def load_queries(path: str) -> list[str]:
+    with open(path, encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def percentile(values: list[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(int(len(values) * q), len(values) - 1)]
+
+
+async def search_ids(search: SearchClient, vector: dict[str, float], k: int, **options):
+    return [r.id for r in await search.search(vector, top_k=k, **options)]
+
+
+async def benchmark(
+    search: SearchClient,
+    vectors: list[dict[str, float]],
+    reference: list[list[str]],
+    args,
+    **options,
+) -> dict:
+    latencies = []
+    recalls = []
+    for vector, expected in zip(vectors, reference, strict=True):
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            ids = await search_ids(search, vector, args.k, min_weight=0.0, **options)
+            latencies.append((time.perf_counter() - start) * 1000)
+        if expected:
+            recalls.append(len(set(ids) & set(expected)) / len(expected))
+
+    terms = [len(prune_terms(v, options["max_terms"], 0.0)) for v in vectors]
+    return {
+        "terms": statistics.mean(terms),
+        "p50_ms": statistics.median(latencies),
+        "p95_ms": percentile(latencies, 0.95),
+        "recall": statistics.mean(recalls) if recalls else 0.0,
+    }
+
+
+async def run(args):
+    splade = SpladeClient()
+    search = SearchClient()
+    try:
+        queries = load_queries(args.queries)
+        vectors = [await splade.encode(query) for query in queries]
+        reference = [
+            await search_ids(
+                search,
+                vector,
+                args.k,
+                max_terms=0,
+                min_weight=0.0,
+                scoring=args.reference_scoring,
+            )
+            for vector in vectors
+        ]
+        print(
+            f"{len(queries)} queries, "
+            f"{statistics.mean(len(v) for v in vectors):.1f} terms/query, "
+            f"reference: {args.reference_scoring} with all terms"
+        )
+        print(
+            f"{'scoring':<14} {'max terms':>9} {'terms':>7} {'p50 ms':>8} "
+            f"{'p95 ms':>8} {f'recall@{args.k}':>10}"
+        )
+        for scoring in args.scorings:
+            for max_terms in args.max_terms:
+                result = await benchmark(
+                    search,
+                    vectors,
+                    reference,
+                    args,
+                    max_terms=max_terms,
+                    scoring=scoring,
+                    track_total_hits=args.track_total_hits,
+                )
+                print(
+                    f"{scoring:<14} {max_terms or 'all':>9} {result['terms']:>7.1f} "
+                    f"{result['p50_ms']:>8.1f} {result['p95_ms']:>8.1f} "
+                    f"{result['recall']:>10.3f}"
+                )
+    finally:
+        await splade.close()
+        await search.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--queries", required=True, help="File with one query per line")
+    parser.add_argument("--k", type=int, default=5, help="Results per query")
+    parser.add_argument(
+        "--max-terms",
+        type=int,
+        nargs="+",
+        default=[8, 16, 32, 64, 0],
+        help="Query term caps to compare (0 = all terms)",
+    )
+    parser.add_argument(
+        "--scorings",
+        nargs="+",
+        default=["saturation", "linear"],
+        choices=["saturation", "linear", "sparse_vector"],
+    )
+    parser.add_argument(
+        "--reference-scoring",
+        default="linear",
+        choices=["saturation", "linear", "sparse_vector"],
+        help="Scoring of the unpruned reference ranking",
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per query")
+    parser.add_argument("--track-total-hits", action="store_true")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
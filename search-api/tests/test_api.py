@@ -1,11 +1,22 @@
+import asyncio
+import json
 import pytest
-from unittest.mock import AsyncMock
+from unittest.mock import AsyncMock, MagicMock, patch
 from api.main import app
-from api.deps import get_search_client, get_splade_client, get_llm_client
+from api.cache import ChatCache
+from api.deps import (
+    get_chat_cache,
+    get_llm_client,
+    get_search_client,
+    get_splade_client,
+)
+from api.models import SearchResult
 
 @pytest.fixture(autouse=True)
 def cleanup_overrides():
     app.dependency_overrides.clear()
+    cache = ChatCache()
+    app.dependency_overrides[get_chat_cache] = lambda: cache
     yield
     app.dependency_overrides.clear()
 
@@ -20,7 +31,7 @@ async def test_chat_success(client):
     # Mock implementations
     mock_sparse_vector = {"hello": 1.5, "world": 2.0}
     mock_search_results = [
-        {"text": "mock text", "title": "mock title", "url": "http://mock", "score": 10.0}
+        SearchResult(text="mock text", title="mock title", url="http://mock", score=10.0)
     ]
     mock_answer = "This is a mock answer from Gemini."
 
@@ -49,6 +60,32 @@ async def test_chat_success(client):
     assert data["answer"] == mock_answer
     assert len(data["sources"]) == 1
     assert data["sources"][0]["title"] == "mock title"
+    mock_gemini.generate_answer.assert_called_once_with(
+        "test query", mock_search_results, None
+    )
+
+@pytest.mark.asyncio
+async def test_chat_accepts_answer_strategy(client):
+    mock_splade = AsyncMock()
+    mock_search = AsyncMock()
+    mock_search.search.return_value = []
+    mock_llm = AsyncMock()
+    mock_llm.generate_answer.return_value = "answer"
+
+    app.dependency_overrides[get_splade_client] = lambda: mock_splade
+    app.dependency_overrides[get_search_client] = lambda: mock_search
+    app.dependency_overrides[get_llm_client] = lambda: mock_llm
+
+    response = await client.post(
+        "/chat", json={"query": "test query", "strategy": "map_reduce"}
+    )
+    assert response.status_code == 200
+    assert mock_llm.generate_answer.call_args.args[2] == "map_reduce"
+
+    response = await client.post(
+        "/chat", json={"query": "test query", "strategy": "unknown"}
+    )
+    assert response.status_code == 422
 
 @pytest.mark.asyncio
 async def test_chat_error(client):
@@ -56,11 +93,175 @@ async def test_chat_error(client):
     mock_splade.encode.side_effect = Exception("Encoding failed")
     
     app.dependency_overrides[get_splade_client] = lambda: mock_splade
+    app.dependency_overrides[get_search_client] = lambda: AsyncMock()
 
-    response = await client.post(
-        "/chat",
-        json={"query": "test query"}
-    )
+    with patch("api.main.settings.SPLADE_FALLBACK_TO_BM25", False):
+        response = await client.post(
+            "/chat",
+            json={"query": "test query"}
+        )
 
     assert response.status_code == 500
     assert "Encoding failed" in response.json()["detail"]
+
+@pytest.mark.asyncio
+async def test_chat_stream_sends_sources_then_tokens(client):
+    mock_splade = AsyncMock()
+    mock_splade.encode.return_value = {"hello": 1.5}
+    mock_search = AsyncMock()
+    mock_search.search.return_value = [
+        SearchResult(text="mock text", title="mock title", url="http://mock", score=1.0)
+    ]
+
+    async def stream_answer(query, contexts, strategy):
+        yield "Hello"
+        yield " world"
+
+    mock_llm = MagicMock()
+    mock_llm.stream_answer = stream_answer
+
+    app.dependency_overrides[get_splade_client] = lambda: mock_splade
+    app.dependency_overrides[get_search_client] = lambda: mock_search
+    app.dependency_overrides[get_llm_client] = lambda: mock_llm
+
+    response = await client.post("/chat/stream", json={"query": "test query"})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = []
+    for block in response.text.strip().split("\n\n"):
+        event, data = block.split("\n")
+        events.append((event.removeprefix("event: "), json.loads(data[6:])))
+    assert events[0] == ("sources", [mock_search.search.return_value[0].model_dump()])
+    assert events[1:] == [
+        ("token", {"content": "Hello"}),
+        ("token", {"content": " world"}),
+        ("done", {}),
+    ]
+
+@pytest.mark.asyncio
+async def test_chat_stream_reports_llm_errors_as_event(client):
+    mock_splade = AsyncMock()
+    mock_search = AsyncMock()
+    mock_search.search.return_value = []
+
+    async def stream_answer(query, contexts, strategy):
+        yield "Hel"
+        raise RuntimeError("LLM down")
+
+    mock_llm = MagicMock()
+    mock_llm.stream_answer = stream_answer
+
+    app.dependency_overrides[get_splade_client] = lambda: mock_splade
+    app.dependency_overrides[get_search_client] = lambda: mock_search
+    app.dependency_overrides[get_llm_client] = lambda: mock_llm
+
+    response = await client.post("/chat/stream", json={"query": "test query"})
+
+    assert response.status_code == 200
+    assert response.text.endswith(
+        'event: error\ndata: {"detail": "LLM down"}\n\n'
+    )
+
+@pytest.mark.asyncio
+async def test_chat_reuses_cached_retrieval_and_answer(client):
+    mock_splade = AsyncMock()
+    mock_splade.encode_or_none.return_value = {"hello": 1.5}
+    mock_search = AsyncMock()
+    mock_search.index_version.return_value = "scrapbox-pages-1"
+    mock_search.search.return_value = [
+        SearchResult(id="a-0", text="t", title="title", url="http://mock", score=1.0)
+    ]
+    mock_llm = AsyncMock()
+    mock_llm.model_name = "gemma3:4b"
+    mock_llm.generate_answer.return_value = "answer"
+
+    app.dependency_overrides[get_splade_client] = lambda: mock_splade
+    app.dependency_overrides[get_search_client] = lambda: mock_search
+    app.dependency_overrides[get_llm_client] = lambda: mock_llm
+
+    for query in ["Test  query", "test query"]:
+        response = await client.post("/chat", json={"query": query})
+        assert response.json()["answer"] == "answer"
+
+    mock_splade.encode_or_none.assert_called_once()
+    mock_llm.generate_answer.assert_called_once()
+    # 重複をまとめる前に多めに取得する
+    assert mock_search.search.call_args.kwargs["top_k"] == 20
+
+    # 戦略が違えば回答は作り直すが、検索結果は使い回す
+    await client.post("/chat", json={"query": "test query", "strategy": "stuff"})
+    mock_splade.encode_or_none.assert_called_once()
+    assert mock_llm.generate_answer.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_chat_falls_back_to_bm25_when_encoder_is_unavailable(client):
+    mock_splade = AsyncMock()
+    mock_splade.encode_or_none.return_value = None
+    mock_search = AsyncMock()
+    mock_search.search_hybrid.return_value = [
+        SearchResult(text="bm25 text", title="title", url="http://mock", score=3.0)
+    ]
+    mock_llm = AsyncMock()
+    mock_llm.model_name = "gemma3:4b"
+    mock_llm.generate_answer.return_value = "answer"
+
+    app.dependency_overrides[get_splade_client] = lambda: mock_splade
+    app.dependency_overrides[get_search_client] = lambda: mock_search
+    app.dependency_overrides[get_llm_client] = lambda: mock_llm
+
+    for _ in range(2):
+        response = await client.post("/chat", json={"query": "test query"})
+        assert response.status_code == 200
+        assert response.json()["sources"][0]["text"] == "bm25 text"
+
+    mock_search.search.assert_not_called()
+    assert mock_search.search_hybrid.call_args.args == ("test query", None)
+    # SPLADE なしの結果はキャッシュしない
+    assert mock_splade.encode_or_none.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_concurrent_chat_and_stream_share_one_generation(client):
+    mock_splade = AsyncMock()
+    mock_splade.encode_or_none.return_value = {"hello": 1.5}
+    mock_search = AsyncMock()
+    mock_search.search.return_value = [
+        SearchResult(id="a-0", text="t", title="title", url="http://mock", score=1.0)
+    ]
+    calls = 0
+
+    async def stream_answer(query, contexts, strategy):
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        yield "Hello"
+        yield " world"
+
+    mock_llm = MagicMock()
+    mock_llm.model_name = "gemma3:4b"
+    mock_llm.stream_answer = stream_answer
+    mock_llm.generate_answer = AsyncMock(return_value="other answer")
+
+    app.dependency_overrides[get_splade_client] = lambda: mock_splade
+    app.dependency_overrides[get_search_client] = lambda: mock_search
+    app.dependency_overrides[get_llm_client] = lambda: mock_llm
+
+    first, second, chat = await asyncio.gather(
+        client.post("/chat/stream", json={"query": "test query"}),
+        client.post("/chat/stream", json={"query": "test query"}),
+        client.post("/chat", json={"query": "test query"}),
+    )
+
+    # 最初に始まった生成を、他のリクエストは待って共有する
+    assert calls + mock_llm.generate_answer.call_count == 1
+    answer = chat.json()["answer"]
+    assert answer in ("Hello world", "other answer")
+    for response in (first, second):
+        tokens = [
+            json.loads(block.split("\n")[1][6:])["content"]
+            for block in response.text.strip().split("\n\n")
+            if block.startswith("event: token")
+        ]
+        assert "".join(tokens) == answer
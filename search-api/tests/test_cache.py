@@ -0,0 +1,105 @@
+import asyncio
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from api.cache import ChatCache, TTLCache, context_key, normalize_query
+from api.models import SearchResult
+
+
+def test_ttl_cache_expires_and_evicts_least_recently_used():
+    clock = [0.0]
+    with patch("api.cache.time.monotonic", lambda: clock[0]):
+        cache = TTLCache(max_entries=2, ttl=10.0)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        assert cache.get("a") == 1
+        cache.set("c", 3)
+
+        assert cache.get("b") is None
+        assert cache.get("a") == 1
+
+        clock[0] = 11.0
+        assert cache.get("a") is None
+        assert cache.get("c") is None
+    assert cache.stats()["size"] == 0
+
+
+async def test_get_or_compute_coalesces_concurrent_requests():
+    cache = TTLCache(max_entries=10, ttl=60.0)
+    calls = 0
+    release = asyncio.Event()
+
+    async def compute():
+        nonlocal calls
+        calls += 1
+        await release.wait()
+        return "answer"
+
+    waiters = [
+        asyncio.create_task(cache.get_or_compute("q", compute)) for _ in range(3)
+    ]
+    await asyncio.sleep(0)
+    release.set()
+
+    assert await asyncio.gather(*waiters) == ["answer"] * 3
+    assert calls == 1
+    assert cache.stats()["coalesced"] == 2
+    # 完了した結果はキャッシュから返す
+    assert await cache.get_or_compute("q", compute) == "answer"
+    assert calls == 1
+
+
+async def test_get_or_compute_does_not_cache_failures():
+    cache = TTLCache(max_entries=10, ttl=60.0)
+    compute = AsyncMock(side_effect=[RuntimeError("down"), "ok"])
+
+    with pytest.raises(RuntimeError):
+        await cache.get_or_compute("q", compute)
+    assert await cache.get_or_compute("q", compute) == "ok"
+
+
+async def test_clear_discards_results_of_running_computations():
+    cache = TTLCache(max_entries=10, ttl=60.0)
+    release = asyncio.Event()
+
+    async def compute():
+        await release.wait()
+        return "stale"
+
+    task = asyncio.create_task(cache.get_or_compute("q", compute))
+    await asyncio.sleep(0)
+    cache.clear()
+    release.set()
+
+    assert await task == "stale"
+    assert cache.get("q") is None
+
+
+def test_normalize_query_and_context_key():
+    assert normalize_query("  Ｓｃｒａｐｂｏｘ　とは\n") == "scrapbox とは"
+    contexts = [
+        SearchResult(id="a-0", text="x", title="t", url="u", score=1.0),
+        SearchResult(text="y", title="t", url="u", score=1.0),
+    ]
+    key = context_key(contexts)
+    assert key[0] == "a-0"
+    assert key[1] != context_key([contexts[0].model_copy(update={"text": "z"})])[0]
+
+
+async def test_chat_cache_clears_when_index_version_changes():
+    cache = ChatCache()
+    get_version = AsyncMock(side_effect=["pages-1", "pages-1", "pages-2"])
+
+    with patch("api.cache.settings.CACHE_VERSION_CHECK_INTERVAL", 0):
+        await cache.check_index_version(get_version)
+        cache.retrieval.set("q", "contexts")
+        cache.answers.set("k", "answer")
+
+        await cache.check_index_version(get_version)
+        assert cache.retrieval.get("q") == "contexts"
+
+        await cache.check_index_version(get_version)
+        assert cache.retrieval.get("q") is None
+        assert cache.answers.get("k") is None
+        assert cache.index_version == "pages-2"
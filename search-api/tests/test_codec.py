@@ -0,0 +1,77 @@
+import importlib.util
+import struct
+from pathlib import Path
+
+import pytest
+
+from api import codec
+
+
+def _raw(vectors, weight_format="e"):
+    parts = [struct.pack("<I", len(vectors))]
+    for ids, weights in vectors:
+        n = len(ids)
+        parts.append(struct.pack("<I", n))
+        parts.append(struct.pack(f"<{n}i", *ids))
+        parts.append(struct.pack(f"<{n}{weight_format}", *weights))
+    return b"".join(parts)
+
+
+def test_decode_raw_float16():
+    content = _raw([([3, 70000], [1.5, 0.25]), ([], [])])
+    vectors = codec.decode(content, f"{codec.RAW}; dtype=float16")
+    assert vectors == [([3, 70000], [1.5, 0.25]), ([], [])]
+
+
+def test_decode_raw_float32():
+    content = _raw([([1], [0.1])], weight_format="f")
+    ((ids, weights),) = codec.decode(content, f"{codec.RAW}; dtype=float32")
+    assert ids == [1]
+    assert weights[0] == pytest.approx(0.1)
+
+
+def test_decode_unsupported():
+    with pytest.raises(ValueError):
+        codec.decode(b"", "text/plain")
+
+
+def test_decode_drops_non_positive_weights():
+    # float16 で 0 に丸められた重みは rank_features に登録できない
+    content = _raw([([1, 2, 3], [0.5, 1e-8, -0.0])])
+    assert codec.decode(content, f"{codec.RAW}; dtype=float16") == [([1], [0.5])]
+
+
+def _encoder_codec():
+    # エンコーダー側の実装（リポジトリ全体をチェックアウトしたときだけ）
+    path = (
+        Path(__file__).resolve().parents[2] / "splade-encoder-api" / "api" / "codec.py"
+    )
+    if not path.exists():
+        pytest.skip("splade-encoder-api is not checked out")
+    spec = importlib.util.spec_from_file_location("encoder_codec", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.mark.parametrize("dtype", ["float16", "float32"])
+def test_decode_matches_encoder_pack(dtype):
+    encoder_codec = _encoder_codec()
+    vectors = [([3, 70000, 5], [1.5, 0.25, 2.0]), ([], [])]
+    media_types = [codec.RAW] + ([codec.MSGPACK] if codec.msgpack else [])
+
+    for media_type in media_types:
+        content = encoder_codec.pack(vectors, media_type, dtype)
+        content_type = encoder_codec.content_type(media_type, dtype)
+        assert codec.decode(content, content_type) == vectors
+
+    # accept_header で要求した形式をエンコーダーが選ぶ
+    assert encoder_codec.negotiate(codec.accept_header()) == (codec.RAW, "float16")
+
+
+def test_decoders_of_both_clients_are_identical():
+    root = Path(__file__).resolve().parents[2]
+    copies = [root / "search-api/api/codec.py", root / "ingestion-batch/batch/codec.py"]
+    if not all(path.exists() for path in copies):
+        pytest.skip("both clients are not checked out")
+    assert copies[0].read_text() == copies[1].read_text()
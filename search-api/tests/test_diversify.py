@@ -0,0 +1,75 @@
+from unittest.mock import patch
+
+from api.diversify import collapse_by_page, diversify, mmr
+from api.models import SearchResult
+
+
+def result(doc_id, text, score, url=None):
+    page = doc_id.rsplit("-", 1)[0]
+    return SearchResult(
+        id=doc_id, text=text, title=page, url=url or f"http://{page}", score=score
+    )
+
+
+def test_collapse_merges_overlapping_neighbor_chunks():
+    results = [
+        result("p-1", "0123456789abcdefghij", 2.0),
+        result("q-0", "other page", 1.5),
+        result("p-0", "ABCDEFGHIJ0123456789", 1.0),
+        result("p-3", "far away chunk", 0.5),
+    ]
+
+    collapsed = collapse_by_page(results)
+
+    assert [r.id for r in collapsed] == ["p-0+p-1", "q-0", "p-3"]
+    page = collapsed[0]
+    assert page.score == 2.0
+    # 重なった 10 文字は1回だけ。離れたチャンクはまとめず別の候補に残す
+    assert page.text == "ABCDEFGHIJ0123456789abcdefghij"
+    assert collapsed[2].text == "far away chunk"
+
+
+def test_collapse_caps_run_around_best_chunk():
+    scores = [0.1, 0.5, 2.0, 0.9, 0.2]
+    results = [result(f"p-{i}", f"chunk {i}", s) for i, s in enumerate(scores)]
+
+    with patch("api.diversify.settings.SEARCH_MERGE_MAX_CHUNKS", 3):
+        collapsed = collapse_by_page(results)
+
+    # 最高スコアの p-2 と、スコアの高い隣から順に3つまで
+    assert [r.id for r in collapsed] == ["p-1+p-2+p-3", "p-4", "p-0"]
+    assert collapsed[0].text == "chunk 1\nchunk 2\nchunk 3"
+
+
+def test_collapse_strips_repeated_title_of_structured_chunks():
+    results = [
+        result("p-0", "p\nfirst block", 1.0),
+        result("p-1", "p\nsecond block", 0.9),
+    ]
+
+    (page,) = collapse_by_page(results)
+
+    assert page.text == "p\nfirst block\nsecond block"
+
+
+def test_mmr_prefers_diverse_results():
+    results = [
+        result("a-0", "スクラップボックスの使い方について", 1.0),
+        result("b-0", "スクラップボックスの使い方について。", 0.95),
+        result("c-0", "全く別の話題、料理のレシピ", 0.9),
+    ]
+
+    assert [r.id for r in mmr(results, 2, 0.5)] == ["a-0", "c-0"]
+    assert [r.id for r in mmr(results, 2, 1.0)] == ["a-0", "b-0"]
+
+
+def test_diversify_can_be_disabled():
+    results = [result("p-0", "same page", 1.0), result("p-1", "same page 2", 0.5)]
+
+    with (
+        patch("api.diversify.settings.SEARCH_COLLAPSE_BY_PAGE", False),
+        patch("api.diversify.settings.SEARCH_MMR_LAMBDA", 1.0),
+    ):
+        assert diversify(results, 1) == results[:1]
+    # 隣り合うチャンクは1つにまとまる
+    assert [r.id for r in diversify(results, 5)] == ["p-0+p-1"]
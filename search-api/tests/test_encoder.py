@@ -0,0 +1,121 @@
+import asyncio
+import struct
+
+import httpx
+import pytest
+
+from api.encoder import SpladeClient
+
+
+def _mock_client(handler):
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+
+@pytest.mark.asyncio
+async def test_encode_binary_maps_ids_with_vocab():
+    requests = []
+
+    def handler(request: httpx.Request):
+        requests.append(request)
+        if request.url.path == "/vocab":
+            return httpx.Response(200, json={"tokens": ["[PAD]", "scrap", "box"]})
+        content = struct.pack("<II2i2e", 1, 2, 2, 1, 1.5, 0.5)
+        return httpx.Response(
+            200,
+            content=content,
+            headers={"content-type": "application/x-splade-sparse; dtype=float16"},
+        )
+
+    client = SpladeClient(api_url="http://splade/encode", client=_mock_client(handler))
+    client.binary = True
+
+    assert await client.encode("query") == {"box": 1.5, "scrap": 0.5}
+    assert await client.encode("query") == {"box": 1.5, "scrap": 0.5}
+
+    # Vocabulary is fetched once and reused
+    assert [r.url.path for r in requests] == ["/encode", "/vocab", "/encode"]
+    assert "application/x-splade-sparse" in requests[0].headers["accept"]
+
+
+@pytest.mark.asyncio
+async def test_encode_json_response():
+    def handler(request: httpx.Request):
+        return httpx.Response(200, json={"sparse_vector": {"hello": 1.0}})
+
+    client = SpladeClient(api_url="http://splade/encode", client=_mock_client(handler))
+
+    assert await client.encode("query") == {"hello": 1.0}
+
+
+@pytest.mark.asyncio
+async def test_connections_are_reused_until_closed():
+    def handler(request: httpx.Request):
+        return httpx.Response(200, json={"sparse_vector": {"hello": 1.0}})
+
+    http = _mock_client(handler)
+    client = SpladeClient(api_url="http://splade/encode", client=http)
+
+    await client.encode("a")
+    await client.encode("b")
+    # The same pooled client serves every request
+    assert client.client is http
+    assert not http.is_closed
+
+    await client.close()
+    assert http.is_closed
+
+
+def test_lifespan_creates_and_closes_clients(monkeypatch):
+    from fastapi.testclient import TestClient
+
+    from api import deps
+    from api.main import app
+
+    closed = []
+    for cls in (deps.SearchClient, deps.SpladeClient, deps.LLMClient):
+
+        async def close(self, name=cls.__name__):
+            closed.append(name)
+
+        monkeypatch.setattr(cls, "close", close)
+
+    with TestClient(app):
+        assert deps.get_splade_client() is not None
+        splade = deps.get_splade_client()
+        assert deps.get_splade_client() is splade
+
+    assert sorted(closed) == ["LLMClient", "SearchClient", "SpladeClient"]
+    assert deps.get_splade_client() is None
+
+
+@pytest.mark.asyncio
+async def test_encode_or_none_skips_encoder_after_repeated_failures(monkeypatch):
+    calls = 0
+
+    def handler(request: httpx.Request):
+        nonlocal calls
+        calls += 1
+        return httpx.Response(503)
+
+    monkeypatch.setattr("api.encoder.settings.SPLADE_FAILURE_THRESHOLD", 2)
+    client = SpladeClient(api_url="http://splade/encode", client=_mock_client(handler))
+
+    assert await client.encode_or_none("a") is None
+    assert client.available
+    assert await client.encode_or_none("b") is None
+    assert not client.available
+    # クールダウン中はエンコーダーを呼ばない
+    assert await client.encode_or_none("c") is None
+    assert calls == 2
+
+
+@pytest.mark.asyncio
+async def test_encode_or_none_times_out_slow_encoder(monkeypatch):
+    async def handler(request: httpx.Request):
+        await asyncio.sleep(1)
+        return httpx.Response(200, json={"sparse_vector": {"hello": 1.0}})
+
+    monkeypatch.setattr("api.encoder.settings.SPLADE_FAST_PATH_TIMEOUT", 0.01)
+    client = SpladeClient(api_url="http://splade/encode", client=_mock_client(handler))
+
+    assert await client.encode_or_none("a") is None
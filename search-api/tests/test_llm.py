@@ -1,3 +1,6 @@
+import asyncio
+import json
+import httpx
 import pytest
 from unittest.mock import AsyncMock, MagicMock, patch
 from api.llm import LLMClient
@@ -65,3 +68,124 @@ async def test_generate_answer_multiple_chunks(llm_client):
         assert "text3" in second_prompt
         assert "# 既存の回答" in second_prompt
         assert "Initial Answer" in second_prompt
+
+@pytest.mark.asyncio
+async def test_stream_answer_refines_then_streams_last_chunk():
+    requests = []
+
+    def handler(request: httpx.Request):
+        requests.append(request)
+        body = "".join(
+            f"data: {chunk}\n\n"
+            for chunk in [
+                '{"choices": [{"delta": {"role": "assistant"}}]}',
+                '{"choices": [{"delta": {"content": "Refined"}}]}',
+                '{"choices": [{"delta": {"content": " Answer"}}]}',
+                "[DONE]",
+            ]
+        )
+        return httpx.Response(
+            200, content=body, headers={"content-type": "text/event-stream"}
+        )
+
+    http = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    llm_client = LLMClient(client=http)
+    llm_client._generate_with_retry = AsyncMock(return_value="Initial Answer")
+    contexts = [
+        SearchResult(text=f"text{i}", title=f"title{i}", url=f"url{i}", score=1.0)
+        for i in range(4)
+    ]
+
+    with patch("api.llm.settings.LLM_CONTEXT_CHUNK_SIZE", 3):
+        tokens = [t async for t in llm_client.stream_answer("query", contexts)]
+
+    assert tokens == ["Refined", " Answer"]
+    # 最後のチャンク以外は通常の呼び出しで Refine し、最後だけをストリーミングする
+    llm_client._generate_with_retry.assert_called_once()
+    (request,) = requests
+    payload = json.loads(request.content)
+    assert payload["stream"] is True
+    assert "Initial Answer" in payload["messages"][0]["content"]
+    assert "text3" in payload["messages"][0]["content"]
+
+@pytest.mark.asyncio
+async def test_generate_answer_map_reduce_runs_chunks_concurrently(llm_client):
+    contexts = [
+        SearchResult(text=f"text{i}", title=f"title{i}", url=f"url{i}", score=1.0)
+        for i in range(7)
+    ]
+    running, peak = 0, 0
+
+    async def generate(prompt):
+        nonlocal running, peak
+        if "# 部分回答" in prompt:
+            return "Final Answer"
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        return f"partial {prompt.count('--- Source')}"
+
+    llm_client._generate_with_retry = AsyncMock(side_effect=generate)
+
+    with (
+        patch("api.llm.settings.LLM_CONTEXT_CHUNK_SIZE", 3),
+        patch("api.llm.settings.LLM_MAX_CONCURRENCY", 2),
+    ):
+        result = await llm_client.generate_answer("query", contexts, "map_reduce")
+
+    assert result == "Final Answer"
+    # 3 つの map と 1 つの reduce（同時実行数は上限まで）
+    assert llm_client._generate_with_retry.call_count == 4
+    assert peak == 2
+    reduce_prompt = llm_client._generate_with_retry.call_args_list[-1][0][0]
+    assert "partial 3" in reduce_prompt
+    assert "partial 1" in reduce_prompt
+    assert "text0" not in reduce_prompt
+
+
+@pytest.mark.asyncio
+async def test_generate_answer_stuff_packs_contexts_within_budget(llm_client):
+    contexts = [
+        SearchResult(text="あ" * 100, title=f"title{i}", url=f"url{i}", score=1.0)
+        for i in range(5)
+    ]
+    llm_client._generate_with_retry = AsyncMock(return_value="Answer")
+
+    with (
+        patch("api.llm.settings.LLM_ANSWER_STRATEGY", "stuff"),
+        # 600 - 200（回答）- 112（指示と質問）= 288 トークンに 109 トークンずつ
+        patch("api.llm.settings.LLM_CONTEXT_WINDOW", 600),
+        patch("api.llm.settings.LLM_MAX_ANSWER_TOKENS", 200),
+    ):
+        result = await llm_client.generate_answer("query", contexts)
+
+    assert result == "Answer"
+    llm_client._generate_with_retry.assert_called_once()
+    prompt = llm_client._generate_with_retry.call_args[0][0]
+    assert "title1" in prompt
+    assert "title2" not in prompt
+
+
+@pytest.mark.asyncio
+async def test_generate_answer_sends_max_tokens():
+    payloads = []
+
+    def handler(request: httpx.Request):
+        payloads.append(json.loads(request.content))
+        return httpx.Response(
+            200,
+            json={
+                "choices": [{"message": {"content": "Answer"}}],
+                "usage": {"prompt_tokens": 10, "completion_tokens": 2},
+            },
+        )
+
+    http = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    llm_client = LLMClient(client=http)
+    contexts = [SearchResult(text="text", title="title", url="url", score=1.0)]
+
+    with patch("api.llm.settings.LLM_MAX_ANSWER_TOKENS", 256):
+        assert await llm_client.generate_answer("query", contexts) == "Answer"
+
+    assert payloads[0]["max_tokens"] == 256
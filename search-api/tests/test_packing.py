@@ -0,0 +1,98 @@
+from unittest.mock import patch
+
+import pytest
+
+from api.models import SearchResult
+from api.packing import TokenCounter, estimate_tokens, pack_contexts
+
+
+def _context(i, text):
+    return SearchResult(text=text, title=f"title{i}", url=f"url{i}", score=1.0)
+
+
+@pytest.fixture
+def counter():
+    return TokenCounter(name="")
+
+
+def test_estimate_tokens_counts_japanese_per_character():
+    assert estimate_tokens("abcd") == 1
+    assert estimate_tokens("あいう") == 3
+
+
+def test_truncate_cuts_at_line_boundary(counter):
+    text = "\n".join("あ" * 10 for _ in range(10))
+
+    truncated = counter.truncate(text, 40)
+
+    assert counter.count(truncated) <= 40
+    assert truncated.endswith("\n…")
+    # 行の途中では切らない
+    assert all(line == "あ" * 10 for line in truncated.split("\n")[:-1])
+
+
+def test_truncate_cuts_long_line(counter):
+    truncated = counter.truncate("あ" * 100, 20)
+
+    assert counter.count(truncated) <= 20
+    assert truncated.startswith("あ" * 10)
+
+
+def test_pack_contexts_fills_calls_up_to_budget(counter):
+    # 1つ 109 トークン（区切りを含む）、予算は 1000 - 200 - 100 = 700
+    contexts = [_context(i, "あ" * 100) for i in range(8)]
+
+    with (
+        patch("api.packing.settings.LLM_CONTEXT_WINDOW", 1000),
+        patch("api.packing.settings.LLM_MAX_ANSWER_TOKENS", 200),
+    ):
+        groups = pack_contexts(contexts, counter, overhead=100)
+        assert [len(g) for g in groups] == [6, 2]
+
+        # 件数の上限もあればそれに従う
+        groups = pack_contexts(contexts, counter, overhead=100, max_per_call=3)
+        assert [len(g) for g in groups] == [3, 3, 2]
+
+
+def test_pack_contexts_fills_earlier_calls_first(counter):
+    # 大きいものが入らなくても、後ろの小さいものは前の呼び出しの空きに入る
+    contexts = [
+        _context(0, "あ" * 400),
+        _context(1, "あ" * 400),
+        _context(2, "あ" * 50),
+    ]
+
+    with (
+        patch("api.packing.settings.LLM_CONTEXT_WINDOW", 1000),
+        patch("api.packing.settings.LLM_MAX_ANSWER_TOKENS", 200),
+    ):
+        groups = pack_contexts(contexts, counter, overhead=100)
+
+    assert [[c.title for c in g] for g in groups] == [
+        ["title0", "title2"],
+        ["title1"],
+    ]
+
+
+def test_pack_contexts_truncates_oversized_context(counter):
+    contexts = [_context(0, "あ" * 5000)]
+
+    with (
+        patch("api.packing.settings.LLM_CONTEXT_WINDOW", 1000),
+        patch("api.packing.settings.LLM_MAX_ANSWER_TOKENS", 200),
+        patch("api.packing.settings.LLM_MAX_CONTEXT_TOKENS", 300),
+    ):
+        (group,) = pack_contexts(contexts, counter, overhead=100)
+
+    (context,) = group
+    assert context.text.endswith("…")
+    assert counter.count(f"--- Source: title0 (url0) ---\n{context.text}") <= 300
+
+
+def test_pack_contexts_without_room_raises(counter):
+    with (
+        patch("api.packing.settings.LLM_CONTEXT_WINDOW", 1000),
+        patch("api.packing.settings.LLM_MAX_ANSWER_TOKENS", 900),
+    ):
+        with pytest.raises(ValueError):
+            pack_contexts([_context(0, "text")], counter, overhead=100)
@@ -0,0 +1,39 @@
+from api.query import build_search_body, build_sparse_query, prune_terms
+
+VECTOR = {"a": 0.1, "b": 2.0, "c": 0.5, "d": 1.0}
+
+
+def test_prune_terms_keeps_top_weighted_terms_in_order():
+    assert prune_terms(VECTOR, max_terms=2, min_weight=0.0) == {"b": 2.0, "d": 1.0}
+    assert prune_terms(VECTOR, max_terms=0, min_weight=0.5) == {
+        "b": 2.0,
+        "c": 0.5,
+        "d": 1.0,
+    }
+    assert prune_terms(VECTOR, max_terms=0, min_weight=0.0) == VECTOR
+
+
+def test_build_sparse_query_formulations():
+    saturation = build_sparse_query({"b": 2.0}, "saturation")
+    assert saturation == {
+        "bool": {
+            "should": [{"rank_feature": {"field": "sparse_vector.b", "boost": 2.0}}]
+        }
+    }
+
+    linear = build_sparse_query({"b": 2.0}, "linear")
+    assert linear["bool"]["should"][0]["rank_feature"]["linear"] == {}
+
+    assert build_sparse_query({"b": 2.0}, "sparse_vector") == {
+        "sparse_vector": {"field": "sparse_vector", "query_vector": {"b": 2.0}}
+    }
+
+
+def test_build_search_body_filters_source_and_skips_total_hits():
+    body = build_search_body(VECTOR, 3, max_terms=1, scoring="linear")
+
+    assert len(body["query"]["bool"]["should"]) == 1
+    assert body["size"] == 3
+    assert body["source"] == ["text", "title", "url"]
+    assert body["track_total_hits"] is False
+    assert build_search_body(VECTOR, 3, min_weight=5.0) is None
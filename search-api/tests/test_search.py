@@ -50,6 +50,8 @@ async def test_search_success(search_client):
     should = query["bool"]["should"]
     assert len(should) == 2
     assert should[0]["rank_feature"]["field"] == "sparse_vector.token1"
+    # スパースベクトル本体は取得しない
+    assert "sparse_vector" not in call_args["source"]
 
 @pytest.mark.asyncio
 async def test_search_error(search_client):
@@ -59,3 +61,75 @@ async def test_search_error(search_client):
         await search_client.search({"test": 1.0})
     
     assert "ES connection error" in str(excinfo.value)
+
+def _index_stats(count, index_total):
+    primaries = {
+        "docs": {"count": count, "deleted": 0},
+        "indexing": {"index_total": index_total, "delete_total": 0},
+    }
+    return {"_all": {"primaries": primaries}}
+
+@pytest.mark.asyncio
+async def test_index_version_resolves_alias(search_client):
+    search_client.es.indices.exists_alias = AsyncMock(return_value=True)
+    search_client.es.indices.get_alias = AsyncMock(
+        return_value={"scrapbox-pages-20260101000000": {}}
+    )
+    search_client.es.indices.stats = AsyncMock(return_value=_index_stats(10, 10))
+    version = await search_client.index_version()
+    assert version == "scrapbox-pages-20260101000000@10/0/10/0"
+
+    search_client.es.indices.exists_alias = AsyncMock(return_value=False)
+    version = await search_client.index_version()
+    assert version.startswith(f"{search_client.index_name}@")
+
+@pytest.mark.asyncio
+async def test_index_version_changes_on_incremental_writes(search_client):
+    search_client.es.indices.exists_alias = AsyncMock(return_value=False)
+    search_client.es.indices.stats = AsyncMock(return_value=_index_stats(10, 10))
+    before = await search_client.index_version()
+
+    # 差分更新でページを上書きしただけ（ドキュメント数は同じ）でも変わる
+    search_client.es.indices.stats = AsyncMock(return_value=_index_stats(10, 12))
+    assert await search_client.index_version() != before
+
+def _hit(doc_id, score):
+    source = {"text": f"text {doc_id}", "title": doc_id, "url": f"http://{doc_id}"}
+    return {"_id": doc_id, "_score": score, "_source": source}
+
+@pytest.mark.asyncio
+async def test_search_hybrid_fuses_bm25_and_sparse_in_one_msearch(search_client):
+    search_client.es.msearch = AsyncMock(
+        return_value={
+            "responses": [
+                {"hits": {"hits": [_hit("a", 9.0), _hit("b", 5.0)]}},
+                {"hits": {"hits": [_hit("b", 2.0), _hit("c", 1.0)]}},
+            ]
+        }
+    )
+
+    results = await search_client.search_hybrid("クエリ", {"token": 1.0}, top_k=2)
+
+    # 両方に出てくる b が RRF で最上位になる
+    assert [r.id for r in results] == ["b", "a"]
+    searches = search_client.es.msearch.call_args.kwargs["searches"]
+    assert searches[1]["query"]["multi_match"]["query"] == "クエリ"
+    assert "rank_feature" in searches[3]["query"]["bool"]["should"][0]
+    assert searches[1]["_source"] == ["text", "title", "url"]
+
+    with patch("api.search.settings.SEARCH_FUSION", "weighted"):
+        results = await search_client.search_hybrid("クエリ", {"token": 1.0}, top_k=3)
+    # BM25 の重み 0.3 に対して SPLADE の 1 位（b）が最上位
+    assert [r.id for r in results] == ["b", "a", "c"]
+
+@pytest.mark.asyncio
+async def test_search_hybrid_without_vector_uses_bm25_only(search_client):
+    response = {"hits": {"hits": [_hit("a", 1.0)]}}
+    search_client.es.search = AsyncMock(return_value=response)
+    search_client.es.msearch = AsyncMock()
+
+    results = await search_client.search_hybrid("クエリ", None)
+
+    assert [r.id for r in results] == ["a"]
+    search_client.es.msearch.assert_not_called()
+    assert "multi_match" in search_client.es.search.call_args.kwargs["query"]
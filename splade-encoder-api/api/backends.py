@@ -0,0 +1,149 @@
+import os
+from types import SimpleNamespace
+
+import torch
+from transformers import AutoConfig, AutoModelForMaskedLM, AutoTokenizer
+
+BACKENDS = ("torch", "torch-int8", "onnx")
+
+
+def default_onnx_path(model_id: str) -> str:
+    cache_dir = os.path.expanduser("~/.cache/splade-encoder-api")
+    return os.path.join(cache_dir, model_id.replace("/", "--"), "model.onnx")
+
+
+def prepare_local_model(model_id: str, cache_dir: str) -> str:
+    """Return a local directory holding the model as safetensors.
+
+    The first call downloads the model and saves it under ``cache_dir``;
+    later starts load straight from disk, where safetensors weights are
+    memory-mapped instead of unpickled.
+    """
+    path = os.path.join(cache_dir, model_id.replace("/", "--"))
+    if not os.path.exists(os.path.join(path, "config.json")):
+        AutoTokenizer.from_pretrained(model_id).save_pretrained(path)
+        AutoModelForMaskedLM.from_pretrained(model_id).save_pretrained(
+            path, safe_serialization=True
+        )
+    return path
+
+
+def load_model(
+    model_id: str, backend: str = "torch", device: str = "cpu", onnx_path: str = None
+):
+    """Load the masked LM for the given inference backend.
+
+    Every backend returns a callable taking tokenizer outputs as keyword
+    arguments and returning an object with ``.logits``, so the encoder does not
+    need to know which one is in use.
+    """
+    if backend == "torch":
+        model = AutoModelForMaskedLM.from_pretrained(model_id).to(device)
+        model.eval()
+        return model
+
+    if backend == "torch-int8":
+        if device != "cpu":
+            raise ValueError("torch-int8 backend only supports device='cpu'")
+        model = AutoModelForMaskedLM.from_pretrained(model_id)
+        model.eval()
+        return torch.ao.quantization.quantize_dynamic(
+            model, {torch.nn.Linear}, dtype=torch.qint8
+        )
+
+    if backend == "onnx":
+        if device != "cpu":
+            raise ValueError("onnx backend only supports device='cpu'")
+        return OnnxMaskedLM(model_id, onnx_path or default_onnx_path(model_id))
+
+    raise ValueError(f"Unknown backend: {backend} (expected one of {BACKENDS})")
+
+
+class OnnxMaskedLM:
+    """ONNX Runtime wrapper exposing the same call interface as the HF model.
+
+    The graph is exported from the PyTorch model on first use and reused from
+    ``onnx_path`` afterwards.
+    """
+
+    def __init__(self, model_id: str, onnx_path: str):
+        try:
+            import onnxruntime as ort
+        except ImportError as e:
+            raise ImportError(
+                "onnx backend requires onnxruntime: uv sync --extra onnx"
+            ) from e
+
+        self.config = AutoConfig.from_pretrained(model_id)
+        if not os.path.exists(onnx_path):
+            export_onnx(model_id, onnx_path)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(
+            onnx_path, options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = [i.name for i in self.session.get_inputs()]
+
+    def __call__(self, **inputs):
+        feeds = {
+            name: inputs[name].cpu().numpy()
+            for name in self.input_names
+            if name in inputs
+        }
+        (logits,) = self.session.run(["logits"], feeds)
+        return SimpleNamespace(logits=torch.from_numpy(logits))
+
+    def eval(self):
+        return self
+
+
+def export_onnx(model_id: str, onnx_path: str):
+    model = AutoModelForMaskedLM.from_pretrained(model_id)
+    model.eval()
+
+    os.makedirs(os.path.dirname(onnx_path), exist_ok=True)
+    dummy = torch.ones((1, 8), dtype=torch.long)
+    torch.onnx.export(
+        model,
+        (dummy, dummy),
+        onnx_path,
+        input_names=["input_ids", "attention_mask"],
+        output_names=["logits"],
+        dynamic_axes={
+            "input_ids": {0: "batch", 1: "sequence"},
+            "attention_mask": {0: "batch", 1: "sequence"},
+            "logits": {0: "batch", 1: "sequence"},
+        },
+        dynamo=False,
+    )
+
+
+def check_parity(
+    reference: list[dict[str, float]],
+    candidate: list[dict[str, float]],
+    atol: float = 0.05,
+) -> dict:
+    """Compare sparse outputs of two backends.
+
+    Terms missing on one side count as weight 0, so pruned or extra terms show
+    up as differences too. Returns the worst absolute weight difference and
+    whether every vector stays within ``atol``.
+    """
+    max_abs_diff = 0.0
+    term_overlap = []
+    for ref, cand in zip(reference, candidate, strict=True):
+        terms = ref.keys() | cand.keys()
+        for term in terms:
+            diff = abs(ref.get(term, 0.0) - cand.get(term, 0.0))
+            max_abs_diff = max(max_abs_diff, diff)
+        if terms:
+            term_overlap.append(len(ref.keys() & cand.keys()) / len(terms))
+
+    return {
+        "max_abs_diff": max_abs_diff,
+        "mean_term_overlap": (
+            sum(term_overlap) / len(term_overlap) if term_overlap else 1.0
+        ),
+        "within_tolerance": max_abs_diff <= atol,
+    }
@@ -0,0 +1,141 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+from .metrics import Histogram, power_of_two_buckets
+
+
+class QueueFullError(Exception):
+    """Raised when the admission queue cannot accept more requests."""
+
+
+class MicroBatcher:
+    """Coalesce concurrent encode calls into padded batches.
+
+    Requests arriving within ``max_wait_ms`` of the first queued request are
+    grouped (up to ``max_batch_size``) and passed to ``batch_fn`` in one call,
+    which runs on a pool of ``num_workers`` threads so the event loop stays
+    responsive. At most ``max_queue_size`` requests may wait for a worker;
+    beyond that ``submit`` fails fast with ``QueueFullError``.
+    """
+
+    def __init__(
+        self,
+        batch_fn: Callable[[list[Any]], list[Any]],
+        max_batch_size: int = 32,
+        max_wait_ms: float = 5.0,
+        num_workers: int = 1,
+        max_queue_size: int = 256,
+        worker_init: Callable[[], None] | None = None,
+    ):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.num_workers = num_workers
+        self.max_queue_size = max_queue_size
+
+        self._executor = ThreadPoolExecutor(
+            max_workers=num_workers,
+            thread_name_prefix="splade-batch",
+            initializer=worker_init,
+        )
+        self._queue: asyncio.Queue | None = None
+        self._workers: list[asyncio.Task] = []
+        self._in_flight = 0
+        self.rejected = 0
+
+        self.batch_sizes = Histogram(power_of_two_buckets(max_batch_size))
+        self.queue_depths = Histogram(power_of_two_buckets(max_queue_size))
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def submit(self, item: Any) -> Any:
+        (result,) = await self.submit_many([item])
+        return result
+
+    async def submit_many(self, items: list[Any]) -> list[Any]:
+        """Enqueue all items at once, or reject them all if the queue is full."""
+        self._ensure_workers()
+        depth = self.queue_depth
+        # An idle queue always admits a request, however large
+        if depth > 0 and depth + len(items) > self.max_queue_size:
+            self.rejected += 1
+            raise QueueFullError(
+                f"Encode queue is full ({depth}/{self.max_queue_size})"
+            )
+
+        loop = asyncio.get_running_loop()
+        futures = []
+        for item in items:
+            future = loop.create_future()
+            self._queue.put_nowait((item, future))
+            futures.append(future)
+        return await asyncio.gather(*futures)
+
+    def _ensure_workers(self):
+        if not self._workers or all(w.done() for w in self._workers):
+            self._queue = asyncio.Queue()
+            self._workers = [
+                asyncio.create_task(self._run()) for _ in range(self.num_workers)
+            ]
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            self.queue_depths.observe(self._queue.qsize() + 1)
+
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            # Callers may have gone away while waiting in the queue
+            batch = [(item, fut) for item, fut in batch if not fut.cancelled()]
+            if not batch:
+                continue
+
+            self.batch_sizes.observe(len(batch))
+            items = [item for item, _ in batch]
+            self._in_flight += 1
+            try:
+                results = await loop.run_in_executor(
+                    self._executor, self.batch_fn, items
+                )
+                for (_, fut), result in zip(batch, results, strict=True):
+                    if not fut.done():
+                        fut.set_result(result)
+            except Exception as e:
+                for _, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+            finally:
+                self._in_flight -= 1
+
+    async def close(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._executor.shutdown(wait=False)
+
+    def stats(self) -> dict:
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "num_workers": self.num_workers,
+            "max_queue_size": self.max_queue_size,
+            "in_flight_batches": self._in_flight,
+            "rejected": self.rejected,
+            "queue_depth": self.queue_depth,
+            "queue_depth_histogram": self.queue_depths.snapshot(),
+            "batch_size_histogram": self.batch_sizes.snapshot(),
+        }
@@ -0,0 +1,81 @@
+"""Compact encodings for sparse vectors, selected by the Accept header.
+
+``application/x-splade-sparse`` is a raw little-endian buffer::
+
+    uint32 vector_count
+    repeated vector_count times:
+        uint32 nnz
+        int32[nnz] token ids
+        float16[nnz] or float32[nnz] weights
+
+``application/x-msgpack`` carries the same id / weight buffers in a msgpack
+map (``{"dtype", "vectors": [{"ids", "weights"}], "stats"}``) and is only
+offered when the optional ``msgpack`` package is installed.
+
+Both accept a ``dtype=float16|float32`` media type parameter (default
+``float32``), echoed back in the response Content-Type.
+"""
+
+import struct
+
+try:
+    import msgpack
+except ImportError:  # optional dependency
+    msgpack = None
+
+JSON = "application/json"
+RAW = "application/x-splade-sparse"
+MSGPACK = "application/x-msgpack"
+
+_WEIGHT_FORMATS = {"float16": "e", "float32": "f"}
+
+
+def negotiate(accept: str | None) -> tuple[str, str]:
+    """Pick the response media type and weight dtype for an Accept header."""
+    for media_range in (accept or "").split(","):
+        media_type, *params = [part.strip() for part in media_range.split(";")]
+        if media_type == MSGPACK and msgpack is None:
+            continue
+        if media_type in (RAW, MSGPACK):
+            dtype = "float32"
+            for param in params:
+                name, _, value = param.partition("=")
+                if name.strip() == "dtype" and value.strip() in _WEIGHT_FORMATS:
+                    dtype = value.strip()
+            return media_type, dtype
+    return JSON, "float32"
+
+
+def content_type(media_type: str, dtype: str) -> str:
+    return f"{media_type}; dtype={dtype}"
+
+
+def _pack_arrays(ids: list[int], weights: list[float], dtype: str) -> tuple:
+    n = len(ids)
+    return (
+        struct.pack(f"<{n}i", *ids),
+        struct.pack(f"<{n}{_WEIGHT_FORMATS[dtype]}", *weights),
+    )
+
+
+def pack(
+    vectors: list[tuple[list[int], list[float]]],
+    media_type: str,
+    dtype: str,
+    stats: list[dict] | None = None,
+) -> bytes:
+    if media_type == RAW:
+        parts = [struct.pack("<I", len(vectors))]
+        for ids, weights in vectors:
+            parts.append(struct.pack("<I", len(ids)))
+            parts.extend(_pack_arrays(ids, weights, dtype))
+        return b"".join(parts)
+
+    if media_type == MSGPACK:
+        packed = []
+        for ids, weights in vectors:
+            id_buffer, weight_buffer = _pack_arrays(ids, weights, dtype)
+            packed.append({"ids": id_buffer, "weights": weight_buffer})
+        return msgpack.packb({"dtype": dtype, "vectors": packed, "stats": stats})
+
+    raise ValueError(f"Unsupported media type: {media_type}")
@@ -1,10 +1,148 @@
+import logging
 import os
+import time
 
-from .encoder import SpladeEncoder
+import torch
+from fastapi import HTTPException
+
+from .backends import prepare_local_model
+from .batcher import MicroBatcher
+from .cache import TTLCache
+from .encoder import Pruning, SpladeEncoder
+
+logger = logging.getLogger(__name__)
 
 MODEL_ID = os.getenv("MODEL_ID", "hotchpotch/japanese-splade-v2")
-encoder = SpladeEncoder(model_id=MODEL_ID)
+# Directory for a local safetensors copy of the model; unset loads from the hub cache
+MODEL_CACHE_DIR = os.getenv("MODEL_CACHE_DIR") or None
+# Token lengths run once at startup so the first requests do not pay for lazy init
+WARMUP_LENGTHS = [
+    int(n) for n in os.getenv("WARMUP_LENGTHS", "16,128,512").split(",") if n
+]
+WARMUP_BATCH_SIZE = int(os.getenv("WARMUP_BATCH_SIZE", "1"))
+# Inference backend: torch (fp32), torch-int8 (dynamic quantization) or onnx
+ENCODER_BACKEND = os.getenv("ENCODER_BACKEND", "torch")
+ONNX_MODEL_PATH = os.getenv("ONNX_MODEL_PATH") or None
+ENCODE_WINDOWED = os.getenv("ENCODE_WINDOWED", "true").lower() == "true"
+# Window length in tokens; unset uses the model's maximum sequence length
+MAX_LENGTH = int(os.getenv("MAX_LENGTH", "0")) or None
+WINDOW_OVERLAP = int(os.getenv("WINDOW_OVERLAP", "128"))
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "32"))
+# Windows per forward pass; unset uses BATCH_MAX_SIZE
+MAX_WINDOWS_PER_PASS = int(os.getenv("MAX_WINDOWS_PER_PASS", "0")) or BATCH_MAX_SIZE
+# Windows one request may need in total; larger requests get 413 (0 disables)
+MAX_WINDOWS_PER_REQUEST = int(os.getenv("MAX_WINDOWS_PER_REQUEST", "256"))
+BATCH_MAX_WAIT_MS = float(os.getenv("BATCH_MAX_WAIT_MS", "5"))
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", "1"))
+MAX_QUEUE_SIZE = int(os.getenv("MAX_QUEUE_SIZE", "256"))
+# PyTorch intra-op thread pool size. torch.set_num_threads is process-global, so
+# this one pool is shared by all inference workers (not a per-worker count);
+# unset keeps the torch default (all cores)
+TORCH_NUM_THREADS = int(os.getenv("TORCH_NUM_THREADS", "0"))
+
+# Term pruning applied to encoder output; 0 disables the limit
+PRUNING = {
+    "document": Pruning(
+        top_k=int(os.getenv("DOC_TOP_K", "0")),
+        min_weight=float(os.getenv("DOC_MIN_WEIGHT", "0")),
+    ),
+    "query": Pruning(
+        top_k=int(os.getenv("QUERY_TOP_K", "0")),
+        min_weight=float(os.getenv("QUERY_MIN_WEIGHT", "0")),
+    ),
+}
+
+# Cache of encoded outputs; ENCODE_CACHE_SIZE=0 disables it
+ENCODE_CACHE_SIZE = int(os.getenv("ENCODE_CACHE_SIZE", "10000"))
+ENCODE_CACHE_TTL_SECONDS = float(os.getenv("ENCODE_CACHE_TTL_SECONDS", "3600"))
+ENCODE_CACHE_KINDS = set(os.getenv("ENCODE_CACHE_KINDS", "document,query").split(","))
+
+
+def _init_inference_thread():
+    if TORCH_NUM_THREADS > 0:
+        torch.set_num_threads(TORCH_NUM_THREADS)
+
+
+_init_inference_thread()
+
+encoder: SpladeEncoder | None = None
+batcher: MicroBatcher | None = None
+cache = TTLCache(max_size=ENCODE_CACHE_SIZE, ttl_seconds=ENCODE_CACHE_TTL_SECONDS)
+# Filled in by load(): load / warm-up durations and any startup error
+startup = {"ready": False, "error": None, "load_seconds": None, "warmup_seconds": None}
+
+
+def load():
+    """Load the model, warm it up and start serving. Blocking; run off the loop."""
+    global encoder, batcher
+
+    try:
+        start = time.perf_counter()
+        model_path = MODEL_ID
+        onnx_path = ONNX_MODEL_PATH
+        if MODEL_CACHE_DIR:
+            model_path = prepare_local_model(MODEL_ID, MODEL_CACHE_DIR)
+            onnx_path = onnx_path or os.path.join(model_path, "model.onnx")
+
+        loaded = SpladeEncoder(
+            model_id=model_path,
+            windowed=ENCODE_WINDOWED,
+            max_length=MAX_LENGTH,
+            window_overlap=WINDOW_OVERLAP,
+            backend=ENCODER_BACKEND,
+            onnx_path=onnx_path,
+            max_windows_per_pass=MAX_WINDOWS_PER_PASS,
+        )
+        startup["load_seconds"] = time.perf_counter() - start
+        logger.info(
+            f"Loaded {MODEL_ID} ({ENCODER_BACKEND}) in {startup['load_seconds']:.2f}s"
+        )
+
+        start = time.perf_counter()
+        loaded.warmup(WARMUP_LENGTHS, batch_size=WARMUP_BATCH_SIZE)
+        startup["warmup_seconds"] = time.perf_counter() - start
+        logger.info(
+            f"Warm-up at lengths {WARMUP_LENGTHS} took {startup['warmup_seconds']:.2f}s"
+        )
+    except Exception as e:
+        startup["error"] = str(e)
+        logger.exception("Failed to load encoder")
+        return
+
+    encoder = loaded
+    batcher = MicroBatcher(
+        encoder.embed_batch,
+        max_batch_size=BATCH_MAX_SIZE,
+        max_wait_ms=BATCH_MAX_WAIT_MS,
+        num_workers=INFERENCE_WORKERS,
+        max_queue_size=MAX_QUEUE_SIZE,
+        worker_init=_init_inference_thread,
+    )
+    startup["ready"] = True
+
+
+async def shutdown():
+    if batcher is not None:
+        await batcher.close()
+
+
+def _not_ready() -> HTTPException:
+    return HTTPException(
+        status_code=503, detail="Model is not loaded yet", headers={"Retry-After": "5"}
+    )
 
 
 def get_encoder() -> SpladeEncoder:
+    if encoder is None:
+        raise _not_ready()
     return encoder
+
+
+def get_batcher() -> MicroBatcher:
+    if batcher is None:
+        raise _not_ready()
+    return batcher
+
+
+def get_cache() -> TTLCache:
+    return cache
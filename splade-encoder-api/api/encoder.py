@@ -1,22 +1,185 @@
+import threading
+from typing import NamedTuple
+
 import torch
-from transformers import AutoModelForMaskedLM, AutoTokenizer
+from transformers import AutoTokenizer
+
+from .backends import load_model
+
+
+class TooManyWindowsError(Exception):
+    """Raised when a request would need more windows than the configured limit."""
+
+
+class Pruning(NamedTuple):
+    """Limits applied when extracting terms from a pooled SPLADE vector."""
+
+    top_k: int = 0  # 0 keeps every non-zero term
+    min_weight: float = 0.0
+
+
+NO_PRUNING = Pruning()
 
 
 class SpladeEncoder:
+    # Fast tokenizers mutate their Rust-side padding / truncation state on every
+    # call and raise "Already borrowed" when used from several threads at once.
+    # Inference workers and the /tokenize threadpool share one tokenizer, so
+    # tokenization is serialized; forward passes still run in parallel.
+    _tokenizer_lock = threading.Lock()
+
     def __init__(
-        self, model_id: str = "hotchpotch/japanese-splade-v2", device: str = None
+        self,
+        model_id: str = "hotchpotch/japanese-splade-v2",
+        device: str = None,
+        windowed: bool = True,
+        max_length: int | None = None,
+        window_overlap: int = 128,
+        backend: str = "torch",
+        onnx_path: str | None = None,
+        max_windows_per_pass: int = 32,
     ):
         if device is None:
-            self.device = "cuda" if torch.cuda.is_available() else "cpu"
+            # Quantized and ONNX backends are CPU-only
+            use_cuda = torch.cuda.is_available() and backend == "torch"
+            self.device = "cuda" if use_cuda else "cpu"
         else:
             self.device = device
 
+        self.backend = backend
         self.tokenizer = AutoTokenizer.from_pretrained(model_id)
-        self.model = AutoModelForMaskedLM.from_pretrained(model_id).to(self.device)
-        self.model.eval()
+        self.model = load_model(model_id, backend, self.device, onnx_path)
+
+        self.windowed = windowed
+        self.max_length = max_length or self._model_max_length()
+        self.window_overlap = window_overlap
+        self.max_windows_per_pass = max_windows_per_pass
 
-    def encode(self, text: str, return_tokens: bool = True):
-        inputs = self.tokenizer(text, return_tensors="pt").to(self.device)
+    def _model_max_length(self) -> int:
+        max_length = getattr(self.model.config, "max_position_embeddings", 512)
+        # Tokenizers without a configured limit report a huge sentinel value
+        tokenizer_max = self.tokenizer.model_max_length
+        if tokenizer_max and tokenizer_max < 100_000:
+            max_length = min(max_length, tokenizer_max)
+        return max_length
+
+    def count_tokens(self, texts: list[str]) -> list[int]:
+        """Number of tokens per text, excluding special tokens."""
+        if not texts:
+            return []
+        with self._tokenizer_lock:
+            input_ids = self.tokenizer(texts, add_special_tokens=False)["input_ids"]
+        return [len(ids) for ids in input_ids]
+
+    def count_windows(self, texts: list[str]) -> int:
+        """Total number of windows ``embed_batch`` would run for these texts."""
+        if not self.windowed:
+            return len(texts)
+        body_length = self.max_length - self.tokenizer.num_special_tokens_to_add()
+        step = max(body_length - self.window_overlap, 1)
+        return sum(
+            1 + max(-(-(length - body_length) // step), 0)
+            for length in self.count_tokens(texts)
+        )
+
+    def encode(self, text: str, return_tokens: bool = True, pruning: Pruning = None):
+        return self.encode_batch([text], return_tokens, pruning)[0]
+
+    def encode_batch(
+        self, texts: list[str], return_tokens: bool = True, pruning: Pruning = None
+    ):
+        """Encode several texts with a single padded forward pass.
+
+        Returns one sparse dict per input text, in the same order.
+        """
+        if not texts:
+            return []
+
+        sparse_vectors = self.embed_batch(texts)
+        return [
+            self.to_sparse_dict(sparse_vector, return_tokens, pruning)
+            for sparse_vector in sparse_vectors
+        ]
+
+    def embed_batch(self, texts: list[str]) -> torch.Tensor:
+        """Run the model and return pooled SPLADE vectors of shape (batch, vocab).
+
+        In windowed mode every text is split into overlapping windows of at most
+        ``max_length`` tokens, the windows are encoded in passes of at most
+        ``max_windows_per_pass``, and the window vectors of each text are
+        merged with max pooling.
+        """
+        if not self.windowed:
+            with self._tokenizer_lock:
+                inputs = self.tokenizer(
+                    texts,
+                    padding=True,
+                    truncation=True,
+                    max_length=self.max_length,
+                    return_tensors="pt",
+                )
+            return self._forward(inputs)
+
+        with self._tokenizer_lock:
+            encoded = self.tokenizer(texts, add_special_tokens=False)["input_ids"]
+        windows = []
+        spans = []
+        for input_ids in encoded:
+            start = len(windows)
+            windows.extend(
+                self.tokenizer.build_inputs_with_special_tokens(window)
+                for window in self._split_windows(input_ids)
+            )
+            spans.append((start, len(windows)))
+
+        # Bound the size of one forward pass however many windows a long text has
+        passes = []
+        for start in range(0, len(windows), self.max_windows_per_pass):
+            with self._tokenizer_lock:
+                inputs = self.tokenizer.pad(
+                    {"input_ids": windows[start : start + self.max_windows_per_pass]},
+                    padding=True,
+                    return_tensors="pt",
+                )
+            passes.append(self._forward(inputs))
+        window_vectors = torch.cat(passes)
+        return torch.stack(
+            [window_vectors[start:end].max(dim=0).values for start, end in spans]
+        )
+
+    def warmup(self, lengths: list[int], batch_size: int = 1):
+        """Run forward passes at the given token lengths.
+
+        The first passes pay for lazy kernel initialization and allocator
+        growth, so doing them at startup keeps that cost off real requests.
+        """
+        filler = self.tokenizer.unk_token_id or 0
+        num_special = self.tokenizer.num_special_tokens_to_add()
+        for length in lengths:
+            body_length = max(min(length, self.max_length) - num_special, 1)
+            window = self.tokenizer.build_inputs_with_special_tokens(
+                [filler] * body_length
+            )
+            inputs = self.tokenizer.pad(
+                {"input_ids": [window] * batch_size}, return_tensors="pt"
+            )
+            self._forward(inputs)
+
+    def _split_windows(self, input_ids: list[int]) -> list[list[int]]:
+        body_length = self.max_length - self.tokenizer.num_special_tokens_to_add()
+        step = max(body_length - self.window_overlap, 1)
+
+        windows = []
+        start = 0
+        while True:
+            windows.append(input_ids[start : start + body_length])
+            if start + body_length >= len(input_ids):
+                break
+            start += step
+        return windows
+
+    def _forward(self, inputs) -> torch.Tensor:
+        inputs = inputs.to(self.device)
 
         with torch.no_grad():
             outputs = self.model(**inputs)
@@ -31,27 +194,68 @@ class SpladeEncoder:
                     -1
                 )
 
-            sparse_vector = torch.max(log_relu_logits, dim=1).values.squeeze()
+            sparse_vectors = torch.max(log_relu_logits, dim=1).values
+
+        return sparse_vectors
+
+    @property
+    def vocab(self) -> list[str]:
+        """Token strings indexed by token id."""
+        if getattr(self, "_vocab", None) is None:
+            self._vocab = self.tokenizer.convert_ids_to_tokens(
+                list(range(len(self.tokenizer)))
+            )
+        return self._vocab
+
+    def prune(
+        self, sparse_vector: torch.Tensor, pruning: Pruning = None
+    ) -> tuple[list[int], list[float], int]:
+        """Select the terms to keep from a pooled vector in one vectorized pass.
+
+        Returns term ids and weights (heaviest first when ``top_k`` applies)
+        plus the number of non-zero terms before pruning.
+        """
+        pruning = pruning or NO_PRUNING
+        nonzero_terms = int(torch.count_nonzero(sparse_vector))
 
-        # Extract non-zero elements and their indices
-        indices = torch.nonzero(sparse_vector).flatten()
+        mask = sparse_vector > 0
+        if pruning.min_weight > 0:
+            mask &= sparse_vector >= pruning.min_weight
+        indices = torch.nonzero(mask).flatten()
         values = sparse_vector[indices]
 
-        # Convert to dictionary
+        if pruning.top_k and len(values) > pruning.top_k:
+            values, order = torch.topk(values, pruning.top_k)
+            indices = indices[order]
+
+        return indices.tolist(), values.tolist(), nonzero_terms
+
+    def extract(
+        self,
+        sparse_vector: torch.Tensor,
+        return_tokens: bool = True,
+        pruning: Pruning = None,
+    ) -> tuple[dict[str, float], dict[str, int]]:
+        """Convert a pooled vector to a sparse dict and report pruning stats."""
+        ids, weights, nonzero_terms = self.prune(sparse_vector, pruning)
+
         if return_tokens:
             # {token: weight}
-            result = {
-                self.tokenizer.convert_ids_to_tokens(int(idx.item())): float(val.item())
-                for idx, val in zip(indices, values, strict=False)
-            }
+            keys = self.tokenizer.convert_ids_to_tokens(ids)
         else:
             # {token_id: weight}
-            result = {
-                str(idx.item()): float(val.item())
-                for idx, val in zip(indices, values, strict=False)
-            }
+            keys = [str(token_id) for token_id in ids]
+
+        stats = {"nonzero_terms": nonzero_terms, "kept_terms": len(ids)}
+        return dict(zip(keys, weights, strict=True)), stats
 
-        return result
+    def to_sparse_dict(
+        self,
+        sparse_vector: torch.Tensor,
+        return_tokens: bool = True,
+        pruning: Pruning = None,
+    ) -> dict[str, float]:
+        return self.extract(sparse_vector, return_tokens, pruning)[0]
 
     def get_tokens_and_weights(self, sparse_dict: dict):
         """Helper to convert token IDs back to tokens.
@@ -1,9 +1,29 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 
-from .routers import encoder_router, health_router
+from . import deps
+from .routers import encoder_router, health_router, metrics_router
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Load in the background so /health answers (live, not ready) meanwhile
+    loading = asyncio.create_task(asyncio.to_thread(deps.load))
+    yield
+    if not loading.done():
+        logger.warning("Shutting down before the model finished loading")
+    await deps.shutdown()
+
 
-app = FastAPI(title="SPLADE Encoder API")
+app = FastAPI(title="SPLADE Encoder API", lifespan=lifespan)
 
 # Include routers
 app.include_router(encoder_router)
 app.include_router(health_router)
+app.include_router(metrics_router)
@@ -0,0 +1,35 @@
+from bisect import bisect_left
+
+
+class Histogram:
+    """Minimal fixed-bucket histogram for exposing tuning metrics as JSON."""
+
+    def __init__(self, buckets: list[float]):
+        self.buckets = sorted(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def snapshot(self) -> dict:
+        # Bucket labels are inclusive upper bounds, "+Inf" collects the rest
+        labels = [f"{b:g}" for b in self.buckets] + ["+Inf"]
+        return {
+            "buckets": dict(zip(labels, self.counts, strict=True)),
+            "count": self.count,
+            "sum": self.sum,
+        }
+
+
+def power_of_two_buckets(upper: int) -> list[float]:
+    buckets = []
+    bound = 1
+    while bound < upper:
+        buckets.append(bound)
+        bound *= 2
+    buckets.append(upper)
+    return buckets
@@ -1,12 +1,42 @@
-from typing import Dict, Optional
+from typing import Dict, List, Literal, Optional
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+
+# "document" and "query" inputs are pruned with separate top_k / min_weight
+EncodeKind = Literal["document", "query"]
 
 
 class EncodeRequest(BaseModel):
     text: str
+    kind: EncodeKind = "document"
+
+
+class PruningStats(BaseModel):
+    nonzero_terms: int
+    kept_terms: int
 
 
 class EncodeResponse(BaseModel):
     sparse_vector: Dict[str, float]
     token_ids: Optional[Dict[str, float]] = None
+    stats: Optional[PruningStats] = None
+
+
+class EncodeBatchRequest(BaseModel):
+    texts: List[str] = Field(..., min_length=1)
+    kind: EncodeKind = "document"
+
+
+class EncodeBatchResponse(BaseModel):
+    sparse_vectors: List[Dict[str, float]]
+    stats: Optional[List[PruningStats]] = None
+
+
+class TokenizeRequest(BaseModel):
+    texts: List[str]
+
+
+class TokenizeResponse(BaseModel):
+    counts: List[int]
+    # Tokens per window, including the special tokens added around each one
+    max_length: int
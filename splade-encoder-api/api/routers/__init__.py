@@ -1,4 +1,5 @@
 from .encoder import router as encoder_router
 from .health import router as health_router
+from .metrics import router as metrics_router
 
-__all__ = ["encoder_router", "health_router"]
+__all__ = ["encoder_router", "health_router", "metrics_router"]
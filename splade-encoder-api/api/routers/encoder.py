@@ -1,30 +1,213 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, Header, HTTPException, Response
+from fastapi.concurrency import run_in_threadpool
 
-from ..deps import get_encoder
-from ..encoder import SpladeEncoder
-from ..models import EncodeRequest, EncodeResponse
+from .. import codec
+from ..batcher import MicroBatcher, QueueFullError
+from ..cache import TTLCache, normalize_text
+from ..deps import (
+    ENCODE_CACHE_KINDS,
+    MAX_WINDOWS_PER_REQUEST,
+    MODEL_ID,
+    PRUNING,
+    get_batcher,
+    get_cache,
+    get_encoder,
+)
+from ..encoder import SpladeEncoder, TooManyWindowsError
+from ..models import (
+    EncodeBatchRequest,
+    EncodeBatchResponse,
+    EncodeRequest,
+    EncodeResponse,
+    TokenizeRequest,
+    TokenizeResponse,
+)
 
 router = APIRouter()
 
 
+def _overloaded(e: QueueFullError) -> HTTPException:
+    return HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+
+
+def _too_large(e: TooManyWindowsError) -> HTTPException:
+    return HTTPException(status_code=413, detail=str(e))
+
+
+async def _check_windows(texts: list[str], encoder: SpladeEncoder):
+    # Rejected before queueing, so one huge body cannot fail a shared batch
+    if MAX_WINDOWS_PER_REQUEST <= 0 or not encoder.windowed:
+        return
+    windows = await run_in_threadpool(encoder.count_windows, texts)
+    if windows > MAX_WINDOWS_PER_REQUEST:
+        raise TooManyWindowsError(
+            f"Request needs {windows} windows (limit {MAX_WINDOWS_PER_REQUEST})"
+        )
+
+
+async def _encode_views(
+    texts: list[str],
+    kind: str,
+    views: tuple[bool, ...],
+    encoder: SpladeEncoder,
+    batcher: MicroBatcher,
+    cache: TTLCache,
+) -> list[dict[bool, tuple[dict, dict]]]:
+    """Return ``extract`` results per text for each requested output view.
+
+    ``views`` holds ``return_tokens`` values. Cached results are reused and all
+    missing texts share one submission to the batcher, so several views of
+    the same text never cost more than one forward pass.
+    """
+    use_cache = kind in ENCODE_CACHE_KINDS
+    # Encode the normalized text too, so a cached entry never depends on
+    # which of several equivalent inputs happened to be encoded first
+    texts = [normalize_text(text) for text in texts]
+    keys = [{view: (MODEL_ID, kind, view, text) for view in views} for text in texts]
+
+    results = [{} for _ in texts]
+    missing = []
+    for i, text_keys in enumerate(keys):
+        if use_cache:
+            for view, key in text_keys.items():
+                cached = cache.get(key)
+                if cached is not None:
+                    results[i][view] = cached
+        if len(results[i]) < len(views):
+            missing.append(i)
+
+    if missing:
+        await _check_windows([texts[i] for i in missing], encoder)
+        vectors = await batcher.submit_many([texts[i] for i in missing])
+        pruning = PRUNING[kind]
+        for i, vector in zip(missing, vectors, strict=True):
+            for view in views:
+                if view in results[i]:
+                    continue
+                results[i][view] = encoder.extract(
+                    vector, return_tokens=view, pruning=pruning
+                )
+                if use_cache:
+                    cache.set(keys[i][view], results[i][view])
+
+    return results
+
+
+def _binary_response(
+    results: list[tuple[dict, dict]], media_type: str, dtype: str
+) -> Response:
+    # Binary formats always carry token ids; clients map them with /vocab
+    vectors = [
+        ([int(token_id) for token_id in sparse_vector], list(sparse_vector.values()))
+        for sparse_vector, _ in results
+    ]
+    stats = [stats for _, stats in results]
+    return Response(
+        content=codec.pack(vectors, media_type, dtype, stats),
+        media_type=codec.content_type(media_type, dtype),
+    )
+
+
 @router.post("/encode", response_model=EncodeResponse)
 async def encode(
-    request: EncodeRequest, encoder: SpladeEncoder = Depends(get_encoder)  # noqa: B008
+    request: EncodeRequest,
+    accept: str | None = Header(default=None),  # noqa: B008
+    encoder: SpladeEncoder = Depends(get_encoder),  # noqa: B008
+    batcher: MicroBatcher = Depends(get_batcher),  # noqa: B008
+    cache: TTLCache = Depends(get_cache),  # noqa: B008
 ):
     try:
-        sparse_vector = encoder.encode(request.text)
-        return EncodeResponse(sparse_vector=sparse_vector)
+        media_type, dtype = codec.negotiate(accept)
+        return_tokens = media_type == codec.JSON
+        (result,) = await _encode_views(
+            [request.text], request.kind, (return_tokens,), encoder, batcher, cache
+        )
+        if not return_tokens:
+            return _binary_response([result[False]], media_type, dtype)
+
+        sparse_vector, stats = result[True]
+        return EncodeResponse(sparse_vector=sparse_vector, stats=stats)
+    except QueueFullError as e:
+        raise _overloaded(e) from e
+    except TooManyWindowsError as e:
+        raise _too_large(e) from e
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e)) from e
+
+
+@router.post("/encode_batch", response_model=EncodeBatchResponse)
+async def encode_batch(
+    request: EncodeBatchRequest,
+    accept: str | None = Header(default=None),  # noqa: B008
+    encoder: SpladeEncoder = Depends(get_encoder),  # noqa: B008
+    batcher: MicroBatcher = Depends(get_batcher),  # noqa: B008
+    cache: TTLCache = Depends(get_cache),  # noqa: B008
+):
+    try:
+        media_type, dtype = codec.negotiate(accept)
+        return_tokens = media_type == codec.JSON
+        # Texts go through the scheduler so large requests are split into
+        # max_batch_size chunks and can share batches with concurrent callers
+        results = await _encode_views(
+            request.texts, request.kind, (return_tokens,), encoder, batcher, cache
+        )
+        if not return_tokens:
+            return _binary_response(
+                [result[False] for result in results], media_type, dtype
+            )
+
+        return EncodeBatchResponse(
+            sparse_vectors=[result[True][0] for result in results],
+            stats=[result[True][1] for result in results],
+        )
+    except QueueFullError as e:
+        raise _overloaded(e) from e
+    except TooManyWindowsError as e:
+        raise _too_large(e) from e
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e)) from e
 
 
 @router.post("/encode_debug", response_model=EncodeResponse)
 async def encode_debug(
-    request: EncodeRequest, encoder: SpladeEncoder = Depends(get_encoder)  # noqa: B008
+    request: EncodeRequest,
+    encoder: SpladeEncoder = Depends(get_encoder),  # noqa: B008
+    batcher: MicroBatcher = Depends(get_batcher),  # noqa: B008
+    cache: TTLCache = Depends(get_cache),  # noqa: B008
 ):
     try:
-        sparse_vector_tokens = encoder.encode(request.text, return_tokens=True)
-        token_ids = encoder.encode(request.text, return_tokens=False)
-        return EncodeResponse(sparse_vector=sparse_vector_tokens, token_ids=token_ids)
+        # Token and token-id views come from a single forward pass
+        (result,) = await _encode_views(
+            [request.text], request.kind, (True, False), encoder, batcher, cache
+        )
+        sparse_vector_tokens, stats = result[True]
+        token_ids, _ = result[False]
+        return EncodeResponse(
+            sparse_vector=sparse_vector_tokens, token_ids=token_ids, stats=stats
+        )
+    except QueueFullError as e:
+        raise _overloaded(e) from e
+    except TooManyWindowsError as e:
+        raise _too_large(e) from e
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e)) from e
+
+
+@router.post("/tokenize", response_model=TokenizeResponse)
+def tokenize(
+    request: TokenizeRequest,
+    encoder: SpladeEncoder = Depends(get_encoder),  # noqa: B008
+):
+    """Token counts with the encoder's tokenizer, for token-budgeted chunking.
+
+    A plain ``def`` so FastAPI runs the tokenizer in its threadpool.
+    """
+    return TokenizeResponse(
+        counts=encoder.count_tokens(request.texts), max_length=encoder.max_length
+    )
+
+
+@router.get("/vocab")
+async def vocab(encoder: SpladeEncoder = Depends(get_encoder)):  # noqa: B008
+    """Token strings indexed by id, for decoding binary responses."""
+    return {"model": MODEL_ID, "tokens": encoder.vocab}
@@ -1,10 +1,31 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Response
 
-from ..deps import MODEL_ID
+from .. import deps
 
 router = APIRouter()
 
 
 @router.get("/health")
 async def health():
-    return {"status": "ok", "model": MODEL_ID}
+    """Liveness: the process is up, with model readiness reported alongside."""
+    return {
+        "status": "ok",
+        "model": deps.MODEL_ID,
+        "backend": deps.ENCODER_BACKEND,
+        # Settings that change the produced vectors, so clients can key caches on them
+        "encoding": {
+            "windowed": deps.ENCODE_WINDOWED,
+            "max_length": deps.MAX_LENGTH,
+            "window_overlap": deps.WINDOW_OVERLAP,
+            "pruning": {kind: p._asdict() for kind, p in deps.PRUNING.items()},
+        },
+        **deps.startup,
+    }
+
+
+@router.get("/ready")
+async def ready(response: Response):
+    """Readiness: 200 only once the model is loaded and warmed up."""
+    if not deps.startup["ready"]:
+        response.status_code = 503
+    return {"ready": deps.startup["ready"], "error": deps.startup["error"]}
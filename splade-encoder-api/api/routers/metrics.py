@@ -0,0 +1,15 @@
+from fastapi import APIRouter, Depends
+
+from ..batcher import MicroBatcher
+from ..cache import TTLCache
+from ..deps import get_batcher, get_cache
+
+router = APIRouter()
+
+
+@router.get("/metrics")
+async def metrics(
+    batcher: MicroBatcher = Depends(get_batcher),  # noqa: B008
+    cache: TTLCache = Depends(get_cache),  # noqa: B008
+):
+    return {"batcher": batcher.stats(), "cache": cache.stats()}
@@ -0,0 +1,92 @@
+"""Compare SPLADE inference backends on a fixed corpus.
+
+Checks that every backend produces sparse vectors within a tolerance of the
+PyTorch fp32 reference, then reports throughput and per-request latency.
+
+    uv run python -m scripts.benchmark_backends --backends torch torch-int8 onnx
+"""
+
+import argparse
+import statistics
+import time
+
+from api.backends import BACKENDS, check_parity
+from api.encoder import SpladeEncoder
+
+CORPUS = [
+    "Scrapboxは知識を共有するためのツールです。",
+    "ページ同士をリンクでつなぐことで、自然に知識のネットワークができあがります。",
+    "SPLADEはBERTの語彙空間でスパースな重みを学習する検索モデルです。",
+    "Elasticsearchのrank_featuresフィールドにトークンごとの重みを格納します。",
+    "バッチ処理でScrapboxの全ページを取得し、チャンクに分割してベクトル化します。",
+    "ユーザーの質問はクエリとしてベクトル化され、スパース検索に使われます。",
+    "検索結果をコンテキストとしてローカルLLMに渡し、回答を生成します。",
+    "CPUのみのノードでは量子化やONNX Runtimeで推論を高速化できます。",
+]
+
+
+def percentile(values: list[float], q: float) -> float:
+    values = sorted(values)
+    index = min(len(values) - 1, round(q / 100 * (len(values) - 1)))
+    return values[index]
+
+
+def benchmark(encoder: SpladeEncoder, texts: list[str], batch_size: int) -> dict:
+    latencies = []
+    start = time.perf_counter()
+    for i in range(0, len(texts), batch_size):
+        t0 = time.perf_counter()
+        encoder.encode_batch(texts[i : i + batch_size])
+        latencies.append((time.perf_counter() - t0) * 1000)
+    elapsed = time.perf_counter() - start
+
+    return {
+        "texts_per_sec": len(texts) / elapsed,
+        "p50_ms": statistics.median(latencies),
+        "p99_ms": percentile(latencies, 99),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--model-id", default="hotchpotch/japanese-splade-v2")
+    parser.add_argument(
+        "--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS)
+    )
+    parser.add_argument("--corpus", help="Text file with one document per line")
+    parser.add_argument("--repeat", type=int, default=8)
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument("--atol", type=float, default=0.05)
+    args = parser.parse_args()
+
+    if args.corpus:
+        with open(args.corpus, encoding="utf-8") as f:
+            corpus = [line.strip() for line in f if line.strip()]
+    else:
+        corpus = CORPUS
+    texts = corpus * args.repeat
+
+    reference = SpladeEncoder(args.model_id, device="cpu").encode_batch(corpus)
+
+    print(f"{len(texts)} texts, batch size {args.batch_size}")
+    print(
+        f"{'backend':<12}{'texts/s':>10}{'p50 ms':>10}{'p99 ms':>10}"
+        f"{'max diff':>10}{'overlap':>9}  parity"
+    )
+    for backend in args.backends:
+        encoder = SpladeEncoder(args.model_id, device="cpu", backend=backend)
+        # Warm up once so lazy initialization is not measured
+        encoder.encode_batch(corpus[: args.batch_size])
+
+        parity = check_parity(reference, encoder.encode_batch(corpus), args.atol)
+        result = benchmark(encoder, texts, args.batch_size)
+        print(
+            f"{backend:<12}{result['texts_per_sec']:>10.1f}"
+            f"{result['p50_ms']:>10.1f}{result['p99_ms']:>10.1f}"
+            f"{parity['max_abs_diff']:>10.4f}{parity['mean_term_overlap']:>9.3f}"
+            f"  {'ok' if parity['within_tolerance'] else 'FAIL'}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+from unittest.mock import MagicMock
+
+import pytest
+import torch
+
+from api.encoder import SpladeEncoder
+
+
+class FakeTokenizer:
+    """Whitespace tokenizer: token "tN" has id N, CLS=1 and SEP=2."""
+
+    def __call__(self, texts, add_special_tokens=True):
+        return {"input_ids": [[int(t[1:]) for t in text.split()] for text in texts]}
+
+    def num_special_tokens_to_add(self, pair=False):
+        return 2
+
+    def build_inputs_with_special_tokens(self, ids):
+        return [1] + ids + [2]
+
+    def pad(self, encoded, padding=True, return_tensors="pt"):
+        windows = encoded["input_ids"]
+        width = max(len(w) for w in windows)
+
+        class MockBatch(dict):
+            def to(self, device):
+                return self
+
+        return MockBatch(
+            input_ids=torch.tensor([w + [0] * (width - len(w)) for w in windows]),
+            attention_mask=torch.tensor(
+                [[1] * len(w) + [0] * (width - len(w)) for w in windows]
+            ),
+        )
+
+    def convert_ids_to_tokens(self, ids):
+        return [f"t{idx}" for idx in ids]
+
+
+def make_windowed_encoder(max_length, window_overlap, vocab_size=32):
+    encoder = SpladeEncoder.__new__(SpladeEncoder)
+    encoder.device = "cpu"
+    encoder.windowed = True
+    encoder.max_length = max_length
+    encoder.window_overlap = window_overlap
+    encoder.max_windows_per_pass = 32
+    encoder.tokenizer = FakeTokenizer()
+
+    def model(input_ids, attention_mask):
+        # One-hot logits: each position only activates its own token id
+        output = MagicMock()
+        output.logits = torch.nn.functional.one_hot(input_ids, vocab_size).float()
+        return output
+
+    encoder.model = MagicMock(side_effect=model)
+    return encoder
+
+
+@pytest.fixture
+def windowed_encoder():
+    """Factory for windowed encoders over FakeTokenizer and a one-hot model."""
+    return make_windowed_encoder
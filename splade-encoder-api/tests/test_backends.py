@@ -0,0 +1,75 @@
+import pytest
+import torch
+from transformers import BertConfig, BertForMaskedLM
+
+from api.backends import check_parity, load_model
+
+
+def test_check_parity_identical():
+    vectors = [{"a": 1.0, "b": 0.5}, {}]
+    result = check_parity(vectors, vectors)
+    assert result["max_abs_diff"] == 0.0
+    assert result["mean_term_overlap"] == 1.0
+    assert result["within_tolerance"]
+
+
+def test_check_parity_counts_missing_terms():
+    reference = [{"a": 1.0, "b": 0.5}]
+    candidate = [{"a": 0.98, "c": 0.02}]
+    result = check_parity(reference, candidate, atol=0.1)
+    # "b" is missing from the candidate entirely
+    assert result["max_abs_diff"] == pytest.approx(0.5)
+    assert result["mean_term_overlap"] == pytest.approx(1 / 3)
+    assert not result["within_tolerance"]
+
+
+def test_load_model_unknown_backend():
+    with pytest.raises(ValueError, match="Unknown backend"):
+        load_model("dummy", backend="tensorrt")
+
+
+def test_quantized_backend_is_cpu_only():
+    with pytest.raises(ValueError, match="cpu"):
+        load_model("dummy", backend="torch-int8", device="cuda")
+
+
+@pytest.fixture(scope="module")
+def tiny_model_dir(tmp_path_factory):
+    path = tmp_path_factory.mktemp("tiny-bert")
+    torch.manual_seed(0)
+    config = BertConfig(
+        vocab_size=32,
+        hidden_size=16,
+        num_hidden_layers=1,
+        num_attention_heads=2,
+        intermediate_size=32,
+        max_position_embeddings=16,
+    )
+    BertForMaskedLM(config).save_pretrained(path)
+    return str(path)
+
+
+def _sparse_outputs(model, input_ids):
+    inputs = {"input_ids": input_ids, "attention_mask": torch.ones_like(input_ids)}
+    with torch.no_grad():
+        logits = model(**inputs).logits
+    vectors = torch.log(1 + torch.relu(logits)).max(dim=1).values
+    return [
+        {str(i): float(v) for i, v in enumerate(vector.tolist()) if v > 0}
+        for vector in vectors
+    ]
+
+
+@pytest.mark.parametrize("backend", ["torch-int8", "onnx"])
+def test_backend_parity_with_fp32(tiny_model_dir, tmp_path, backend):
+    if backend == "onnx":
+        pytest.importorskip("onnxruntime")
+
+    input_ids = torch.tensor([[2, 5, 6, 7, 3], [2, 8, 9, 3, 0]])
+    reference = _sparse_outputs(load_model(tiny_model_dir, "torch"), input_ids)
+    candidate = _sparse_outputs(
+        load_model(tiny_model_dir, backend, onnx_path=str(tmp_path / "model.onnx")),
+        input_ids,
+    )
+
+    assert check_parity(reference, candidate, atol=0.05)["within_tolerance"]
@@ -0,0 +1,138 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from api.batcher import MicroBatcher, QueueFullError
+
+
+def test_concurrent_submits_are_coalesced():
+    calls = []
+
+    def batch_fn(items):
+        calls.append(list(items))
+        return [item.upper() for item in items]
+
+    async def run():
+        batcher = MicroBatcher(batch_fn, max_batch_size=8, max_wait_ms=50)
+        results = await asyncio.gather(*[batcher.submit(t) for t in "abc"])
+        await batcher.close()
+        return results
+
+    assert asyncio.run(run()) == ["A", "B", "C"]
+    assert calls == [["a", "b", "c"]]
+
+
+def test_max_batch_size_splits_batches():
+    calls = []
+
+    def batch_fn(items):
+        calls.append(len(items))
+        return items
+
+    async def run():
+        batcher = MicroBatcher(batch_fn, max_batch_size=2, max_wait_ms=50)
+        results = await asyncio.gather(*[batcher.submit(i) for i in range(5)])
+        stats = batcher.stats()
+        await batcher.close()
+        return results, stats
+
+    results, stats = asyncio.run(run())
+    assert results == [0, 1, 2, 3, 4]
+    assert calls == [2, 2, 1]
+    assert stats["batch_size_histogram"]["count"] == 3
+    assert stats["batch_size_histogram"]["buckets"] == {"1": 1, "2": 2, "+Inf": 0}
+    assert stats["queue_depth"] == 0
+
+
+def test_batch_error_is_propagated_to_all_callers():
+    def batch_fn(items):
+        raise RuntimeError("model failed")
+
+    async def run():
+        batcher = MicroBatcher(batch_fn, max_batch_size=4, max_wait_ms=10)
+        results = await asyncio.gather(
+            batcher.submit("a"), batcher.submit("b"), return_exceptions=True
+        )
+        await batcher.close()
+        return results
+
+    results = asyncio.run(run())
+    assert len(results) == 2
+    for result in results:
+        assert isinstance(result, RuntimeError)
+
+
+def test_batcher_keeps_running_after_error():
+    def batch_fn(items):
+        if "bad" in items:
+            raise ValueError("bad input")
+        return items
+
+    async def run():
+        batcher = MicroBatcher(batch_fn, max_batch_size=4, max_wait_ms=1)
+        with pytest.raises(ValueError):
+            await batcher.submit("bad")
+        result = await batcher.submit("good")
+        await batcher.close()
+        return result
+
+    assert asyncio.run(run()) == "good"
+
+
+def test_full_queue_rejects_fast():
+    release = threading.Event()
+
+    def batch_fn(items):
+        release.wait(timeout=5)
+        return items
+
+    async def run():
+        batcher = MicroBatcher(
+            batch_fn, max_batch_size=1, max_wait_ms=0, max_queue_size=2
+        )
+        # First item occupies the only worker, the next two fill the queue
+        pending = [asyncio.create_task(batcher.submit(0))]
+        await asyncio.sleep(0.05)
+        pending += [asyncio.create_task(batcher.submit(i)) for i in (1, 2)]
+        await asyncio.sleep(0.05)
+        with pytest.raises(QueueFullError):
+            await batcher.submit(99)
+        with pytest.raises(QueueFullError):
+            await batcher.submit_many([100, 101])
+
+        release.set()
+        results = await asyncio.gather(*pending)
+        stats = batcher.stats()
+        await batcher.close()
+        return results, stats
+
+    results, stats = asyncio.run(run())
+    assert results == [0, 1, 2]
+    assert stats["rejected"] == 2
+
+
+def test_workers_run_batches_concurrently():
+    active = 0
+    peak = 0
+    lock = threading.Lock()
+
+    def batch_fn(items):
+        nonlocal active, peak
+        with lock:
+            active += 1
+            peak = max(peak, active)
+        time.sleep(0.05)
+        with lock:
+            active -= 1
+        return items
+
+    async def run():
+        batcher = MicroBatcher(batch_fn, max_batch_size=1, max_wait_ms=0, num_workers=3)
+        results = await asyncio.gather(*[batcher.submit(i) for i in range(3)])
+        await batcher.close()
+        return results
+
+    assert asyncio.run(run()) == [0, 1, 2]
+    assert peak == 3
@@ -0,0 +1,47 @@
+from unittest.mock import patch
+
+from api.cache import TTLCache, normalize_text
+
+
+def test_normalize_text():
+    assert normalize_text("  Scrapbox　とは？\n") == "Scrapbox とは?"
+    assert normalize_text("ＡＢＣ  def") == normalize_text("ABC def")
+
+
+def test_lru_eviction_and_counters():
+    cache = TTLCache(max_size=2, ttl_seconds=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1  # "b" becomes least recently used
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+    stats = cache.stats()
+    assert stats["size"] == 2
+    assert stats["hits"] == 3
+    assert stats["misses"] == 1
+    assert stats["evictions"] == 1
+    assert stats["hit_rate"] == 0.75
+
+
+def test_entries_expire_after_ttl():
+    cache = TTLCache(max_size=10, ttl_seconds=5)
+    with patch("api.cache.time.monotonic", return_value=100.0):
+        cache.set("a", 1)
+    with patch("api.cache.time.monotonic", return_value=104.0):
+        assert cache.get("a") == 1
+    with patch("api.cache.time.monotonic", return_value=105.0):
+        assert cache.get("a") is None
+
+    assert len(cache) == 0
+    assert cache.stats()["expirations"] == 1
+
+
+def test_zero_size_disables_cache():
+    cache = TTLCache(max_size=0)
+    cache.set("a", 1)
+    assert cache.get("a") is None
+    assert len(cache) == 0
@@ -0,0 +1,42 @@
+import struct
+
+import pytest
+
+from api import codec
+
+
+def test_negotiate_defaults_to_json():
+    assert codec.negotiate(None) == (codec.JSON, "float32")
+    assert codec.negotiate("application/json") == (codec.JSON, "float32")
+    assert codec.negotiate("text/html, */*") == (codec.JSON, "float32")
+
+
+def test_negotiate_raw_with_dtype():
+    accept = "application/x-splade-sparse; dtype=float16, application/json"
+    assert codec.negotiate(accept) == (codec.RAW, "float16")
+    assert codec.negotiate(codec.RAW) == (codec.RAW, "float32")
+    # Unknown dtypes fall back to float32
+    assert codec.negotiate(f"{codec.RAW}; dtype=int8") == (codec.RAW, "float32")
+
+
+def test_pack_raw_layout():
+    vectors = [([5, 1024], [1.5, 0.25]), ([], [])]
+    data = codec.pack(vectors, codec.RAW, "float16")
+
+    assert struct.unpack_from("<I", data, 0) == (2,)
+    assert struct.unpack_from("<I", data, 4) == (2,)
+    assert struct.unpack_from("<2i", data, 8) == (5, 1024)
+    assert struct.unpack_from("<2e", data, 16) == (1.5, 0.25)
+    assert struct.unpack_from("<I", data, 20) == (0,)
+    assert len(data) == 24
+
+
+def test_pack_msgpack():
+    msgpack = pytest.importorskip("msgpack")
+    data = codec.pack([([7], [0.5])], codec.MSGPACK, "float32", [{"kept_terms": 1}])
+
+    payload = msgpack.unpackb(data)
+    assert payload["dtype"] == "float32"
+    assert struct.unpack("<i", payload["vectors"][0]["ids"]) == (7,)
+    assert struct.unpack("<f", payload["vectors"][0]["weights"]) == (0.5,)
+    assert payload["stats"] == [{"kept_terms": 1}]
@@ -1,17 +1,23 @@
+import math
+import threading
+import time
 from unittest.mock import MagicMock
 
+import pytest
 import torch
 
-from api.encoder import SpladeEncoder
+from api.encoder import Pruning, SpladeEncoder
 
 
 def test_encoder_logic():
     # Mock the tokenizer and model to avoid downloading/running them
     encoder = SpladeEncoder.__new__(SpladeEncoder)
     encoder.device = "cpu"
+    encoder.windowed = False
+    encoder.max_length = 512
 
-    def mock_convert(idx):
-        return f"token_{idx}"
+    def mock_convert(ids):
+        return [f"token_{idx}" for idx in ids]
 
     encoder.tokenizer = MagicMock()
     encoder.tokenizer.convert_ids_to_tokens = mock_convert
@@ -58,5 +64,184 @@ def test_encoder_logic():
     print("Test passed!")
 
 
+def test_encode_batch_masks_padding():
+    encoder = SpladeEncoder.__new__(SpladeEncoder)
+    encoder.device = "cpu"
+    encoder.windowed = False
+    encoder.max_length = 512
+
+    encoder.tokenizer = MagicMock()
+    encoder.tokenizer.convert_ids_to_tokens = lambda ids: [f"token_{i}" for i in ids]
+    encoder.model = MagicMock()
+
+    class MockBatch(dict):
+        def to(self, device):
+            return self
+
+    # Second text is shorter: its last position is padding
+    encoder.tokenizer.return_value = MockBatch(
+        {
+            "input_ids": torch.tensor([[1, 2], [3, 0]]),
+            "attention_mask": torch.tensor([[1, 1], [1, 0]]),
+        }
+    )
+
+    mock_output = MagicMock()
+    # Logits: [batch=2, seq=2, vocab=3]
+    mock_output.logits = torch.tensor(
+        [
+            [[1.0, 0.0, 0.0], [0.0, 2.0, 0.0]],
+            [[0.0, 0.0, 1.0], [5.0, 5.0, 0.0]],
+        ]
+    )
+    encoder.model.return_value = mock_output
+
+    results = encoder.encode_batch(["first text", "second"])
+
+    # One forward pass for the whole batch
+    encoder.model.assert_called_once()
+    assert len(results) == 2
+    assert set(results[0]) == {"token_0", "token_1"}
+    assert results[0]["token_1"] == pytest.approx(math.log(3.0))
+    # Padding logits must not leak into the second vector
+    assert results[1] == {"token_2": pytest.approx(math.log(2.0))}
+
+
+def test_encode_batch_empty():
+    encoder = SpladeEncoder.__new__(SpladeEncoder)
+    encoder.model = MagicMock()
+
+    assert encoder.encode_batch([]) == []
+    encoder.model.assert_not_called()
+
+
+def test_windowed_encoding_covers_long_input(windowed_encoder):
+    encoder = windowed_encoder(max_length=6, window_overlap=1)
+    # 10 body tokens, 4 per window with a 1 token overlap -> 3 windows
+    long_text = " ".join(f"t{i}" for i in range(10, 20))
+
+    results = encoder.encode_batch([long_text, "t5"])
+
+    encoder.model.assert_called_once()
+    input_ids = encoder.model.call_args.kwargs["input_ids"]
+    assert input_ids.shape == (4, 6)
+    assert input_ids[0].tolist() == [1, 10, 11, 12, 13, 2]
+    assert input_ids[1].tolist() == [1, 13, 14, 15, 16, 2]
+    assert input_ids[2].tolist() == [1, 16, 17, 18, 19, 2]
+
+    # Window vectors are max-pooled back into one vector per text
+    expected = {f"t{i}" for i in range(10, 20)} | {"t1", "t2"}
+    assert set(results[0]) == expected
+    assert set(results[1]) == {"t1", "t2", "t5"}
+    assert results[0]["t15"] == pytest.approx(math.log(2.0))
+
+
+def test_windowed_encoding_splits_forward_passes(windowed_encoder):
+    encoder = windowed_encoder(max_length=6, window_overlap=1)
+    encoder.max_windows_per_pass = 2
+    long_text = " ".join(f"t{i}" for i in range(10, 20))
+
+    assert encoder.count_windows([long_text, "t5", ""]) == 5
+    results = encoder.encode_batch([long_text, "t5"])
+
+    # 4 windows in passes of at most 2, pooled as if run together
+    shapes = [call.kwargs["input_ids"].shape for call in encoder.model.call_args_list]
+    assert shapes == [(2, 6), (2, 6)]
+    assert set(results[0]) == {f"t{i}" for i in range(10, 20)} | {"t1", "t2"}
+    assert set(results[1]) == {"t1", "t2", "t5"}
+
+
+def test_windowed_encoding_short_and_empty_input(windowed_encoder):
+    encoder = windowed_encoder(max_length=8, window_overlap=2)
+
+    results = encoder.encode_batch(["t3 t4", ""])
+
+    input_ids = encoder.model.call_args.kwargs["input_ids"]
+    assert input_ids.shape == (2, 4)
+    assert set(results[0]) == {"t1", "t2", "t3", "t4"}
+    assert set(results[1]) == {"t1", "t2"}
+
+
+def make_extracting_encoder():
+    encoder = SpladeEncoder.__new__(SpladeEncoder)
+    encoder.tokenizer = MagicMock()
+    encoder.tokenizer.convert_ids_to_tokens = lambda ids: [f"token_{i}" for i in ids]
+    return encoder
+
+
+def test_extract_without_pruning():
+    encoder = make_extracting_encoder()
+    vector = torch.tensor([0.0, 0.5, 0.0, 2.0, 0.1])
+
+    sparse_vector, stats = encoder.extract(vector)
+
+    assert sparse_vector == {
+        "token_1": pytest.approx(0.5),
+        "token_3": pytest.approx(2.0),
+        "token_4": pytest.approx(0.1),
+    }
+    assert stats == {"nonzero_terms": 3, "kept_terms": 3}
+
+    ids_view = encoder.to_sparse_dict(vector, return_tokens=False)
+    assert set(ids_view) == {"1", "3", "4"}
+
+
+def test_extract_top_k_and_min_weight():
+    encoder = make_extracting_encoder()
+    vector = torch.tensor([0.0, 0.5, 0.3, 2.0, 0.1, 1.0])
+
+    top2, stats = encoder.extract(vector, pruning=Pruning(top_k=2))
+    assert list(top2) == ["token_3", "token_5"]
+    assert stats == {"nonzero_terms": 5, "kept_terms": 2}
+
+    heavy, stats = encoder.extract(vector, pruning=Pruning(min_weight=0.4))
+    assert set(heavy) == {"token_1", "token_3", "token_5"}
+    assert stats["kept_terms"] == 3
+
+    both, _ = encoder.extract(vector, pruning=Pruning(top_k=2, min_weight=0.6))
+    assert list(both) == ["token_3", "token_5"]
+
+
+def test_warmup_runs_requested_lengths(windowed_encoder):
+    encoder = windowed_encoder(max_length=8, window_overlap=2)
+    encoder.tokenizer.unk_token_id = 3
+
+    encoder.warmup([4, 100], batch_size=2)
+
+    shapes = [call.kwargs["input_ids"].shape for call in encoder.model.call_args_list]
+    # Lengths are capped at max_length
+    assert shapes == [(2, 4), (2, 8)]
+
+
+def test_tokenizer_calls_are_serialized(windowed_encoder):
+    encoder = windowed_encoder(max_length=8, window_overlap=2)
+    active, peak = 0, 0
+    counter_lock = threading.Lock()
+
+    class SlowTokenizer(type(encoder.tokenizer)):
+        def __call__(self, texts, add_special_tokens=True):
+            nonlocal active, peak
+            with counter_lock:
+                active += 1
+                peak = max(peak, active)
+            time.sleep(0.01)
+            with counter_lock:
+                active -= 1
+            return super().__call__(texts, add_special_tokens)
+
+    encoder.tokenizer = SlowTokenizer()
+    threads = [
+        threading.Thread(target=encoder.count_tokens, args=(["t3 t4"],))
+        for _ in range(4)
+    ] + [threading.Thread(target=encoder.embed_batch, args=(["t5"],)) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # Inference workers and /tokenize never use the tokenizer at the same time
+    assert peak == 1
+
+
 if __name__ == "__main__":
     test_encoder_logic()
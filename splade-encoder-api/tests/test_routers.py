@@ -0,0 +1,161 @@
+import asyncio
+import struct
+from unittest.mock import MagicMock
+
+import pytest
+from fastapi import HTTPException, Response
+
+from api import codec, deps
+from api.batcher import MicroBatcher
+from api.cache import TTLCache
+from api.models import EncodeBatchRequest, EncodeRequest, TokenizeRequest
+from api.routers import encoder as routes
+from api.routers import health
+
+
+@pytest.fixture
+def service(windowed_encoder):
+    encoder = windowed_encoder(max_length=8, window_overlap=2)
+    forward = MagicMock(side_effect=encoder.embed_batch)
+    batcher = MicroBatcher(forward, max_batch_size=8, max_wait_ms=1)
+    cache = TTLCache(max_size=100)
+    return {"encoder": encoder, "batcher": batcher, "cache": cache}, forward
+
+
+def test_encode_uses_cache(service):
+    deps_, forward = service
+    request = EncodeRequest(text="t3 t4")
+
+    first = asyncio.run(routes.encode(request, accept=None, **deps_))
+    # Normalized text hits the cached entry
+    second = asyncio.run(routes.encode(EncodeRequest(text=" t3  t4 "), None, **deps_))
+
+    assert set(first.sparse_vector) == {"t1", "t2", "t3", "t4"}
+    assert first.stats.kept_terms == 4
+    assert second.sparse_vector == first.sparse_vector
+    assert forward.call_count == 1
+    assert deps_["cache"].stats()["hits"] == 1
+
+
+def test_encode_sends_normalized_text_to_the_model(service):
+    deps_, forward = service
+
+    # Inputs that share a normalized form get what encoding that form returns,
+    # whichever of them reaches the model first
+    first = asyncio.run(
+        routes.encode(EncodeRequest(text=" t3\u3000 t4\n"), None, **deps_)
+    )
+    second = asyncio.run(routes.encode(EncodeRequest(text="t3 t4"), None, **deps_))
+
+    forward.assert_called_once_with(["t3 t4"])
+    assert second.sparse_vector == first.sparse_vector
+    assert deps_["cache"].stats()["hits"] == 1
+
+
+def test_encode_debug_single_forward_pass(service):
+    deps_, forward = service
+
+    response = asyncio.run(routes.encode_debug(EncodeRequest(text="t5"), **deps_))
+
+    assert set(response.sparse_vector) == {"t1", "t2", "t5"}
+    assert set(response.token_ids) == {"1", "2", "5"}
+    forward.assert_called_once()
+
+
+def test_encode_batch_binary(service):
+    deps_, forward = service
+    accept = f"{codec.RAW}; dtype=float32"
+
+    response = asyncio.run(
+        routes.encode_batch(EncodeBatchRequest(texts=["t3", "t4 t6"]), accept, **deps_)
+    )
+
+    assert isinstance(response, Response)
+    assert response.media_type == f"{codec.RAW}; dtype=float32"
+    data = response.body
+    assert struct.unpack_from("<II", data, 0) == (2, 3)
+    assert sorted(struct.unpack_from("<3i", data, 8)) == [1, 2, 3]
+
+
+def test_encode_rejects_too_many_windows(service, monkeypatch):
+    deps_, forward = service
+    monkeypatch.setattr(routes, "MAX_WINDOWS_PER_REQUEST", 2)
+    # 6 body tokens per window, 4 new per step -> 11 tokens need 3 windows
+    long_text = " ".join(f"t{i}" for i in range(10, 21))
+
+    with pytest.raises(HTTPException) as excinfo:
+        asyncio.run(routes.encode(EncodeRequest(text=long_text), None, **deps_))
+
+    assert excinfo.value.status_code == 413
+    forward.assert_not_called()
+
+
+def test_dependencies_unavailable_until_loaded(monkeypatch):
+    monkeypatch.setattr(deps, "encoder", None)
+    monkeypatch.setattr(deps, "startup", {**deps.startup, "ready": False})
+
+    with pytest.raises(HTTPException) as excinfo:
+        deps.get_encoder()
+    assert excinfo.value.status_code == 503
+
+    response = Response()
+    body = asyncio.run(health.ready(response))
+    assert response.status_code == 503
+    assert body["ready"] is False
+
+    # Liveness still answers and reports the settings that shape the vectors
+    body = asyncio.run(health.health())
+    assert body["status"] == "ok"
+    assert set(body["encoding"]["pruning"]) == {"document", "query"}
+    assert set(body["encoding"]["pruning"]["document"]) == {"top_k", "min_weight"}
+
+
+def test_load_warms_up_and_reports_timings(monkeypatch):
+    fake = MagicMock()
+    monkeypatch.setattr(deps, "SpladeEncoder", MagicMock(return_value=fake))
+    monkeypatch.setattr(deps, "encoder", None)
+    monkeypatch.setattr(deps, "batcher", None)
+    monkeypatch.setattr(deps, "startup", dict.fromkeys(deps.startup))
+
+    deps.load()
+
+    fake.warmup.assert_called_once_with(
+        deps.WARMUP_LENGTHS, batch_size=deps.WARMUP_BATCH_SIZE
+    )
+    assert deps.get_encoder() is fake
+    assert deps.startup["ready"] is True
+    assert deps.startup["load_seconds"] >= 0
+    assert deps.startup["warmup_seconds"] >= 0
+    asyncio.run(deps.shutdown())
+
+
+def test_load_failure_is_reported(monkeypatch):
+    failing = MagicMock(side_effect=OSError("model not found"))
+    monkeypatch.setattr(deps, "SpladeEncoder", failing)
+    monkeypatch.setattr(deps, "encoder", None)
+    monkeypatch.setattr(deps, "startup", dict.fromkeys(deps.startup))
+
+    deps.load()
+
+    assert "model not found" in deps.startup["error"]
+    with pytest.raises(HTTPException) as excinfo:
+        deps.get_encoder()
+    assert excinfo.value.status_code == 503
+
+    response = Response()
+    body = asyncio.run(health.ready(response))
+    assert response.status_code == 503
+    assert body["ready"] is not True
+    assert "model not found" in body["error"]
+
+
+def test_tokenize_counts_tokens_without_special_tokens(service):
+    deps_, forward = service
+
+    response = routes.tokenize(
+        TokenizeRequest(texts=["t3 t4 t5", "", "t6"]), encoder=deps_["encoder"]
+    )
+
+    assert response.counts == [3, 0, 1]
+    assert response.max_length == 8
+    forward.assert_not_called()
@@ -55,27 +55,45 @@ export default function App() {
     setIsLoading(true);
 
     try {
-      const response = await fetch('/api/chat', {
+      const response = await fetch('/api/chat/stream', {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify({ query }),
       });
 
-      if (!response.ok) {
+      if (!response.ok || !response.body) {
         throw new Error(`HTTP error! status: ${response.status}`);
       }
 
-      const data = await response.json();
-      const assistantMessage: Message = {
-        role: 'assistant',
-        content: data.answer,
-        sources: data.sources,
-      };
-      setMessages((prev) => [...prev, assistantMessage]);
+      // 検索結果が届いた時点で回答の枠を作り、トークンを届いた順に追記する
+      const updateAnswer = (update: (message: Message) => Message) =>
+        setMessages((prev) => [...prev.slice(0, -1), update(prev[prev.length - 1])]);
+
+      const reader = response.body.pipeThrough(new TextDecoderStream()).getReader();
+      let buffer = '';
+      for (;;) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += value;
+        const blocks = buffer.split('\n\n');
+        buffer = blocks.pop() ?? '';
+        for (const block of blocks) {
+          const event = block.match(/^event: (.*)$/m)?.[1];
+          const data = JSON.parse(block.match(/^data: (.*)$/m)?.[1] ?? 'null');
+          if (event === 'sources') {
+            setMessages((prev) => [...prev, { role: 'assistant', content: '', sources: data }]);
+          } else if (event === 'token') {
+            updateAnswer((message) => ({ ...message, content: message.content + data.content }));
+          } else if (event === 'error') {
+            throw new Error(data.detail);
+          }
+        }
+      }
     } catch (error) {
       console.error('Error:', error);
       setMessages((prev) => [
-        ...prev,
+        // トークンが届く前に失敗した場合は、空の回答の枠を残さない
+        ...prev.filter((message, i) => i < prev.length - 1 || message.role === 'user' || message.content),
         { role: 'assistant', content: 'エラーが発生しました。バックエンドサーバーの起動状況を確認してください。' },
       ]);
     } finally {
@@ -157,7 +175,11 @@ export default function App() {
                     {message.role === 'user' ? 'You' : 'Assistant'}
                   </div>
                   <div className={`chat-bubble text-base leading-relaxed py-4 px-6 shadow-sm max-w-[90%] md:max-w-[80%] ${message.role === 'user' ? 'chat-bubble-primary' : 'bg-base-200 text-base-content border border-base-300'}`}>
-                    <div className="whitespace-pre-wrap">{message.content}</div>
+                    {message.content ? (
+                      <div className="whitespace-pre-wrap">{message.content}</div>
+                    ) : (
+                      <span className="loading loading-dots loading-md text-primary"></span>
+                    )}
                   </div>
                   {message.sources && message.sources.length > 0 && (
                     <div className="chat-footer mt-4 w-full">
@@ -167,7 +189,7 @@ export default function App() {
                 </div>
               ))}
 
-              {isLoading && (
+              {isLoading && messages[messages.length - 1]?.role === 'user' && (
                 <div className="chat chat-start">
                   <div className="chat-image avatar">
                     <div className="w-10 h-10 rounded-2xl bg-neutral text-neutral-content flex items-center justify-center shadow-md">